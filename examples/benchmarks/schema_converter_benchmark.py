@@ -0,0 +1,54 @@
+import os
+import time
+import tempfile
+import numpy as np
+from lsst.sims.featureScheduler.utils import schema_converter, empty_observation
+
+
+def fake_observations(n_obs):
+    """An observation array with plausible values in every column
+    """
+    observations = empty_observation(n=n_obs)
+    for key in observations.dtype.names:
+        if observations.dtype[key].kind == 'f':
+            observations[key] = np.random.rand(n_obs)
+    observations['ID'] = np.arange(n_obs)
+    observations['night'] = np.arange(n_obs) // 800
+    observations['mjd'] = 59853. + np.arange(n_obs) * 35./3600./24.
+    observations['filter'] = np.random.choice(list('ugrizy'), size=n_obs)
+    observations['note'] = 'blob, gr, a'
+    return observations
+
+
+def run_benchmark(n_obs, tmpdir):
+    """Return rows/s for writing, reading everything, and a chunked 3 column read
+    """
+    observations = fake_observations(n_obs)
+    filename = os.path.join(tmpdir, 'bench_%i.db' % n_obs)
+    converter = schema_converter()
+
+    t0 = time.time()
+    converter.obs2opsim(observations, filename=filename, delete_past=True)
+    write_time = time.time() - t0
+
+    t0 = time.time()
+    converter.opsim2obs(filename)
+    read_time = time.time() - t0
+
+    t0 = time.time()
+    for chunk in converter.opsim2obs_chunks(filename, columns=['mjd', 'RA', 'dec']):
+        pass
+    chunk_time = time.time() - t0
+
+    os.remove(filename)
+    return n_obs/write_time, n_obs/read_time, n_obs/chunk_time
+
+
+if __name__ == "__main__":
+    np.random.seed(42)
+    tmpdir = tempfile.mkdtemp()
+    print('n_visits   write (rows/s)   read all (rows/s)   read 3 cols (rows/s)')
+    for n_obs in [1000000, 3000000]:
+        write_rate, read_rate, chunk_rate = run_benchmark(n_obs, tmpdir)
+        print('%8i   %14.0f   %17.0f   %20.0f' % (n_obs, write_rate, read_rate, chunk_rate))
+    os.rmdir(tmpdir)
@@ -0,0 +1,65 @@
+import copy
+import time
+import tracemalloc
+import numpy as np
+import healpy as hp
+import lsst.sims.featureScheduler.basis_functions as bf
+from lsst.sims.featureScheduler.surveys import ToO_master, ToO_survey
+from lsst.sims.featureScheduler.utils import TargetoO
+
+
+def example_too_survey(nside):
+    """Make a ToO survey similar to what one would run for an alert follow-up
+    """
+    footprint = np.zeros(hp.nside2npix(nside), dtype=float)
+    bfs = []
+    bfs.append(bf.Footprint_nvis_basis_function(filtername='r', nside=nside, footprint=footprint, nvis=3))
+    bfs.append(bf.M5_diff_basis_function(filtername='r', nside=nside))
+    bfs.append(bf.Slewtime_basis_function(filtername='r', nside=nside))
+    bfs.append(bf.Zenith_shadow_mask_basis_function(nside=nside, shadow_minutes=60., max_alt=76.))
+    bfs.append(bf.Moon_avoidance_basis_function(nside=nside, moon_distance=30.))
+    weights = [3., 1., 3., 0., 0.]
+    return ToO_survey(bfs, weights, nside=nside, smoothing_kernel=None)
+
+
+def random_too(tooid, nside, radius=5.):
+    """A ToO covering a random disc on the sky
+    """
+    footprint = np.zeros(hp.nside2npix(nside), dtype=float)
+    vec = hp.ang2vec(np.arccos(2.*np.random.rand()-1.), np.random.rand()*2.*np.pi)
+    footprint[hp.query_disc(nside, vec, np.radians(radius))] = 1
+    return TargetoO(tooid, footprint, 59853., 2.)
+
+
+def run_spawn(master, n_toos, nside, use_deepcopy=False):
+    """Spawn n_toos surveys, return the wall time (seconds) and peak new memory (MB)
+    """
+    toos = [random_too(i, nside) for i in range(n_toos)]
+    tracemalloc.start()
+    t0 = time.time()
+    surveys = []
+    for too in toos:
+        if use_deepcopy:
+            new_survey = copy.deepcopy(master.example_ToO_survey)
+            new_survey.set_id(too.id)
+            new_survey.set_target_map(too.footprint)
+        else:
+            new_survey = master._spawn_new_survey(too)
+        surveys.append(new_survey)
+    elapsed = time.time() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak/1024.**2
+
+
+if __name__ == "__main__":
+    nside = 32
+    np.random.seed(42)
+    master = ToO_master(example_too_survey(nside))
+
+    print('n_ToO   shared (s)   shared (MB)   deepcopy (s)   deepcopy (MB)')
+    for n_toos in [1, 10, 50]:
+        shared_time, shared_mem = run_spawn(master, n_toos, nside)
+        deep_time, deep_mem = run_spawn(master, n_toos, nside, use_deepcopy=True)
+        print('%5i   %10.3f   %11.1f   %12.3f   %13.1f' % (n_toos, shared_time, shared_mem,
+                                                           deep_time, deep_mem))
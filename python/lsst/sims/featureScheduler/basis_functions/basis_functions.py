@@ -1,7 +1,7 @@
 import numpy as np
 from lsst.sims.featureScheduler import features
 from lsst.sims.featureScheduler import utils
-from lsst.sims.featureScheduler.utils import int_rounded
+from lsst.sims.featureScheduler.utils import int_rounded, int_round, int_between
 import healpy as hp
 from lsst.sims.skybrightness_pre import M5percentiles
 import matplotlib.pylab as plt
@@ -37,11 +37,20 @@ class Base_basis_function(object):
         self.update_on_newobs = True
         # Set if basis function needs to be recalculated if conditions change
         self.update_on_mjd = True
+        # Set if basis function is a mask (values of np.nan and a constant). Masks get evaluated first
+        # so the rest of the basis functions only need to be computed on the unmasked pixels.
+        self.is_mask = False
         # Dict to hold all the features we want to track
         self.survey_features = {}
         # Keep track of the last time the basis function was called. If mjd doesn't change, use cached value
         self.mjd_last = None
+        # The conditions version and healpix indices the cached value was computed for
+        self.version_last = None
+        self.indx_last = None
         self.value = 0
+        # The cached feasibility, and the conditions version it was computed for
+        self.feasible = None
+        self.feasibility_version = None
         # list the attributes to compare to check if basis functions are equal.
         self.attrs_to_compare = []
         # Do we need to recalculate the basis function
@@ -67,6 +76,7 @@ class Base_basis_function(object):
             self.survey_features[feature].add_observation(observation, indx=indx)
         if self.update_on_newobs:
             self.recalc = True
+        self.feasibility_version = None
 
     def check_feasibility(self, conditions):
         """If there is logic to decide if something is feasible (e.g., only if moon is down),
@@ -74,6 +84,15 @@ class Base_basis_function(object):
         """
         return True
 
+    def is_feasible(self, conditions):
+        """Cached version of check_feasibility. Only recomputed if the conditions have
+        changed or a new observation has been added.
+        """
+        if self.feasibility_version != conditions.version:
+            self.feasible = self.check_feasibility(conditions)
+            self.feasibility_version = conditions.version
+        return self.feasible
+
     def _calc_value(self, conditions, **kwargs):
         self.value = 0
         # Update the last time we had an mjd
@@ -81,6 +100,17 @@ class Base_basis_function(object):
         self.recalc = False
         return self.value
 
+    def calc_future_value(self, conditions):
+        """Compute the basis function at all the times in conditions.future_mjd at once.
+
+        Basis functions that can be vectorized in time should override this.
+
+        Returns
+        -------
+        np.array of shape (n_times, npix), or None if the basis function can not look ahead.
+        """
+        return None
+
     def __eq__(self):
         # XXX--to work on if we need to make a registry of basis functions.
         pass
@@ -98,15 +128,29 @@ class Base_basis_function(object):
         Return a reward healpix map or a reward scalar.
         """
         # If we are not feasible, return -inf
-        if not self.check_feasibility(conditions):
+        if not self.is_feasible(conditions):
             return -np.inf
-        if self.recalc:
+        # Compute at most once per conditions version, unless there has been a new observation.
+        # Functions that only fill in the pixels in indx also need recomputing if indx changes.
+        indx = kwargs.get('indx')
+        if self.recalc | (self.update_on_mjd & (conditions.version != self.version_last)) | \
+                (not self._same_indx(indx)):
             self.value = self._calc_value(conditions, **kwargs)
-        if self.update_on_mjd:
-            if conditions.mjd != self.mjd_last:
-                self.value = self._calc_value(conditions, **kwargs)
+            self.mjd_last = conditions.mjd
+            self.version_last = conditions.version
+            self.indx_last = indx
+            self.recalc = False
         return self.value
 
+    def _same_indx(self, indx):
+        """Check if indx matches the indices the cached value was computed with
+        """
+        if indx is self.indx_last:
+            return True
+        if indx is None or self.indx_last is None:
+            return False
+        return np.array_equal(indx, self.indx_last)
+
 
 class Constant_basis_function(Base_basis_function):
     """Just add a constant
@@ -259,6 +303,7 @@ class N_obs_high_am_basis_function(Base_basis_function):
                 self.survey_features[feature].add_observation(observation, indx=indx)
             if self.update_on_newobs:
                 self.recalc = True
+            self.feasibility_version = None
 
     def check_feasibility(self, conditions):
         """If there is logic to decide if something is feasible (e.g., only if moon is down),
@@ -282,6 +327,7 @@ class N_obs_high_am_basis_function(Base_basis_function):
 
         # Update the last time we had an mjd
         self.mjd_last = conditions.mjd + 0
+        self.version_last = conditions.version
         self.recalc = False
         self.value = result
 
@@ -431,7 +477,7 @@ class Season_coverage_basis_function(Base_basis_function):
 
     def _calc_value(self, conditions, indx=None):
         result = self.result.copy()
-        season = utils.season_calc(conditions.night, offset=self.offset, floor=False)
+        season = utils.season_map(conditions.night, offset=self.offset, floor=False)
         # Find the area that still needs observation
         feature = self.survey_features['n_obs_season'].feature
         not_enough = np.where((self.footprint > 0) & (feature < self.n_per_season) &
@@ -628,10 +674,15 @@ class M5_diff_basis_function(Base_basis_function):
         # Need to look up the deepest m5 values for all the healpixels
         m5p = M5percentiles()
         self.dark_map = m5p.dark_map(filtername=filtername, nside_out=self.nside)
+        self.result = np.zeros(hp.nside2npix(self.nside), dtype=float)
 
     def _calc_value(self, conditions, indx=None):
         # No way to get the sign on this right the first time.
-        result = conditions.M5Depth[self.filtername] - self.dark_map
+        if indx is None:
+            result = conditions.M5Depth[self.filtername] - self.dark_map
+        else:
+            result = self.result.copy()
+            result[indx] = conditions.M5Depth[self.filtername][indx] - self.dark_map[indx]
         return result
 
 
@@ -888,7 +939,10 @@ class Slewtime_basis_function(Base_basis_function):
             # Need to make sure smaller slewtime is larger reward.
             if np.size(conditions.slewtime) > 1:
                 result = self.result.copy()
-                good = ~np.isnan(conditions.slewtime)
+                if indx is None:
+                    good = np.where(~np.isnan(conditions.slewtime))[0]
+                else:
+                    good = indx[~np.isnan(conditions.slewtime[indx])]
                 result[good] = -conditions.slewtime[good]/self.maxtime
             else:
                 result = -conditions.slewtime/self.maxtime
@@ -952,20 +1006,27 @@ class Skybrightness_limit_basis_function(Base_basis_function):
     def __init__(self, nside=None, filtername='r', sbmin=20., sbmax=30.):
         super(Skybrightness_limit_basis_function, self).__init__(nside=nside, filtername=filtername)
 
-        self.min = int_rounded(sbmin)
-        self.max = int_rounded(sbmax)
+        self.is_mask = True
+        self.min = int_round(sbmin)
+        self.max = int_round(sbmax)
         self.result = np.empty(hp.nside2npix(self.nside), dtype=float)
         self.result.fill(np.nan)
 
     def _calc_value(self, conditions, indx=None):
         result = self.result.copy()
 
-        good = np.where(np.bitwise_and(int_rounded(conditions.skybrightness[self.filtername]) > self.min,
-                                       int_rounded(conditions.skybrightness[self.filtername]) < self.max))
+        good = int_between(conditions.skybrightness[self.filtername], self.min, self.max)
         result[good] = 1.0
 
         return result
 
+    def calc_future_value(self, conditions):
+        sky = conditions.future_skybrightness[self.filtername]
+        result = np.empty(sky.shape, dtype=float)
+        result.fill(np.nan)
+        result[int_between(sky, self.min, self.max)] = 1.0
+        return result
+
 
 class CableWrap_unwrap_basis_function(Base_basis_function):
     """
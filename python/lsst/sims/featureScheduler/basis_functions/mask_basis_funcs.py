@@ -1,9 +1,10 @@
+from collections import OrderedDict
 import numpy as np
 import healpy as hp
-from lsst.sims.utils import _hpid2RaDec, Site, _angularSeparation, _xyz_from_ra_dec
+from lsst.sims.utils import _hpid2RaDec, _raDec2Hpid, Site, _xyz_from_ra_dec
 import matplotlib.pylab as plt
 from lsst.sims.featureScheduler.basis_functions import Base_basis_function
-from lsst.sims.featureScheduler.utils import hp_in_lsst_fov, int_rounded
+from lsst.sims.featureScheduler.utils import hp_in_lsst_fov, int_rounded, int_round, int_between
 
 
 __all__ = ['Zenith_mask_basis_function', 'Zenith_shadow_mask_basis_function',
@@ -18,6 +19,7 @@ class Area_check_mask_basis_function(Base_basis_function):
     """
     def __init__(self, bf_list, nside=32, min_area=1000.):
         super(Area_check_mask_basis_function, self).__init__(nside=nside)
+        self.is_mask = True
         self.bf_list = bf_list
         self.result = np.zeros(hp.nside2npix(self.nside), dtype=float)
         self.min_area = min_area
@@ -25,7 +27,7 @@ class Area_check_mask_basis_function(Base_basis_function):
     def check_feasibility(self, conditions):
         result = True
         for bf in self.bf_list:
-            if not bf.check_feasibility(conditions):
+            if not bf.is_feasible(conditions):
                 return False
 
         area_map = self.result.copy()
@@ -58,6 +60,7 @@ class Solar_elongation_mask_basis_function(Base_basis_function):
 
     def __init__(self, min_elong=0., max_elong=60., nside=None, penalty=np.nan):
         super(Solar_elongation_mask_basis_function, self).__init__(nside=nside)
+        self.is_mask = True
         self.min_elong = np.radians(min_elong)
         self.max_elong = np.radians(max_elong)
         self.penalty = penalty
@@ -84,6 +87,7 @@ class Zenith_mask_basis_function(Base_basis_function):
     """
     def __init__(self, min_alt=20., max_alt=82., nside=None):
         super(Zenith_mask_basis_function, self).__init__(nside=nside)
+        self.is_mask = True
         self.update_on_newobs = False
         self.min_alt = np.radians(min_alt)
         self.max_alt = np.radians(max_alt)
@@ -108,25 +112,125 @@ class Planet_mask_basis_function(Base_basis_function):
     planets : list of str (None)
         A list of planet names to mask. Defaults to ['venus', 'mars', 'jupiter']. Not including
         Saturn because it moves really slow and has average apparent mag of ~0.4, so fainter than Vega.
-
+    position_nside : int (512)
+        Planet positions are snapped to the center of the healpixel at this resolution. The mask
+        only gets recomputed when a planet moves to a new pixel.
     """
-    def __init__(self, mask_radius=3.5, planets=None, nside=None, scale=1e5):
+    def __init__(self, mask_radius=3.5, planets=None, nside=None, scale=1e5, position_nside=512):
         super(Planet_mask_basis_function, self).__init__(nside=nside)
+        self.is_mask = True
+        self.update_on_newobs = False
         if planets is None:
             planets = ['venus', 'mars', 'jupiter']
         self.planets = planets
         self.mask_radius = np.radians(mask_radius)
-        self.result = np.zeros(hp.nside2npix(nside))
-        # set up a kdtree. Could maybe use healpy.query_disc instead.
-        self.in_fov = hp_in_lsst_fov(nside=nside, fov_radius=mask_radius, scale=scale)
+        self.result = np.zeros(hp.nside2npix(self.nside))
+        # Uses the shared kdtree for this nside
+        self.in_fov = hp_in_lsst_fov(nside=self.nside, fov_radius=mask_radius, scale=scale)
+        self.position_nside = position_nside
+        self.planet_hpids = None
+        self.mask = None
 
     def _calc_value(self, conditions, indx=None):
-        result = self.result.copy()
-        for pn in self.planets:
-            indices = self.in_fov(conditions.planet_positions[pn+'_RA'], conditions.planet_positions[pn+'_dec'])
-            result[indices] = np.nan
+        planet_hpids = tuple([int(np.max(_raDec2Hpid(self.position_nside,
+                                                      conditions.planet_positions[pn+'_RA'],
+                                                      conditions.planet_positions[pn+'_dec'])))
+                              for pn in self.planets])
+        if planet_hpids != self.planet_hpids:
+            result = self.result.copy()
+            # Use the pixel centers so the mask only depends on which pixel the planet is in
+            ra, dec = _hpid2RaDec(self.position_nside, np.array(planet_hpids, dtype=int))
+            for planet_ra, planet_dec in zip(ra, dec):
+                indices = self.in_fov(planet_ra, planet_dec)
+                result[indices] = np.nan
+            self.mask = result
+            self.planet_hpids = planet_hpids
+
+        return self.mask
+
+
+class Zenith_shadow_table(object):
+    """Zenith shadow masks tabulated on a grid of LMST values.
+
+    For a fixed site and healpix grid, the hour angle of every pixel only depends on the
+    LMST, so the shadow part of the mask can be looked up rather than recomputed for
+    every MJD. The altitude cut is not tabulated, it always comes from the conditions.
+    Rows are made the first time their LMST bin is used and stored as packed bitsets of
+    npix/8 bytes (1.5 kB at nside=32, 24 kB at nside=128). At most max_bytes of rows are
+    kept per table, dropping the least recently used, so a full table (2880 bins at the
+    default half minute) is 4.4 MB at nside=32 while nside=128 is capped at 16 MB rather
+    than 70 MB. Only the max_tables most recently used configurations are kept.
 
-        return result
+    Parameters
+    ----------
+    nside : int
+        The healpix nside
+    max_alt : float
+        Maximum altitude to allow (degrees)
+    shadow_minutes : float
+        Mask anything that will pass through the max alt in the next shadow_minutes time. (minutes)
+    site : str
+        Site name passed to lsst.sims.utils.Site
+    lmst_step : float
+        Width of the LMST bins (minutes)
+    """
+    # Tables already built, shared by every basis function with the same configuration
+    tables = OrderedDict()
+    max_tables = 4
+    # Memory limit for the rows of each table (bytes)
+    max_bytes = 2**24
+
+    def __init__(self, nside, max_alt, shadow_minutes, site, lmst_step):
+        self.nside = nside
+        self.npix = hp.nside2npix(nside)
+        self.step = lmst_step/60.
+        self.nbins = int(np.round(24./self.step))
+        self.step = 24./self.nbins
+
+        ra, dec = _hpid2RaDec(nside, np.arange(self.npix))
+        self.ra = ra
+        lat = Site(name=site).latitude_rad
+
+        # Same limits as Zenith_shadow_mask_basis_function
+        shadow_minutes = np.radians(shadow_minutes/60. * 360./24.)
+        zenith_radius = np.radians(90.-max_alt)/2.
+        self.in_decband = (int_round(dec) < int_round(lat+zenith_radius)) & \
+                          (int_round(dec) > int_round(lat-zenith_radius))
+        self.ha_limit_rounded = int_round(2.*np.pi-shadow_minutes-zenith_radius)
+
+        self.max_rows = max(1, self.max_bytes // ((self.npix + 7) // 8))
+        self.rows = OrderedDict()
+
+    @classmethod
+    def get(cls, nside, max_alt, shadow_minutes, site, lmst_step):
+        """Return the shared table for a configuration, making it if needed.
+        """
+        key = (nside, max_alt, shadow_minutes, site, lmst_step)
+        if key in cls.tables:
+            cls.tables.move_to_end(key)
+        else:
+            cls.tables[key] = cls(nside, max_alt, shadow_minutes, site, lmst_step)
+            while len(cls.tables) > cls.max_tables:
+                cls.tables.popitem(last=False)
+        return cls.tables[key]
+
+    def _make_row(self, indx):
+        lmst_rad = np.radians(indx*self.step*360./24.)
+        ha = lmst_rad - self.ra
+        ha[np.where(ha < 0)] += 2.*np.pi
+        return np.packbits((int_round(ha) > self.ha_limit_rounded) & self.in_decband)
+
+    def lookup(self, lmst):
+        """Return the shadowed boolean mask for an LMST (hours).
+        """
+        indx = int(np.round(lmst/self.step)) % self.nbins
+        if indx in self.rows:
+            self.rows.move_to_end(indx)
+        else:
+            self.rows[indx] = self._make_row(indx)
+            while len(self.rows) > self.max_rows:
+                self.rows.popitem(last=False)
+        return np.unpackbits(self.rows[indx])[:self.npix].astype(bool)
 
 
 class Zenith_shadow_mask_basis_function(Base_basis_function):
@@ -141,10 +245,16 @@ class Zenith_shadow_mask_basis_function(Base_basis_function):
         The maximum altitude to alow. Everything higher is masked. (degrees)
     shadow_minutes : float (40.)
         Mask anything that will pass through the max alt in the next shadow_minutes time. (minutes)
+    lmst_step : float (None)
+        If set, the shadow mask is looked up from a table binned in LMST with this spacing
+        (minutes), see Zenith_shadow_table. A half minute of LMST moves the sky by 0.125
+        degrees, so pixels near the edge of the shadow can differ from the exact mask. The
+        default of None computes the mask from the conditions HA every time.
     """
     def __init__(self, nside=None, min_alt=20., max_alt=82.,
-                 shadow_minutes=40., penalty=np.nan, site='LSST'):
+                 shadow_minutes=40., penalty=np.nan, site='LSST', lmst_step=None):
         super(Zenith_shadow_mask_basis_function, self).__init__(nside=nside)
+        self.is_mask = True
         self.update_on_newobs = False
 
         self.penalty = penalty
@@ -156,11 +266,24 @@ class Zenith_shadow_mask_basis_function(Base_basis_function):
         # Compute the declination band where things could drift into zenith
         self.decband = np.zeros(self.dec.size, dtype=float)
         self.zenith_radius = np.radians(90.-max_alt)/2.
+        site_name = site
         site = Site(name=site)
         self.lat_rad = site.latitude_rad
         self.lon_rad = site.longitude_rad
         self.decband[np.where((int_rounded(self.dec) < int_rounded(self.lat_rad+self.zenith_radius)) &
                               (int_rounded(self.dec) > int_rounded(self.lat_rad-self.zenith_radius)))] = 1
+        self.in_decband = self.decband == 1
+
+        # Fixed-point versions of the limits, so they only get rounded once
+        self.min_alt_rounded = int_round(self.min_alt)
+        self.max_alt_rounded = int_round(self.max_alt)
+        self.ha_limit_rounded = int_round(2.*np.pi-self.shadow_minutes-self.zenith_radius)
+
+        if lmst_step is None:
+            self.shadow_table = None
+        else:
+            self.shadow_table = Zenith_shadow_table.get(self.nside, max_alt, shadow_minutes,
+                                                        site_name, lmst_step)
 
         self.result = np.empty(hp.nside2npix(self.nside), dtype=float)
         self.result.fill(self.penalty)
@@ -168,11 +291,24 @@ class Zenith_shadow_mask_basis_function(Base_basis_function):
     def _calc_value(self, conditions, indx=None):
 
         result = self.result.copy()
-        alt_limit = np.where((int_rounded(conditions.alt) > int_rounded(self.min_alt)) &
-                             (int_rounded(conditions.alt) < int_rounded(self.max_alt)))[0]
+        alt_limit = int_between(conditions.alt, self.min_alt_rounded, self.max_alt_rounded)
+        if self.shadow_table is not None:
+            to_mask = self.shadow_table.lookup(conditions.lmst)
+        else:
+            to_mask = (int_round(conditions.HA) > self.ha_limit_rounded) & self.in_decband
         result[alt_limit] = 1
-        to_mask = np.where((int_rounded(conditions.HA) > int_rounded(2.*np.pi-self.shadow_minutes-self.zenith_radius)) &
-                           (self.decband == 1))
+        result[to_mask] = np.nan
+        return result
+
+    def calc_future_value(self, conditions):
+        result = np.empty(conditions.future_alt.shape, dtype=float)
+        result.fill(self.penalty)
+        result[int_between(conditions.future_alt, self.min_alt_rounded, self.max_alt_rounded)] = 1
+        if self.shadow_table is not None:
+            for i, lmst in enumerate(conditions.future_lmst):
+                result[i, self.shadow_table.lookup(lmst)] = np.nan
+            return result
+        to_mask = (int_round(conditions.future_HA) > self.ha_limit_rounded) & self.in_decband
         result[to_mask] = np.nan
         return result
 
@@ -189,19 +325,19 @@ class Moon_avoidance_basis_function(Base_basis_function):
     """
     def __init__(self, nside=None, moon_distance=30.):
         super(Moon_avoidance_basis_function, self).__init__(nside=nside)
+        self.is_mask = True
         self.update_on_newobs = False
 
-        self.moon_distance = int_rounded(np.radians(moon_distance))
+        self.moon_distance = int_round(np.radians(moon_distance))
         self.result = np.ones(hp.nside2npix(self.nside), dtype=float)
 
     def _calc_value(self, conditions, indx=None):
         result = self.result.copy()
 
-        angular_distance = _angularSeparation(conditions.az, conditions.alt,
-                                              conditions.moonAz,
-                                              conditions.moonAlt)
+        # Same separation as in alt,az, but from the precomputed RA,Dec trig tables
+        angular_distance = conditions.moon_distance
 
-        result[int_rounded(angular_distance) < self.moon_distance] = np.nan
+        result[int_round(angular_distance) < self.moon_distance] = np.nan
 
         return result
 
@@ -223,6 +359,7 @@ class Bulk_cloud_basis_function(Base_basis_function):
     def __init__(self, nside=None, max_cloud_map=None, max_val=0.7,
                  out_of_bounds_val=np.nan):
         super(Bulk_cloud_basis_function, self).__init__(nside=nside)
+        self.is_mask = True
         self.update_on_newobs = False
 
         if max_cloud_map is None:
@@ -271,6 +408,7 @@ class Map_cloud_basis_function(Base_basis_function):
     def __init__(self, nside=None, max_cloud_map=None, max_val=0.7,
                  out_of_bounds_val=np.nan):
         super(Bulk_cloud_basis_function, self).__init__(nside=nside)
+        self.is_mask = True
         self.update_on_newobs = False
 
         if max_cloud_map is None:
@@ -306,6 +444,7 @@ class Mask_azimuth_basis_function(Base_basis_function):
     """
     def __init__(self, nside=None, out_of_bounds_val=np.nan, az_min=0., az_max=180.):
         super(Mask_azimuth_basis_function, self).__init__(nside=nside)
+        self.is_mask = True
         self.az_min = int_rounded(np.radians(az_min))
         self.az_max = int_rounded(np.radians(az_max))
         self.out_of_bounds_val = out_of_bounds_val
@@ -286,9 +286,9 @@ class Target_map_modulo_basis_function(Base_basis_function):
             indx = self.all_indx
 
         # Compute what season it is at each pixel
-        seasons = utils.season_calc(conditions.night, offset=self.day_offset,
-                                    modulo=self.season_modulo, max_season=self.max_season,
-                                    season_length=self.season_length)
+        seasons = utils.season_map(conditions.night, offset=self.day_offset,
+                                   modulo=self.season_modulo, max_season=self.max_season,
+                                   season_length=self.season_length)
 
         composite_target = self.result.copy()[indx]
         composite_nobs = self.result.copy()[indx]
@@ -1,7 +1,6 @@
 from lsst.sims.utils import _raDec2Hpid, _approx_RaDec2AltAz, _angularSeparation, _approx_altaz2pa
 import numpy as np
-from lsst.sims.featureScheduler.utils import int_rounded
-import copy
+from lsst.sims.featureScheduler.utils import int_rounded, observation_block
 
 __all__ = ["Base_detailer", "Zero_rot_detailer", "Comcam_90rot_detailer", "Close_alt_detailer",
            "Take_as_pairs_detailer", "Twilight_triple_detailer", "Spider_rot_detailer", "Flush_for_sched_detailer"]
@@ -40,16 +39,18 @@ class Base_detailer(object):
         """
         Parameters
         ----------
-        observation_list : list of observations
-            The observations to detail.
+        observation_list : np.array
+            The observations to detail, a structured array like the one from
+            lsst.sims.featureScheduler.utils.empty_observation. A list of single
+            row arrays also works.
         conditions : lsst.sims.featureScheduler.conditions object
 
         Returns
         -------
-        List of observations.
+        np.array of observations.
         """
 
-        return observation_list
+        return observation_block(observation_list)
 
 
 class Zero_rot_detailer(Base_detailer):
@@ -61,15 +62,13 @@ class Zero_rot_detailer(Base_detailer):
     """
 
     def __call__(self, observation_list, conditions):
+        observations = observation_block(observation_list)
+        alt, az = _approx_RaDec2AltAz(observations['RA'], observations['dec'], conditions.site.latitude_rad,
+                                      conditions.site.longitude_rad, conditions.mjd)
+        obs_pa = _approx_altaz2pa(alt, az, conditions.site.latitude_rad)
+        observations['rotSkyPos'] = obs_pa
 
-        # XXX--should I convert the list into an array and get rid of this loop?
-        for obs in observation_list:
-            alt, az = _approx_RaDec2AltAz(obs['RA'], obs['dec'], conditions.site.latitude_rad,
-                                          conditions.site.longitude_rad, conditions.mjd)
-            obs_pa = _approx_altaz2pa(alt, az, conditions.site.latitude_rad)
-            obs['rotSkyPos'] = obs_pa
-
-        return observation_list
+        return observations
 
 
 class Spider_rot_detailer(Base_detailer):
@@ -82,11 +81,11 @@ class Spider_rot_detailer(Base_detailer):
         indx = int(conditions.night % 2)
         rotTelPos = np.radians([45., 315.][indx])
 
-        for obs in observation_list:
-            obs['rotSkyPos'] = np.nan
-            obs['rotTelPos'] = rotTelPos
+        observations = observation_block(observation_list)
+        observations['rotSkyPos'] = np.nan
+        observations['rotTelPos'] = rotTelPos
 
-        return observation_list
+        return observations
 
 
 class Comcam_90rot_detailer(Base_detailer):
@@ -97,7 +96,7 @@ class Comcam_90rot_detailer(Base_detailer):
 
     def __call__(self, observation_list, conditions):
         favored_rotSkyPos = np.radians([0., 90., 180., 270., 360.]).reshape(5, 1)
-        obs_array =np.concatenate(observation_list)
+        obs_array = observation_block(observation_list)
         alt, az = _approx_RaDec2AltAz(obs_array['RA'], obs_array['dec'], conditions.site.latitude_rad,
                                       conditions.site.longitude_rad, conditions.mjd)
         parallactic_angle = _approx_altaz2pa(alt, az, conditions.site.latitude_rad)
@@ -108,10 +107,9 @@ class Comcam_90rot_detailer(Base_detailer):
         # can swap 360 and zero if needed?
         final_rotSkyPos = favored_rotSkyPos[min_indxs]
         # Set all the observations to the proper rotSkyPos
-        for rsp, obs in zip(final_rotSkyPos, observation_list):
-            obs['rotSkyPos'] = rsp
+        obs_array['rotSkyPos'] = final_rotSkyPos.ravel()
 
-        return observation_list
+        return obs_array
 
 
 class Close_alt_detailer(Base_detailer):
@@ -128,7 +126,7 @@ class Close_alt_detailer(Base_detailer):
         self.alt_band = int_rounded(np.radians(alt_band))
 
     def __call__(self, observation_list, conditions):
-        obs_array = np.concatenate(observation_list)
+        obs_array = observation_block(observation_list)
         alt, az = _approx_RaDec2AltAz(obs_array['RA'], obs_array['dec'], conditions.site.latitude_rad,
                                       conditions.site.longitude_rad, conditions.mjd)
         alt_diff = np.abs(alt - conditions.telAlt)
@@ -140,7 +138,7 @@ class Close_alt_detailer(Base_detailer):
         ang_dist = _angularSeparation(az[in_band], alt[in_band], conditions.telAz, conditions.telAlt)
         good = np.min(np.where(ang_dist == ang_dist.min())[0])
         indx = in_band[good]
-        result = observation_list[indx:] + observation_list[:indx]
+        result = np.concatenate((obs_array[indx:], obs_array[:indx]))
         return result
 
 
@@ -157,12 +155,11 @@ class Flush_for_sched_detailer(Base_detailer):
         self.tol = tol/24./60.  # To days
 
     def __call__(self, observation_list, conditions):
+        observations = observation_block(observation_list)
         if np.size(conditions.scheduled_observations) > 0:
             new_flush = np.min(conditions.scheduled_observations) - self.tol
-            for obs in observation_list:
-                if obs['flush_by_mjd'] > new_flush:
-                    obs['flush_by_mjd'] = new_flush
-        return observation_list
+            observations['flush_by_mjd'] = np.minimum(observations['flush_by_mjd'], new_flush)
+        return observations
 
 
 class Take_as_pairs_detailer(Base_detailer):
@@ -175,29 +172,23 @@ class Take_as_pairs_detailer(Base_detailer):
         self.nexp_dict = nexp_dict
 
     def __call__(self, observation_list, conditions):
-        paired = copy.deepcopy(observation_list)
+        observations = observation_block(observation_list)
+        paired = observations.copy()
         if self.exptime is not None:
-            for obs in paired:
-                obs['exptime'] = self.exptime
-        for obs in paired:
-            obs['filter'] = self.filtername
-            if self.nexp_dict is not None:
-                obs['nexp'] = self.nexp_dict[self.filtername]
+            paired['exptime'] = self.exptime
+        paired['filter'] = self.filtername
+        if self.nexp_dict is not None:
+            paired['nexp'] = self.nexp_dict[self.filtername]
         if conditions.current_filter == self.filtername:
-            for obs in paired:
-                obs['note'] = obs['note'][0] + ', a'
-            for obs in observation_list:
-                obs['note'] = obs['note'][0] + ', b'
-            result = paired + observation_list
+            paired['note'] = np.char.add(paired['note'], ', a')
+            observations['note'] = np.char.add(observations['note'], ', b')
+            result = np.concatenate((paired, observations))
         else:
-            for obs in paired:
-                obs['note'] = obs['note'][0] + ', b'
-            for obs in observation_list:
-                obs['note'] = obs['note'][0] + ', a'
-            result = observation_list + paired
+            paired['note'] = np.char.add(paired['note'], ', b')
+            observations['note'] = np.char.add(observations['note'], ', a')
+            result = np.concatenate((observations, paired))
         # XXX--maybe a temp debugging thing, label what part of sequence each observation is.
-        for i, obs in enumerate(result):
-            obs['survey_id'] = i
+        result['survey_id'] = np.arange(result.size)
         return result
 
 
@@ -209,7 +200,7 @@ class Twilight_triple_detailer(Base_detailer):
 
     def __call__(self, observation_list, conditions):
 
-        obs_array = np.concatenate(observation_list)
+        obs_array = observation_block(observation_list)
 
         # Estimate how much time is left in the twilgiht block
         potential_times = np.array([conditions.sun_n18_setting - conditions.mjd,
@@ -231,11 +222,9 @@ class Twilight_triple_detailer(Base_detailer):
                 max_indx = np.max(max_indx)
                 if max_indx == 0:
                     max_indx += 1
-            observation_list = observation_list[0:max_indx]
+            obs_array = obs_array[0:max_indx]
 
         # Repeat the observations n times
-        out_obs = []
-        for i in range(self.n_repeat):
-            out_obs.extend(copy.deepcopy(observation_list))
+        out_obs = np.tile(obs_array, self.n_repeat)
 
         return out_obs
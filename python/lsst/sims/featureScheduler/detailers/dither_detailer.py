@@ -1,5 +1,7 @@
+import time
 import numpy as np
 from lsst.sims.featureScheduler.detailers import Base_detailer
+from lsst.sims.featureScheduler.utils import observation_block
 from lsst.sims.utils import _approx_RaDec2AltAz, _approx_altaz2pa
 
 
@@ -39,45 +41,67 @@ class Dither_detailer(Base_detailer):
         The maximum dither size to use (degrees).
     per_night : bool (True)
         If true, us the same dither offset for an entire night
+    seed : int (42)
+        Random number seed. Offsets for a night are drawn from np.random.RandomState([seed, night]).
+    n_per_night : int (1000)
+        If per_night is False, the number of offsets to generate at a time.
 
-
+    Attributes
+    ----------
+    offset_time : float
+        Total time spent generating offsets (seconds).
     """
-    def __init__(self, max_dither=0.7, seed=42, per_night=True):
+    def __init__(self, max_dither=0.7, seed=42, per_night=True, n_per_night=1000):
         self.survey_features = {}
 
         self.current_night = -1
         self.max_dither = np.radians(max_dither)
         self.per_night = per_night
-        np.random.seed(seed=seed)
+        self.seed = seed
+        self.n_per_night = n_per_night
         self.offset = None
+        self.offset_cursor = 0
+        self.rng = None
+        self.offset_time = 0.
+
+    def _draw_offsets(self, n_offsets):
+        angle = self.rng.random_sample(n_offsets)*2*np.pi
+        radius = self.max_dither * np.sqrt(self.rng.random_sample(n_offsets))
+        return np.array([radius*np.cos(angle), radius*np.sin(angle)])
 
     def _generate_offsets(self, n_offsets, night):
+        t0 = time.time()
+        if night != self.current_night:
+            # Generate the night's offsets all at once
+            self.current_night = night
+            self.rng = np.random.RandomState([self.seed, int(night)])
+            self.offset_cursor = 0
+            if self.per_night:
+                self.offset = self._draw_offsets(1)
+            else:
+                self.offset = self._draw_offsets(self.n_per_night)
         if self.per_night:
-            if night != self.current_night:
-                self.current_night = night
-                self.offset = (np.random.random((1, 2))-0.5) * 2.*self.max_dither
-                angle = np.random.random(1)*2*np.pi
-                radius = self.max_dither * np.sqrt(np.random.random(1))
-                self.offset = np.array([radius*np.cos(angle), radius*np.sin(angle)])
-            offsets = np.tile(self.offset, (n_offsets, 1))
+            offsets = np.tile(self.offset, (1, n_offsets))
         else:
-            angle = np.random.random(n_offsets)*2*np.pi
-            radius = self.max_dither * np.sqrt(np.random.random(n_offsets))
-            offsets = np.array([radius*np.cos(angle), radius*np.sin(angle)])
+            end = self.offset_cursor + n_offsets
+            if end > self.offset.shape[1]:
+                self.offset = np.hstack((self.offset, self._draw_offsets(max(n_offsets, self.n_per_night))))
+            offsets = self.offset[:, self.offset_cursor:end]
+            self.offset_cursor = end
+        self.offset_time += time.time() - t0
 
         return offsets
 
     def __call__(self, observation_list, conditions):
+        obs_array = observation_block(observation_list)
 
         # Generate offsets in RA and Dec
-        offsets = self._generate_offsets(len(observation_list), conditions.night)
+        offsets = self._generate_offsets(obs_array.size, conditions.night)
 
-        obs_array = np.concatenate(observation_list)
         newRA, newDec = gnomonic_project_tosky(offsets[0, :], offsets[1, :], obs_array['RA'], obs_array['dec'])
-        for i, obs in enumerate(observation_list):
-            observation_list[i]['RA'] = newRA[i]
-            observation_list[i]['dec'] = newDec[i]
-        return observation_list
+        obs_array['RA'] = newRA
+        obs_array['dec'] = newDec
+        return obs_array
 
 
 def bearing(lon1, lat1, lon2, lat2):
@@ -126,26 +150,29 @@ class Euclid_dither_detailer(Base_detailer):
         self.current_night = -1
 
         self.per_night = per_night
-        np.random.seed(seed=seed)
+        self.seed = seed
+        self.offset_time = 0.
         self.shifted_ra_a = None
         self.shifted_dec_a = None
         self.shifted_ra_b = None
         self.shifted_dec_b = None
 
     def _generate_offsets(self, n_offsets, night):
+        t0 = time.time()
         if self.per_night:
             if night != self.current_night:
                 self.current_night = night
-                bearing_mag = np.random.uniform(low=self.dither_bearing_dir.min(), high=self.dither_bearing_dir.max())
-                perp_mag = np.random.uniform(low=self.dither_bearing_perp.min(), high=self.dither_bearing_perp.max())
+                rng = np.random.RandomState([self.seed, int(night)])
+                bearing_mag = rng.uniform(low=self.dither_bearing_dir.min(), high=self.dither_bearing_dir.max())
+                perp_mag = rng.uniform(low=self.dither_bearing_perp.min(), high=self.dither_bearing_perp.max())
                 # Move point a along the bearings
                 self.shifted_dec_a, self.shifted_ra_a = dest(bearing_mag, self.bearing_atob, self.dec_a, self.ra_a)
                 self.shifted_dec_a, self.shifted_ra_a = dest(perp_mag, self.bearing_atob+np.pi/2.,
                                                              self.shifted_dec_a, self.shifted_ra_a)
 
                 # Shift the second position
-                bearing_mag = np.random.uniform(low=self.dither_bearing_dir.min(), high=self.dither_bearing_dir.max())
-                perp_mag = np.random.uniform(low=self.dither_bearing_perp.min(), high=self.dither_bearing_perp.max())
+                bearing_mag = rng.uniform(low=self.dither_bearing_dir.min(), high=self.dither_bearing_dir.max())
+                perp_mag = rng.uniform(low=self.dither_bearing_perp.min(), high=self.dither_bearing_perp.max())
 
                 self.shifted_dec_b, self.shifted_ra_b = dest(bearing_mag, self.bearing_btoa, self.dec_b, self.ra_b)
                 self.shifted_dec_b, self.shifted_ra_b = dest(perp_mag, self.bearing_btoa+np.pi/2.,
@@ -153,23 +180,22 @@ class Euclid_dither_detailer(Base_detailer):
         else:
             # XXX--not implamented
             ValueError('not implamented')
+        self.offset_time += time.time() - t0
 
         return self.shifted_ra_a, self.shifted_dec_a, self.shifted_ra_b, self.shifted_dec_b
 
     def __call__(self, observation_list, conditions):
+        obs_array = observation_block(observation_list)
         # Generate offsets in RA and Dec
-        ra_a, dec_a, ra_b, dec_b = self._generate_offsets(len(observation_list), conditions.night)
-
-        for i, obs in enumerate(observation_list):
-            if obs[0]['note'][-1] == 'a':
-                observation_list[i]['RA'] = ra_a
-                observation_list[i]['dec'] = dec_a
-            elif obs[0]['note'][-1] == 'b':
-                observation_list[i]['RA'] = ra_b
-                observation_list[i]['dec'] = dec_b
-            else:
-                ValueError('observation note does not end in a or b.')
-        return observation_list
+        ra_a, dec_a, ra_b, dec_b = self._generate_offsets(obs_array.size, conditions.night)
+
+        is_a = np.char.endswith(obs_array['note'], 'a')
+        is_b = np.char.endswith(obs_array['note'], 'b')
+        obs_array['RA'][is_a] = ra_a
+        obs_array['dec'][is_a] = dec_a
+        obs_array['RA'][is_b] = ra_b
+        obs_array['dec'][is_b] = dec_b
+        return obs_array
 
 
 class Camera_rot_detailer(Base_detailer):
@@ -184,8 +210,17 @@ class Camera_rot_detailer(Base_detailer):
         The minimum to offset the camera (degrees)
     per_night : bool (True)
         If True, only set a new offset per night. If False, randomly rotates every observation.
+    seed : int (42)
+        Random number seed. Offsets for a night are drawn from np.random.RandomState([seed, night]).
+    n_per_night : int (1000)
+        If per_night is False, the number of offsets to generate at a time.
+
+    Attributes
+    ----------
+    offset_time : float
+        Total time spent generating offsets (seconds).
     """
-    def __init__(self, max_rot=90., min_rot=-90., per_night=True, seed=42):
+    def __init__(self, max_rot=90., min_rot=-90., per_night=True, seed=42, n_per_night=1000):
         self.survey_features = {}
 
         self.current_night = -1
@@ -193,32 +228,49 @@ class Camera_rot_detailer(Base_detailer):
         self.min_rot = np.radians(min_rot)
         self.range = self.max_rot - self.min_rot
         self.per_night = per_night
-        np.random.seed(seed=seed)
+        self.seed = seed
+        self.n_per_night = n_per_night
         self.offset = None
+        self.offset_cursor = 0
+        self.rng = None
+        self.offset_time = 0.
+
+    def _draw_offsets(self, n_offsets):
+        return (self.rng.random_sample(n_offsets) * self.range + self.min_rot) % (2.*np.pi)
 
     def _generate_offsets(self, n_offsets, night):
+        t0 = time.time()
+        if night != self.current_night:
+            # Generate the night's offsets all at once
+            self.current_night = night
+            self.rng = np.random.RandomState([self.seed, int(night)])
+            self.offset_cursor = 0
+            if self.per_night:
+                self.offset = self._draw_offsets(1)
+            else:
+                self.offset = self._draw_offsets(self.n_per_night)
         if self.per_night:
-            if night != self.current_night:
-                self.current_night = night
-                self.offset = np.random.random(1) * self.range + self.min_rot
             offsets = np.ones(n_offsets) * self.offset
         else:
-            offsets = np.random.random(n_offsets) * self.range + self.min_rot
-
-        offsets = offsets % (2.*np.pi)
+            end = self.offset_cursor + n_offsets
+            if end > self.offset.size:
+                self.offset = np.concatenate((self.offset, self._draw_offsets(max(n_offsets, self.n_per_night))))
+            offsets = self.offset[self.offset_cursor:end]
+            self.offset_cursor = end
+        self.offset_time += time.time() - t0
 
         return offsets
 
     def __call__(self, observation_list, conditions):
+        obs_array = observation_block(observation_list)
 
         # Generate offsets in camamera rotator
-        offsets = self._generate_offsets(len(observation_list), conditions.night)
+        offsets = self._generate_offsets(obs_array.size, conditions.night)
 
-        for i, obs in enumerate(observation_list):
-            alt, az = _approx_RaDec2AltAz(obs['RA'], obs['dec'], conditions.site.latitude_rad,
-                                          conditions.site.longitude_rad, conditions.mjd)
-            obs_pa = _approx_altaz2pa(alt, az, conditions.site.latitude_rad)
-            obs['rotSkyPos'] = (offsets[i] - obs_pa) % (2.*np.pi)
-            obs['rotTelPos'] = offsets[i]
+        alt, az = _approx_RaDec2AltAz(obs_array['RA'], obs_array['dec'], conditions.site.latitude_rad,
+                                      conditions.site.longitude_rad, conditions.mjd)
+        obs_pa = _approx_altaz2pa(alt, az, conditions.site.latitude_rad)
+        obs_array['rotSkyPos'] = (offsets - obs_pa) % (2.*np.pi)
+        obs_array['rotTelPos'] = offsets
 
-        return observation_list
+        return obs_array
@@ -1,7 +1,7 @@
 from lsst.sims.featureScheduler.detailers import Base_detailer
 from lsst.sims.utils import _raDec2Hpid, m5_flat_sed
 import lsst.sims.featureScheduler.features as features
-from lsst.sims.featureScheduler.utils import hp_in_lsst_fov
+from lsst.sims.featureScheduler.utils import hp_in_lsst_fov, observation_block
 import numpy as np
 import healpy as hp
 import matplotlib.pylab as plt
@@ -39,26 +39,31 @@ class Short_expt_detailer(Base_detailer):
         self.obs2hpid = hp_in_lsst_fov(nside=nside)
 
     def __call__(self, observation_list, conditions):
-        out_observations = []
+        obs_array = observation_block(observation_list)
         # Compute how many observations we should have taken by now
         n_goal = self.nobs * np.round((conditions.mjd - self.mjd0)/365.25 + 1)
-        time_to_add = 0.
-        for observation in observation_list:
-            out_observations.append(observation)
-            if observation['filter'] == self.filtername:
-                hpids = self.obs2hpid(observation['RA'], observation['dec'])
-                # Crop off anything outside the target footprint
-                hpids = hpids[np.where(self.footprint[hpids] > 0)]
-                # Crop off things where we already have enough observation
-                hpids = hpids[np.where(self.survey_features['nobs'].feature[hpids] < n_goal)]
-                if np.size(hpids) > 0:
-                    new_obs = observation.copy()
-                    new_obs['exptime'] = self.exp_time
-                    new_obs['nexp'] = 1
-                    new_obs['note'] = self.survey_name
-                    out_observations.append(new_obs)
-                    time_to_add += new_obs['exptime'] + self.read_approx
+        add_short = np.zeros(obs_array.size, dtype=bool)
+        for i in np.where(obs_array['filter'] == self.filtername)[0]:
+            hpids = self.obs2hpid(obs_array['RA'][i], obs_array['dec'][i])
+            # Crop off anything outside the target footprint
+            hpids = hpids[np.where(self.footprint[hpids] > 0)]
+            # Crop off things where we already have enough observation
+            hpids = hpids[np.where(self.survey_features['nobs'].feature[hpids] < n_goal)]
+            add_short[i] = np.size(hpids) > 0
+
+        new_obs = obs_array[add_short]
+        new_obs['exptime'] = self.exp_time
+        new_obs['nexp'] = 1
+        new_obs['note'] = self.survey_name
+        time_to_add = np.sum(new_obs['exptime'] + self.read_approx)
+
         # pump up the flush time
-        for observation in observation_list:
-            observation['flush_by_mjd'] += time_to_add/3600./24.
+        obs_array['flush_by_mjd'] += time_to_add/3600./24.
+
+        # Each short exposure goes right after the observation it was made from
+        out_observations = np.zeros(obs_array.size + new_obs.size, dtype=obs_array.dtype)
+        n_before = np.cumsum(add_short) - add_short
+        positions = np.arange(obs_array.size) + n_before
+        out_observations[positions] = obs_array
+        out_observations[positions[add_short] + 1] = new_obs
         return out_observations
@@ -1,4 +1,5 @@
 from lsst.sims.featureScheduler.detailers import Base_detailer
+from lsst.sims.featureScheduler.utils import observation_block
 from lsst.sims.utils import _raDec2Hpid, m5_flat_sed
 import numpy as np
 import healpy as hp
@@ -56,45 +57,68 @@ class Vary_expt_detailer(Base_detailer):
                               'z': 22.80377793629767}
         else:
             self.target_m5 = target_m5
+        # Hole-filled M5 maps, rebuilt when the conditions change
+        self.filled_m5 = {}
+        self.filled_version = None
+        self.neighbors = None
+
+    def _filled_m5(self, conditions, filtername):
+        """The M5 depth map with masked pixels replaced by the mean of their unmasked neighbors.
+
+        Maps are cached for each filter until the conditions are updated.
+        """
+        if conditions.version != self.filled_version:
+            self.filled_m5 = {}
+            self.filled_version = conditions.version
+        if filtername not in self.filled_m5:
+            if (self.neighbors is None) or (self.neighbors.shape[1] != hp.nside2npix(conditions.nside)):
+                self.neighbors = hp.get_all_neighbours(conditions.nside,
+                                                       np.arange(hp.nside2npix(conditions.nside)))
+            m5 = conditions.M5Depth[filtername]
+            filled = m5.copy()
+            holes = np.where(np.isnan(m5))[0]
+            if holes.size > 0:
+                neighbors = self.neighbors[:, holes]
+                # Some pixels have fewer than 8 neighbors, flagged with -1
+                vals = np.where(neighbors >= 0, m5[neighbors], np.nan)
+                good = np.isfinite(vals)
+                n_good = np.sum(good, axis=0)
+                total = np.sum(np.where(good, vals, 0.), axis=0)
+                has_good = n_good > 0
+                filled[holes[has_good]] = total[has_good]/n_good[has_good]
+            self.filled_m5[filtername] = filled
+        return self.filled_m5[filtername]
 
     def __call__(self, observation_list, conditions):
         """
         Parameters
         ----------
-        observation_list : list of observations
+        observation_list : np.array
             The observations to detail.
         conditions : lsst.sims.featureScheduler.conditions object
 
         Returns
         -------
-        List of observations.
+        np.array of observations.
         """
-        obs_array = np.concatenate(observation_list)
+        obs_array = observation_block(observation_list)
         hpids = _raDec2Hpid(self.nside, obs_array['RA'], obs_array['dec'])
         new_expts = np.zeros(obs_array.size, dtype=float)
         for filtername in np.unique(obs_array['filter']):
             in_filt = np.where(obs_array['filter'] == filtername)
-            delta_m5 = self.target_m5[filtername] - conditions.M5Depth[filtername][hpids[in_filt]]
-            # We can get NaNs because dithering pushes the center of the pointing into masked regions.
-            nan_indices = np.argwhere(np.isnan(delta_m5)).ravel()
-            for indx in nan_indices:
-                bad_hp = hpids[in_filt][indx]
-                # Note this might fail if we run at higher resolution, then we'd need to look farther for
-                # pixels to interpolate.
-                near_pix = hp.get_all_neighbours(conditions.nside, bad_hp)
-                vals = conditions.M5Depth[filtername][near_pix]
-                if True in np.isfinite(vals):
-                    estimate_m5 = np.mean(vals[np.isfinite(vals)])
-                    delta_m5[indx] = self.target_m5[filtername] - estimate_m5
-                else:
-                    raise ValueError('Failed to find a nearby unmasked sky value.')
+            # We can get NaNs because dithering pushes the center of the pointing into masked regions,
+            # so use a map where those have been filled from the neighboring pixels.
+            delta_m5 = self.target_m5[filtername] - self._filled_m5(conditions, filtername)[hpids[in_filt]]
+            # Note this might fail if we run at higher resolution, then we'd need to look farther for
+            # pixels to interpolate.
+            if np.any(np.isnan(delta_m5)):
+                raise ValueError('Failed to find a nearby unmasked sky value.')
 
             new_expts[in_filt] = conditions.exptime * 10**(delta_m5/1.25)
         new_expts = np.clip(new_expts, self.min_exp, self.max_exp)
         # I'm not sure what level of precision we can expect, so let's just limit to seconds
         new_expts = np.round(new_expts)
 
-        for i, observation in enumerate(observation_list):
-            observation['exptime'] = new_expts[i]
+        obs_array['exptime'] = new_expts
 
-        return observation_list
+        return obs_array
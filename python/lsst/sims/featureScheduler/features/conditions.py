@@ -1,10 +1,14 @@
 import numpy as np
-from lsst.sims.utils import _approx_RaDec2AltAz, Site, _hpid2RaDec, m5_flat_sed, _approx_altaz2pa, _angularSeparation
+from lsst.sims.utils import Site, _hpid2RaDec, m5_flat_sed, calcLmstLast
 import healpy as hp
-from lsst.sims.featureScheduler.utils import set_default_nside, match_hp_resolution, season_calc, smallest_signed_angle
+import itertools
+from lsst.sims.featureScheduler.utils import set_default_nside, match_hp_resolution, season_map, smallest_signed_angle
 
 __all__ = ['Conditions']
 
+# Unique version numbers, shared by all Conditions objects
+_versions = itertools.count()
+
 
 class Conditions(object):
     """
@@ -128,6 +132,13 @@ class Conditions(object):
             Dictionary of planet name and coordinate e.g., 'venus_RA', 'mars_dec'
         scheduled_observations : np.array
             A list of MJD times when there are scheduled observations. Defaults to empty array.
+        future_mjd : np.array
+            MJD values (days) to use for looking ahead. Setting it resets the future_* attributes.
+        future_airmass : np.array
+            Array of shape (n_times, npix) with the airmass of each healpixel at each future_mjd.
+        future_skybrightness : dict of np.array
+            Dictionary keyed by filtername. Values are arrays of shape (n_times, npix) with the
+            sky brightness at each future_mjd (mag/acsec^2)
 
         Attributes (calculated on demand and cached)
         ------------------------------------------
@@ -142,6 +153,9 @@ class Conditions(object):
             Based on the fast approximate alt,az values.
         lmst : float
             The local mean sidearal time (hours). Updates is mjd is changed.
+        version : int
+            A unique number that changes every time mjd is set. Basis functions and surveys use it to
+            tell if their cached values are still valid.
         M5Depth : dict of np.array
             the 5-sigma limiting depth healpix maps, keyed by filtername (mags). Will be recalculated
             if the skybrightness, seeing, or airmass are updated.
@@ -153,11 +167,23 @@ class Conditions(object):
             Healpix map of the azimuthal distance to the anit-sun for each healpixel (radians)
         solar_elongation : np.array
             Healpix map of the solar elongation (angular distance to the sun) for each healpixel (radians)
+        moon_distance : np.array
+            Healpix map of the angular distance to the moon for each healpixel (radians)
+        future_lmst : np.array
+            The local mean sidereal time at each future_mjd (hours).
+        future_alt : np.array
+            Array of shape (n_times, npix) with the altitude of each healpixel at each future_mjd (radians).
+        future_az : np.array
+            Array of shape (n_times, npix) with the azimuth of each healpixel at each future_mjd (radians).
+        future_HA : np.array
+            Array of shape (n_times, npix) with the hour angle of each healpixel at each future_mjd
+            (radians). Runs from 0 to 2pi.
 
         Attributes (set by the scheduler)
         -------------------------------
-        queue : list of observation objects
-            The current queue of observations core_scheduler is waiting to execute.
+        queue : np.array
+            Structured observation array (see empty_observation) of the observations
+            core_scheduler is waiting to execute, next one first.
 
         """
         if nside is None:
@@ -175,9 +201,17 @@ class Conditions(object):
         self.nan_map.fill(np.nan)
         # The RA, Dec grid we are using
         self.ra, self.dec = _hpid2RaDec(nside, hpids)
+        # Static trig terms of the grid and site, so each MJD update needs few transcendental calls
+        self._sin_ra = np.sin(self.ra)
+        self._cos_ra = np.cos(self.ra)
+        self._sin_dec = np.sin(self.dec)
+        self._cos_dec = np.cos(self.dec)
+        self._sin_lat = np.sin(self.site.latitude_rad)
+        self._cos_lat = np.cos(self.site.latitude_rad)
 
         # Modified Julian Date (day)
         self._mjd = None
+        self.version = next(_versions)
         # Altitude and azimuth. Dict with degrees and radians
         self._alt = None
         self._az = None
@@ -250,25 +284,98 @@ class Conditions(object):
         self.season_length = 365.25
         self.season_floor = True
 
+        # Times to look ahead to
+        self._future_mjd = None
+        self._future_lmst = None
+        self._future_alt = None
+        self._future_az = None
+        self._future_HA = None
+        self.future_airmass = None
+        self.future_skybrightness = {}
+
     @property
     def lmst(self):
+        if (self._lmst is None) & (self._mjd is not None):
+            self._lmst, last = calcLmstLast(self._mjd, self.site.longitude_rad)
         return self._lmst
 
     @lmst.setter
     def lmst(self, value):
-        self._lmst = value
-        self._HA = None
+        # Alt, az, etc get computed from the lmst, so only reset if it changes
+        if value != self._lmst:
+            self._lmst = value
+            self._alt = None
+            self._az = None
+            self._pa = None
+            self._HA = None
 
     @property
     def HA(self):
         if self._HA is None:
-            self.calc_HA()
+            self.calc_geometry()
         return self._HA
 
     def calc_HA(self):
+        self.calc_geometry()
+
+    def _approx_geometry(self, lmst):
+        """Approximate alt, az, and parallactic angle of every healpixel at a given LMST.
+
+        Same equations as _approx_RaDec2AltAz and _approx_altaz2pa, but using the precomputed
+        trig tables, so only a few transcendental calls per pixel are needed.
+
+        Parameters
+        ----------
+        lmst : float or np.array
+            Local mean sidereal time (hours). An array of shape (n_times, 1) will broadcast to
+            results of shape (n_times, npix).
+
+        Returns
+        -------
+        alt, az, pa : np.array
+            In radians.
+        """
+        lmst_rad = lmst/12.*np.pi
+        sin_lmst = np.sin(lmst_rad)
+        cos_lmst = np.cos(lmst_rad)
+        # cos and sin of the hour angle, via the angle difference identities
+        cos_ha = cos_lmst*self._cos_ra + sin_lmst*self._sin_ra
+        sin_ha = sin_lmst*self._cos_ra - cos_lmst*self._sin_ra
+
+        sinalt = np.clip(self._sin_dec*self._sin_lat + self._cos_dec*self._cos_lat*cos_ha, -1., 1.)
+        alt = np.arcsin(sinalt)
+        cosalt = np.sqrt(1. - sinalt**2)
+
+        denom = cosalt*self._cos_lat
+        cosaz = np.ones(denom.shape, dtype=float)
+        np.divide(self._sin_dec - sinalt*self._sin_lat, denom, out=cosaz, where=denom != 0)
+        np.clip(cosaz, -1., 1., out=cosaz)
+        az = np.arccos(cosaz)
+        signflip = sin_ha > 0
+        az[signflip] = 2.*np.pi - az[signflip]
+
+        sinaz = np.sqrt(1. - cosaz**2)
+        sinaz[signflip] *= -1.
+        pa = np.arctan2(-sinaz*self._cos_lat, cosalt*self._sin_lat - sinalt*self._cos_lat*cosaz)
+        pa = pa % (2.*np.pi)
+        return alt, az, pa
+
+    def calc_geometry(self):
+        """Compute alt, az, pa, and HA of the healpix grid in one pass.
+        """
+        if self._lmst is None:
+            self._lmst, last = calcLmstLast(self._mjd, self.site.longitude_rad)
+        self._alt, self._az, self._pa = self._approx_geometry(self._lmst)
         self._HA = np.radians(self._lmst*360./24.) - self.ra
         self._HA[np.where(self._HA < 0)] += 2.*np.pi
 
+    def _angular_distance(self, ra, dec):
+        """Angular distance from every healpixel to a point, using the trig tables (radians).
+        """
+        cos_dist = self._sin_dec*np.sin(dec) + self._cos_dec*np.cos(dec)*(self._cos_ra*np.cos(ra) +
+                                                                       self._sin_ra*np.sin(ra))
+        return np.arccos(np.clip(cos_dist, -1., 1.))
+
     @property
     def cloud_map(self):
         return self._cloud_map
@@ -301,28 +408,26 @@ class Conditions(object):
     @property
     def pa(self):
         if self._pa is None:
-            self.calc_pa()
+            self.calc_geometry()
         return self._pa
 
     def calc_pa(self):
-        self._pa = _approx_altaz2pa(self.alt, self.az, self.site.latitude_rad)
+        self.calc_geometry()
 
     @property
     def alt(self):
         if self._alt is None:
-            self.calc_altAz()
+            self.calc_geometry()
         return self._alt
 
     @property
     def az(self):
         if self._az is None:
-            self.calc_altAz()
+            self.calc_geometry()
         return self._az
 
     def calc_altAz(self):
-        self._alt, self._az = _approx_RaDec2AltAz(self.ra, self.dec,
-                                                  self.site.latitude_rad,
-                                                  self.site.longitude_rad, self._mjd)
+        self.calc_geometry()
 
     @property
     def mjd(self):
@@ -331,6 +436,7 @@ class Conditions(object):
     @mjd.setter
     def mjd(self, value):
         self._mjd = value
+        self.version = next(_versions)
         # Set things that need to be recalculated to None
         self._az = None
         self._alt = None
@@ -341,6 +447,55 @@ class Conditions(object):
         self._az_to_antisun = None
         self._season = None
         self._solar_elongation = None
+        self._moon_distance = None
+
+    @property
+    def future_mjd(self):
+        return self._future_mjd
+
+    @future_mjd.setter
+    def future_mjd(self, value):
+        self._future_mjd = np.atleast_1d(value)
+        self._future_lmst = None
+        self._future_alt = None
+        self._future_az = None
+        self._future_HA = None
+        self.future_airmass = None
+        self.future_skybrightness = {}
+
+    @property
+    def future_lmst(self):
+        if self._future_lmst is None:
+            self._future_lmst, last = calcLmstLast(self._future_mjd, self.site.longitude_rad)
+        return self._future_lmst
+
+    @property
+    def future_alt(self):
+        if self._future_alt is None:
+            self.calc_future_altAz()
+        return self._future_alt
+
+    @property
+    def future_az(self):
+        if self._future_az is None:
+            self.calc_future_altAz()
+        return self._future_az
+
+    @property
+    def future_HA(self):
+        if self._future_HA is None:
+            self.calc_future_HA()
+        return self._future_HA
+
+    def calc_future_HA(self):
+        self._future_HA = np.radians(self.future_lmst*360./24.)[:, np.newaxis] - self.ra
+        self._future_HA[np.where(self._future_HA < 0)] += 2.*np.pi
+
+    def calc_future_altAz(self):
+        """Alt,az of every healpixel at every future_mjd, using the same approximate
+        equations as calc_altAz, but broadcast over all the times at once.
+        """
+        self._future_alt, self._future_az, pa = self._approx_geometry(self.future_lmst[:, np.newaxis])
 
     @property
     def skybrightness(self):
@@ -382,7 +537,7 @@ class Conditions(object):
                                                           self._airmass[good])
 
     def calc_solar_elongation(self):
-        self._solar_elongation = _angularSeparation(self.ra, self.dec, self.sunRA, self.sunDec)
+        self._solar_elongation = self._angular_distance(self.sunRA, self.sunDec)
 
     @property
     def solar_elongation(self):
@@ -390,6 +545,15 @@ class Conditions(object):
             self.calc_solar_elongation()
         return self._solar_elongation
 
+    def calc_moon_distance(self):
+        self._moon_distance = self._angular_distance(self.moonRA, self.moonDec)
+
+    @property
+    def moon_distance(self):
+        if self._moon_distance is None:
+            self.calc_moon_distance()
+        return self._moon_distance
+
     def calc_az_to_sun(self):
         self._az_to_sun = smallest_signed_angle(self.ra, self.sunRA)
 
@@ -418,9 +582,9 @@ class Conditions(object):
                 self.season_length = season_length
                 self.season_floor = floor
             if (self._season is None) | (~kwargs_match):
-                self._season = season_calc(self.night, offset=self.season_offset,
-                                           modulo=modulo, max_season=max_season,
-                                           season_length=season_length, floor=floor)
+                self._season = season_map(self.night, offset=self.season_offset,
+                                          modulo=modulo, max_season=max_season,
+                                          season_length=season_length, floor=floor)
         else:
             self._season = None
 
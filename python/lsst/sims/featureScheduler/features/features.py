@@ -113,9 +113,11 @@ class N_obs_count_season(BaseSurveyFeature):
 
     def add_observation(self, observation, indx=None):
 
-        season = utils.season_calc(observation['night'], modulo=self.season_modulo,
-                                   offset=self.offset[indx], max_season=self.max_season,
-                                   season_length=self.season_length)
+        season = utils.season_map(observation['night'], modulo=self.season_modulo,
+                                  offset=self.offset, max_season=self.max_season,
+                                  season_length=self.season_length)
+        if season.size > 1:
+            season = season[indx]
         if self.season in season:
             if (self.filtername is None) and (self.tag is None):
                 # Track all observations
@@ -292,9 +294,11 @@ class N_observations_season(BaseSurveyFeature):
             The indices of the healpixel map that have been observed by observation
         """
 
-        observation_season = utils.season_calc(observation['night'], offset=self.offset[indx],
-                                               modulo=self.modulo, max_season=self.max_season,
-                                               season_length=self.season_length)
+        observation_season = utils.season_map(observation['night'], offset=self.offset,
+                                              modulo=self.modulo, max_season=self.max_season,
+                                              season_length=self.season_length)
+        if observation_season.size > 1:
+            observation_season = observation_season[indx]
         if self.season in observation_season:
             if self.filtername is None or observation['filter'][0] in self.filtername:
                 self.feature[indx] += 1
@@ -333,12 +337,14 @@ class N_observations_current_season(BaseSurveyFeature):
         self.feature = np.zeros(hp.nside2npix(nside), dtype=float)
 
     def add_observation(self, observation, indx=None):
-        current_season = utils.season_calc(observation['night'], offset=self.offset,
-                                           season_length=self.season_length)
-        # If the season has changed anywhere, set that count to zero
-        new_season = np.where((self.season_map - current_season) != 0)
-        self.feature[new_season] = 0
-        self.season_map = current_season
+        current_season = utils.season_map(observation['night'], offset=self.offset,
+                                          season_length=self.season_length)
+        # Seasons only roll over between nights, so only check when the map is new
+        if current_season is not self.season_map:
+            # If the season has changed anywhere, set that count to zero
+            new_season = np.where((self.season_map - current_season) != 0)
+            self.feature[new_season] = 0
+            self.season_map = current_season
 
         if self.filtername is None or observation['filter'][0] in self.filtername:
             self.feature[indx] += 1
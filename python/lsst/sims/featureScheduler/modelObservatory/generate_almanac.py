@@ -1,58 +1,166 @@
+import os
+import multiprocessing
 import numpy as np
 from astroplan import Observer
 import astropy.units as u
 from astropy.time import Time
 from lsst.sims.utils import Site
+from lsst.sims.featureScheduler.utils import scheduler_cache_dir
 
 # Trying out the astroplan sunrise/set code.
 # conda install -c astropy astroplan
-mjd_start = 59853.5 - 3.*365.25
-duration = 25.*365.25
-pad_around = 40
-t_step = 0.7
 
-mjds = np.arange(mjd_start-pad_around, duration+mjd_start+pad_around+t_step, t_step)
+__all__ = ['build_almanac', 'ALMANAC_CACHE_VERSION']
 
-site = Site('LSST')
-observer = Observer(longitude=site.longitude*u.deg, latitude=site.latitude*u.deg,
-                    elevation=site.height*u.m, name="LSST")
+# Bump if the way the almanac is computed changes, so old cache files get ignored
+ALMANAC_CACHE_VERSION = 1
 
+almanac_names = ['night', 'sunset', 'sun_n12_setting', 'sun_n18_setting', 'sun_n18_rising',
+                 'sun_n12_rising', 'sunrise', 'moonrise', 'moonset']
+almanac_types = [int] + [float]*(len(almanac_names)-1)
 
-# This blows up if I try to do it all at once? 250 GB of memory?
-results = []
 
-mjds_list = np.array_split(mjds, 500)
+def _almanac_chunk(mjds):
+    """Compute the almanac rows for the sunsets following a chunk of mjds.
 
-for i, mjds in enumerate(mjds_list):
-    print('chunk %i of %i'%(i, len(mjds_list)))
+    Run in a worker process. Only one chunk of astropy Time objects is alive at a time,
+    so memory per worker is set by the chunk size.
+    """
+    site = Site('LSST')
+    observer = Observer(longitude=site.longitude*u.deg, latitude=site.latitude*u.deg,
+                        elevation=site.height*u.m, name="LSST")
     times = Time(mjds, format='mjd')
-    print('getting sunsets')
     sunsets = observer.sun_set_time(times)
 
     sunsets = np.unique(np.round(sunsets.mjd, decimals=4))
 
-    names = ['night', 'sunset', 'sun_n12_setting', 'sun_n18_setting', 'sun_n18_rising',
-             'sun_n12_rising', 'sunrise', 'moonrise', 'moonset']
-    types = [int]
-    types.extend([float]*(len(names)-1))
-    almanac = np.zeros(sunsets.size, dtype=list(zip(names, types)))
+    almanac = np.zeros(sunsets.size, dtype=list(zip(almanac_names, almanac_types)))
     almanac['sunset'] = sunsets
 
     times = Time(sunsets, format='mjd')
-    print('evening twilight 1')
     almanac['sun_n12_setting'] = observer.twilight_evening_nautical(times).mjd
     almanac['sun_n18_setting'] = observer.twilight_evening_astronomical(times).mjd
     almanac['sun_n18_rising'] = observer.twilight_morning_astronomical(times).mjd
     almanac['sun_n12_rising'] = observer.twilight_morning_nautical(times).mjd
     almanac['sunrise'] = observer.sun_rise_time(times).mjd
     almanac['moonset'] = observer.moon_set_time(times).mjd
-    print('moonrise')
     almanac['moonrise'] = observer.moon_rise_time(times).mjd
-    results.append(almanac)
+    return almanac
 
-almanac = np.concatenate(results)
-umjds, indx = np.unique(almanac['sunset'], return_index=True)
-almanac = almanac[indx]
-almanac['night'] = np.arange(almanac['night'].size)
 
-np.savez('sunsets.npz', almanac=almanac)
+def _merge_almanacs(almanacs):
+    """Combine almanac arrays, dropping repeated nights and renumbering.
+    """
+    almanac = np.concatenate(almanacs)
+    almanac = almanac[np.argsort(almanac['sunset'], kind='mergesort')]
+    # The same sunset found from neighboring chunks can differ in the last digit
+    keep = np.concatenate(([True], np.diff(almanac['sunset']) > 0.5))
+    almanac = almanac[keep]
+    almanac['night'] = np.arange(almanac['night'].size)
+    return almanac
+
+
+def _compute_almanac(mjd_start, mjd_end, t_step, chunk_days, nproc, verbose=False):
+    """Compute the almanac between two dates, spreading chunks over a process pool
+    """
+    mjds = np.arange(mjd_start, mjd_end+t_step, t_step)
+    n_chunks = max(int(np.ceil((mjd_end - mjd_start)/chunk_days)), 1)
+    mjds_list = np.array_split(mjds, n_chunks)
+    if nproc is None:
+        nproc = multiprocessing.cpu_count()
+    nproc = max(min(nproc, n_chunks), 1)
+
+    results = []
+    if nproc == 1:
+        for i, chunk in enumerate(mjds_list):
+            if verbose:
+                print('chunk %i of %i' % (i, n_chunks))
+            results.append(_almanac_chunk(chunk))
+    else:
+        # Recycle workers so astropy caches can't build up
+        pool = multiprocessing.Pool(nproc, maxtasksperchild=10)
+        try:
+            for i, almanac in enumerate(pool.imap(_almanac_chunk, mjds_list)):
+                if verbose:
+                    print('chunk %i of %i' % (i, n_chunks))
+                results.append(almanac)
+        finally:
+            pool.close()
+            pool.join()
+    return _merge_almanacs(results)
+
+
+def build_almanac(mjd_start=59853.5-3.*365.25, duration=25.*365.25, pad_around=40., t_step=0.7,
+                  chunk_days=20., nproc=None, filename=None, verbose=False):
+    """Build (or extend) the almanac of sunsets, twilights and moon rise/set times.
+
+    The almanac is saved as a .npy file. If the file already exists, only the dates
+    it does not cover are computed and appended, so changing the survey window does
+    not mean starting over.
+
+    Parameters
+    ----------
+    mjd_start : float (59853.5-3*365.25)
+        The starting mjd
+    duration : float (25*365.25)
+        How long to compute times for (days)
+    pad_around : float (40)
+        Extra days to add before and after the requested window
+    t_step : float (0.7)
+        Time step for searching for sunsets (days)
+    chunk_days : float (20)
+        Number of days each worker computes at a time. Sets the memory used by each worker.
+    nproc : int (None)
+        Number of processes to use. Default of None uses all the cpus.
+    filename : str (None)
+        Where to save the almanac (.npy). Default of None uses the scheduler cache directory.
+    verbose : bool (False)
+        Print progress
+
+    Returns
+    -------
+    almanac : np.array
+        Read-only, memory mapped almanac array. Nights are numbered from zero at the first
+        sunset in the file, so they shift if the almanac is extended to earlier dates.
+    """
+    if filename is None:
+        cache_dir = scheduler_cache_dir()
+        if cache_dir is None:
+            raise ValueError('No cache directory available, set filename')
+        filename = os.path.join(cache_dir, 'almanac_v%i_step%.3f.npy' % (ALMANAC_CACHE_VERSION, t_step))
+    elif not filename.endswith('.npy'):
+        filename += '.npy'
+
+    mjd_min = mjd_start - pad_around
+    mjd_max = mjd_start + duration + pad_around
+
+    almanacs = []
+    if os.path.isfile(filename):
+        existing = np.load(filename)
+        almanacs.append(existing)
+        # Sunsets found from mjds up to t_step past the edges are already in the file
+        covered_min = existing['sunset'][0]
+        covered_max = existing['sunset'][-1]
+        if mjd_min < covered_min - 1.:
+            almanacs.append(_compute_almanac(mjd_min, covered_min, t_step, chunk_days, nproc,
+                                             verbose=verbose))
+        if mjd_max > covered_max + 1.:
+            almanacs.append(_compute_almanac(covered_max, mjd_max, t_step, chunk_days, nproc,
+                                             verbose=verbose))
+    else:
+        almanacs.append(_compute_almanac(mjd_min, mjd_max, t_step, chunk_days, nproc, verbose=verbose))
+
+    if len(almanacs) > 1 or not os.path.isfile(filename):
+        almanac = _merge_almanacs(almanacs)
+        # Write to a temporary file and move it, so readers never see a partial file
+        temp_name = '%s.%i.tmp.npy' % (filename[:-4], os.getpid())
+        np.save(temp_name, almanac)
+        os.replace(temp_name, filename)
+
+    return np.load(filename, mmap_mode='r')
+
+
+if __name__ == '__main__':
+
+    almanac = build_almanac(verbose=True)
+    np.savez('sunsets.npz', almanac=np.array(almanac))
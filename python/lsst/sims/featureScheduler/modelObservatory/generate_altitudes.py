@@ -1,3 +1,4 @@
+import multiprocessing
 import numpy as np
 from lsst.sims.utils import Site
 from astropy.coordinates import get_sun, get_moon, EarthLocation, AltAz
@@ -54,7 +55,14 @@ def alt_moon_sum(in_mjds, location, offset):
     return result
 
 
-def generate_nights(mjd_start, duration=3653., rough_step=2, verbose=False):
+def _generate_nights_span(args):
+    """Run generate_nights serially on one span, for use with a process pool
+    """
+    mjd_start, duration, rough_step = args
+    return generate_nights(mjd_start, duration=duration, rough_step=rough_step)
+
+
+def generate_nights(mjd_start, duration=3653., rough_step=2, verbose=False, nproc=1, span_days=90.):
     """Generate the sunset and twilight times for a range of dates
 
     Parameters
@@ -65,7 +73,15 @@ def generate_nights(mjd_start, duration=3653., rough_step=2, verbose=False):
         How long to compute times for (days)
     rough_step : float (2.)
         Time step for computing first pass rough sunrise times (hours)
+    nproc : int (1)
+        Number of processes to use. If more than 1, the dates are split into spans
+        of span_days that are computed in parallel.
+    span_days : float (90)
+        Length of each span when running in parallel (days). Sets the memory used by each worker.
     """
+    if nproc > 1:
+        return _generate_nights_parallel(mjd_start, duration, rough_step, nproc, span_days,
+                                         verbose=verbose)
 
     # Let's find the nights first, find the times where the sun crosses the meridian.
     site = Site('LSST')
@@ -174,6 +190,37 @@ def generate_nights(mjd_start, duration=3653., rough_step=2, verbose=False):
 
     return alt_info_array, refined_mjds
 
+
+def _generate_nights_parallel(mjd_start, duration, rough_step, nproc, span_days, verbose=False):
+    """Split generate_nights into spans and run them across a process pool
+    """
+    span_starts = np.arange(mjd_start, mjd_start+duration, span_days)
+    span_ends = np.append(span_starts[1:], mjd_start+duration)
+    # Overlap the spans so the nights cropped off the end of one are in the next
+    args = [(start, end-start+3., rough_step) for start, end in zip(span_starts, span_ends)]
+
+    pool = multiprocessing.Pool(min(nproc, len(args)), maxtasksperchild=1)
+    try:
+        results = pool.map(_generate_nights_span, args)
+    finally:
+        pool.close()
+        pool.join()
+
+    rough_list = []
+    refined_list = []
+    for (rough, refined), start, end in zip(results, span_starts, span_ends):
+        if verbose:
+            print('span %.1f to %.1f' % (start, end))
+        # Each span finds the sunsets after its start, keep the ones before the next span starts
+        good = np.where(rough['sunset'] < end)[0]
+        rough_list.append(rough[good])
+        refined_list.append(refined[good])
+    alt_info_array = np.concatenate(rough_list)
+    refined_mjds = np.concatenate(refined_list)
+    alt_info_array['night'] = np.arange(alt_info_array.size) + 1
+    refined_mjds['night'] = alt_info_array['night']
+    return alt_info_array, refined_mjds
+
 if __name__ == '__main__':
 
     # Let's use astropy to pre-compute the sunrise/sunset/twilight/moonrise/moonset times we're interested in.
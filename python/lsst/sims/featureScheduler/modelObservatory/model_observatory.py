@@ -8,7 +8,7 @@ import lsst.sims.downtimeModel as downtimeModel
 from lsst.sims.seeingModel import SeeingData, SeeingModel
 from lsst.sims.cloudModel import CloudData
 from lsst.sims.featureScheduler.features import Conditions
-from lsst.sims.featureScheduler.utils import set_default_nside, create_season_offset
+from lsst.sims.featureScheduler.utils import set_default_nside, create_season_offset, match_hp_resolution
 from astropy.coordinates import EarthLocation
 from astropy.time import Time
 from lsst.sims.almanac import Almanac
@@ -284,6 +284,42 @@ class Model_observatory(object):
 
         return self.conditions
 
+    def return_future_conditions(self, mjds):
+        """Fill in the lookahead attributes of the conditions object.
+
+        Parameters
+        ----------
+        mjds : np.array
+            The future MJD values to compute conditions for (days).
+
+        Returns
+        -------
+        lsst.sims.featureScheduler.features.conditions object
+            With future_mjd, future_airmass and future_skybrightness set. The future alt, az
+            and HA get computed on demand.
+        """
+        self.conditions.future_mjd = mjds
+        alts = self.conditions.future_alt
+
+        airmass = np.empty(alts.shape, dtype=float)
+        airmass.fill(np.nan)
+        good = np.where(alts > self.alt_min)
+        airmass[good] = 1./np.cos(np.pi/2. - alts[good])
+        self.conditions.future_airmass = airmass
+
+        # The sky model interpolates one time at a time, stack the results
+        skybrightness = {}
+        for i, mjd in enumerate(self.conditions.future_mjd):
+            mags = self.sky_model.returnMags(mjd, airmass_mask=False, planet_mask=False,
+                                             moon_mask=False, zenith_mask=False)
+            for key in mags:
+                if key not in skybrightness:
+                    skybrightness[key] = np.empty(alts.shape, dtype=float)
+                skybrightness[key][i, :] = match_hp_resolution(mags[key], nside_out=self.nside)
+        self.conditions.future_skybrightness = skybrightness
+
+        return self.conditions
+
     @property
     def mjd(self):
         return self._mjd
@@ -3,7 +3,8 @@ from builtins import object
 import numpy as np
 import healpy as hp
 from lsst.sims.utils import _hpid2RaDec
-from lsst.sims.featureScheduler.utils import hp_in_lsst_fov, set_default_nside, hp_in_comcam_fov, int_rounded
+from lsst.sims.featureScheduler.utils import (hp_in_lsst_fov, set_default_nside, hp_in_comcam_fov, int_rounded,
+                                              empty_observation, observation_block)
 from lsst.sims.utils import _approx_RaDec2AltAz, _approx_altaz2pa
 import logging
 
@@ -53,8 +54,11 @@ class Core_scheduler(object):
         else:
             self.log = log.getChild(type(self).__name__)
 
-        # initialize a queue of observations to request
-        self.queue = []
+        # The conditions from the last update_conditions call
+        self.conditions = None
+        # initialize a queue of observations to request. A structured array, with the next
+        # observation first.
+        self.queue = empty_observation(n=0)
         # The indices of self.survey_lists that provided the last addition(s) to the queue
         self.survey_index = [None, None]
 
@@ -78,11 +82,22 @@ class Core_scheduler(object):
         self.flushed = 0
         self.rotator_limits = np.sort(np.radians(rotator_limits))
 
+    @property
+    def queue(self):
+        return self._queue
+
+    @queue.setter
+    def queue(self, value):
+        self._queue = value
+        # Keep the conditions pointing at the current queue, popping rebinds the array
+        if self.conditions is not None:
+            self.conditions.queue = value
+
     def flush_queue(self):
         """"
         Like it sounds, clear any currently queued desired observations.
         """
-        self.queue = []
+        self.queue = empty_observation(n=0)
         self.survey_index = [None, None]
 
     def add_observation(self, observation):
@@ -157,8 +172,9 @@ class Core_scheduler(object):
 
         Returns
         -------
-        observation object (ra,dec,filter,rotangle)
-        Returns None if the queue fails to fill
+        observation : np.array
+            Single row observation array (see empty_observation). Returns None if the
+            queue fails to fill
         """
         if mjd is None:
             mjd = self.conditions.mjd
@@ -175,7 +191,9 @@ class Core_scheduler(object):
                 self._fill_queue()
             if len(self.queue) == 0:
                 return None
-            observation = self.queue.pop(0)
+            # Slicing the front off is a view, no need to shuffle the rest of the queue
+            observation = self.queue[0:1].copy()
+            self.queue = self.queue[1:]
             # If we are limiting the camera rotator
             if self.rotator_limits is not None:
                 alt, az = _approx_RaDec2AltAz(observation['RA'], observation['dec'], self.conditions.site.latitude_rad,
@@ -211,10 +229,10 @@ class Core_scheduler(object):
             # Take a min here, so the surveys will be executed in the order they are
             # entered if there is a tie.
             self.survey_index[1] = np.min(np.where(rewards == np.nanmax(rewards)))
-            # Survey return list of observations
+            # Survey returns a block of observations
             result = self.survey_lists[self.survey_index[0]][self.survey_index[1]].generate_observations(self.conditions)
 
-            self.queue = result
+            self.queue = observation_block(result)
 
         if len(self.queue) == 0:
             self.log.warning('Failed to fill queue')
@@ -1,7 +1,7 @@
 import warnings
 import sys
 import numpy as np
-from lsst.sims.featureScheduler.utils import run_info_table, schema_converter
+from lsst.sims.featureScheduler.utils import run_info_table, schema_converter, columnar_writer
 from lsst.sims.featureScheduler.schedulers import simple_filter_sched
 import time
 import sqlite3
@@ -12,7 +12,7 @@ __all__ = ['sim_runner']
 
 def sim_runner(observatory, scheduler, filter_scheduler=None, mjd_start=None, survey_length=3.,
                filename=None, delete_past=True, n_visit_limit=None, step_none=15., verbose=True,
-               extra_info=None, event_table=None):
+               extra_info=None, event_table=None, columnar_dir=None, columnar_format='npy'):
     """
     run a simulation
 
@@ -26,6 +26,11 @@ def sim_runner(observatory, scheduler, filter_scheduler=None, mjd_start=None, su
         If present, dict gets added onto the information from the observatory model.
     event_table : np.array (None)
         Any ToO events that were included in the simulation
+    columnar_dir : str (None)
+        If set, observations are also written to this directory as they are completed,
+        one column per file (see lsst.sims.featureScheduler.utils.columnar_writer).
+    columnar_format : str ('npy')
+        Format for columnar_dir, 'npy' or 'parquet'.
     """
 
     if extra_info is None:
@@ -33,6 +38,11 @@ def sim_runner(observatory, scheduler, filter_scheduler=None, mjd_start=None, su
 
     t0 = time.time()
 
+    if columnar_dir is not None:
+        writer = columnar_writer(columnar_dir, fmt=columnar_format)
+    else:
+        writer = None
+
     if filter_scheduler is None:
         filter_scheduler = simple_filter_sched()
 
@@ -70,6 +80,8 @@ def sim_runner(observatory, scheduler, filter_scheduler=None, mjd_start=None, su
             scheduler.add_observation(completed_obs[0])
             observations.append(completed_obs)
             filter_scheduler.add_observation(completed_obs[0])
+            if writer is not None:
+                writer.add_observations(completed_obs)
         else:
             # An observation failed to execute, usually it was outside the altitude limits.
             if observatory.mjd == mjd_last_flush:
@@ -102,10 +114,20 @@ def sim_runner(observatory, scheduler, filter_scheduler=None, mjd_start=None, su
     print('Flushed %i observations from queue for being stale' % scheduler.flushed)
     print('Completed %i observations' % len(observations))
     print('ran in %i min = %.1f hours' % (runtime/60., runtime/3600.))
+    offset_time = 0.
+    for surveys in scheduler.survey_lists:
+        for survey in surveys:
+            for detailer in getattr(survey, 'detailers', []):
+                offset_time += getattr(detailer, 'offset_time', 0.)
+    if offset_time > 0:
+        print('spent %.1f s generating dither/rotation offsets' % offset_time)
     print('Writing results to ', filename)
     observations = np.array(observations)[:, 0]
-    if filename is not None:
+    if filename is not None or writer is not None:
         info = run_info_table(observatory, extra_info=extra_info)
+    if writer is not None:
+        writer.close(info=info)
+    if filename is not None:
         converter = schema_converter()
         converter.obs2opsim(observations, filename=filename, info=info, delete_past=delete_past)
     if event_table is not None:
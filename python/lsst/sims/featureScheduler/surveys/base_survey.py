@@ -1,7 +1,7 @@
 import numpy as np
-from lsst.sims.featureScheduler.utils import (empty_observation, set_default_nside,
+from lsst.sims.featureScheduler.utils import (empty_observation, observation_block, set_default_nside,
                                               hp_in_lsst_fov, read_fields, hp_in_comcam_fov,
-                                              comcamTessellate)
+                                              comcamTessellate, smoothing_matrix, sparse_smooth)
 import healpy as hp
 from lsst.sims.featureScheduler.thomson import xyz2thetaphi, thetaphi2xyz
 from lsst.sims.featureScheduler.detailers import Zero_rot_detailer
@@ -9,6 +9,108 @@ from lsst.sims.featureScheduler.detailers import Zero_rot_detailer
 __all__ = ['BaseSurvey', 'BaseMarkovDF_survey']
 
 
+def _hp2fields_map(ra, dec, camera, nside):
+    """Map each healpixel to the field that covers it. Where fields overlap, the
+    field with the highest index wins. Healpixels no field covers map to 0.
+    """
+    hp2fields = np.zeros(hp.nside2npix(nside), dtype=int)
+    if camera == 'LSST':
+        field_indx, hp_indx = hp_in_lsst_fov(nside=nside).query_many(ra, dec)
+        np.maximum.at(hp2fields, hp_indx, field_indx)
+    elif camera == 'comcam':
+        pointing2hpindx = hp_in_comcam_fov(nside=nside)
+        for i in range(len(ra)):
+            hpindx = pointing2hpindx(ra[i], dec[i], rotSkyPos=0.)
+            hp2fields[hpindx] = i
+    return hp2fields
+
+
+def _rotate_fields(fields_init, lon, lat, lon2):
+    """Return a copy of fields_init rotated by lon, then lat about the x-axis, then lon2 (radians).
+    """
+    # rotate longitude
+    ra = (fields_init['RA'] + lon) % (2.*np.pi)
+    dec = fields_init['dec'] + 0
+
+    # Now to rotate ra and dec about the x-axis
+    x, y, z = thetaphi2xyz(ra, dec+np.pi/2.)
+    xp, yp, zp = rotx(lat, x, y, z)
+    theta, phi = xyz2thetaphi(xp, yp, zp)
+    dec = phi - np.pi/2
+    ra = theta + np.pi
+
+    # One more RA rotation
+    ra = (ra + lon2) % (2.*np.pi)
+
+    fields = fields_init.copy()
+    fields['RA'] = ra
+    fields['dec'] = dec
+    return fields
+
+
+def shared_tessellation(fields_init, camera, nside, seed=None, night=None):
+    """The field tessellation and healpix to field map for a night.
+
+    Surveys with the same (night, seed, camera, nside) get the same randomly rotated
+    tessellation, so it is only computed once and shared. The returned arrays are
+    read-only. With night=None, the unrotated tessellation is returned.
+
+    Parameters
+    ----------
+    fields_init : np.array
+        The unrotated field tessellation, with 'RA' and 'dec' columns (radians)
+    camera : str
+        'LSST' or 'comcam'
+    nside : int
+        The healpix nside
+    seed : int (None)
+        Random number seed. The rotation is drawn from np.random.RandomState([seed, night]).
+        Must be set if night is set.
+    night : int (None)
+        The night to rotate the tessellation for.
+
+    Returns
+    -------
+    fields : np.array
+        The (rotated) fields
+    hp2fields : np.array
+        The index of the field covering each healpixel
+    """
+    if night is None:
+        key = (None, None, camera, nside)
+    else:
+        if seed is None:
+            raise ValueError('A seed is needed to share the tessellation for a night')
+        key = (int(night), seed, camera, nside)
+    cache = shared_tessellation.cache
+    if key in cache:
+        return cache[key]
+
+    if night is None:
+        fields = fields_init.copy()
+    else:
+        # Only keep the current night around, plus the unrotated tessellations
+        for old_key in list(cache.keys()):
+            if (old_key[0] is not None) & (old_key[0] != key[0]):
+                del cache[old_key]
+        rng = np.random.RandomState([seed, key[0]])
+        lon = rng.rand()*np.pi*2
+        # Make sure latitude points spread correctly
+        # http://mathworld.wolfram.com/SpherePointPicking.html
+        lat = np.arccos(2.*rng.rand() - 1.)
+        lon2 = rng.rand()*np.pi*2
+        fields = _rotate_fields(fields_init, lon, lat, lon2)
+
+    hp2fields = _hp2fields_map(fields['RA'], fields['dec'], camera, nside)
+    fields.flags.writeable = False
+    hp2fields.flags.writeable = False
+    cache[key] = (fields, hp2fields)
+    return cache[key]
+
+
+shared_tessellation.cache = {}
+
+
 class BaseSurvey(object):
     """A baseclass for survey objects. 
 
@@ -64,6 +166,9 @@ class BaseSurvey(object):
 
         # Attribute to track if the reward function is up-to-date.
         self.reward_checked = False
+        # The conditions version the cached reward was computed for
+        self.reward_version = None
+        self.reward_cache = None
 
         # If there's no detailers, add one to set rotation to near zero
         if detailers is None:
@@ -91,13 +196,14 @@ class BaseSurvey(object):
             for detailer in self.detailers:
                 detailer.add_observation(observation, **kwargs)
             self.reward_checked = False
+            self.reward_version = None
 
     def _check_feasibility(self, conditions):
         """
         Check if the survey is feasable in the current conditions
         """
         for bf in self.basis_functions:
-            result = bf.check_feasibility(conditions)
+            result = bf.is_feasible(conditions)
             if not result:
                 return result
         return result
@@ -129,6 +235,7 @@ class BaseSurvey(object):
         one of:
             1) None
             2) A list of observations
+            3) A structured observation array (see empty_observation)
         """
         # If the reward function hasn't been updated with the
         # latest info, calculate it
@@ -138,7 +245,15 @@ class BaseSurvey(object):
         return [obs]
 
     def generate_observations(self, conditions):
-        observations = self.generate_observations_rough(conditions)
+        """
+        Returns
+        -------
+        observations : np.array
+            Structured observation array (see empty_observation) with one row per
+            observation, after all the detailers have been applied. Previously this was
+            a list of single row arrays. Empty if there is nothing to observe.
+        """
+        observations = observation_block(self.generate_observations_rough(conditions))
         for detailer in self.detailers:
             observations = detailer(observations, conditions)
         return observations
@@ -170,8 +285,9 @@ class BaseMarkovDF_survey(BaseSurvey):
 
     basis_weights : list of float
         Must be same length as basis_function
-    seed : hashable
-        Random number seed, used for randomly orienting sky tessellation.
+    seed : int
+        Random number seed, used for randomly orienting sky tessellation. Surveys with
+        the same seed share the same nightly tessellation.
     camera : str ('LSST')
         Should be 'LSST' or 'comcam'
     area_required : float (None)
@@ -200,12 +316,12 @@ class BaseMarkovDF_survey(BaseSurvey):
             self.fields_init = comcamTessellate()
         else:
             ValueError('camera %s unknown, should be "LSST" or "comcam"' % camera)
-        self.fields = self.fields_init.copy()
-        self.hp2fields = np.array([])
-        self._hp2fieldsetup(self.fields['RA'], self.fields['dec'])
+        self.fields, self.hp2fields = shared_tessellation(self.fields_init, self.camera, self.nside)
+        self.all_indx = np.arange(hp.nside2npix(self.nside))
 
         if smoothing_kernel is not None:
             self.smoothing_kernel = np.radians(smoothing_kernel)
+            self.smoothing_matrix = smoothing_matrix(self.nside, self.smoothing_kernel)
         else:
             self.smoothing_kernel = None
 
@@ -218,40 +334,17 @@ class BaseMarkovDF_survey(BaseSurvey):
         self.night = -1
 
         # Set the seed
+        self.seed = seed
         np.random.seed(seed)
         self.dither = dither
 
-    def _check_feasibility(self, conditions):
-        """
-        Check if the survey is feasable in the current conditions
-        """
-        for bf in self.basis_functions:
-            result = bf.check_feasibility(conditions)
-            if not result:
-                return result
-        if self.area_required is not None:
-            reward = self.calc_reward_function(conditions)
-            good_pix = np.where(np.isfinite(reward) == True)[0]
-            area = hp.nside2pixarea(self.nside) * np.size(good_pix)
-            if area < self.area_required:
-                return False
-        return result
-
-    def _hp2fieldsetup(self, ra, dec, leafsize=100):
+    def _hp2fieldsetup(self, ra, dec):
         """Map each healpixel to nearest field. This will only work if healpix
         resolution is higher than field resolution.
         """
-        if self.camera == 'LSST':
-            pointing2hpindx = hp_in_lsst_fov(nside=self.nside)
-        elif self.camera == 'comcam':
-            pointing2hpindx = hp_in_comcam_fov(nside=self.nside)
+        self.hp2fields = _hp2fields_map(ra, dec, self.camera, self.nside)
 
-        self.hp2fields = np.zeros(hp.nside2npix(self.nside), dtype=np.int)
-        for i in range(len(ra)):
-            hpindx = pointing2hpindx(ra[i], dec[i], rotSkyPos=0.)
-            self.hp2fields[hpindx] = i
-
-    def _spin_fields(self, lon=None, lat=None, lon2=None):
+    def _spin_fields(self, lon=None, lat=None, lon2=None, night=None):
         """Spin the field tessellation to generate a random orientation
 
         The default field tesselation is rotated randomly in longitude, and then the
@@ -266,7 +359,16 @@ class BaseMarkovDF_survey(BaseSurvey):
             The amount to rotate in latitude (radians).
         lon2 : float (None)
             The amount to rotate the pole in longitude (radians).
+        night : int (None)
+            If set, and no angles are given, use the shared tessellation for this night and
+            the survey seed rather than drawing new random angles. Ignored if the survey
+            seed is None, then the angles come from np.random.
         """
+        if (night is not None) & (self.seed is not None) & (lon is None) & (lat is None) & (lon2 is None):
+            self.fields, self.hp2fields = shared_tessellation(self.fields_init, self.camera, self.nside,
+                                                              seed=self.seed, night=night)
+            return
+
         if lon is None:
             lon = np.random.rand()*np.pi*2
         if lat is None:
@@ -275,51 +377,70 @@ class BaseMarkovDF_survey(BaseSurvey):
             lat = np.arccos(2.*np.random.rand() - 1.)
         if lon2 is None:
             lon2 = np.random.rand()*np.pi*2
-        # rotate longitude
-        ra = (self.fields_init['RA'] + lon) % (2.*np.pi)
-        dec = self.fields_init['dec'] + 0
-
-        # Now to rotate ra and dec about the x-axis
-        x, y, z = thetaphi2xyz(ra, dec+np.pi/2.)
-        xp, yp, zp = rotx(lat, x, y, z)
-        theta, phi = xyz2thetaphi(xp, yp, zp)
-        dec = phi - np.pi/2
-        ra = theta + np.pi
-
-        # One more RA rotation
-        ra = (ra + lon2) % (2.*np.pi)
-
-        self.fields['RA'] = ra
-        self.fields['dec'] = dec
-        # Rebuild the kdtree with the new positions
-        # XXX-may be doing some ra,dec to conversions xyz more than needed.
-        self._hp2fieldsetup(ra, dec)
+        self.fields = _rotate_fields(self.fields_init, lon, lat, lon2)
+        self._hp2fieldsetup(self.fields['RA'], self.fields['dec'])
 
     def smooth_reward(self):
         """If we want to smooth the reward function.
         """
         if hp.isnpixok(self.reward.size):
-            # Need to swap NaNs to hp.UNSEEN so smoothing doesn't spread mask
-            reward_temp = self.reward + 0
-            mask = np.isnan(reward_temp)
-            reward_temp[mask] = hp.UNSEEN
-            self.reward_smooth = hp.sphtfunc.smoothing(reward_temp,
-                                                       fwhm=self.smoothing_kernel,
-                                                       verbose=False)
-            self.reward_smooth[mask] = np.nan
+            # Sparse pixel-space convolution, normalized so masked pixels don't spread
+            self.reward_smooth = sparse_smooth(self.reward, self.smoothing_matrix)
             self.reward = self.reward_smooth
-            #good = ~np.isnan(self.reward_smooth)
-            # Round off to prevent strange behavior early on
-            #self.reward_smooth[good] = np.round(self.reward_smooth[good], decimals=4)
+
+    def _sum_basis_functions(self, conditions):
+        """Compute the weighted sum of the basis functions.
+
+        Mask basis functions are evaluated first, over the full map. The remaining basis
+        functions are then only asked for the pixels that survived the masks.
+
+        Returns
+        -------
+        reward : float (or array)
+        """
+        mask_values = {}
+        mask_sum = 0
+        for i, bf in enumerate(self.basis_functions):
+            if bf.is_mask:
+                mask_values[i] = bf(conditions)
+                mask_sum = mask_sum + mask_values[i]
+        if np.size(mask_sum) == self.all_indx.size:
+            indx = np.where(~np.isnan(mask_sum))[0]
+        else:
+            indx = self.all_indx
+
+        # Sum in the original order so the result does not depend on the evaluation order
+        reward = 0
+        for i, (bf, weight) in enumerate(zip(self.basis_functions, self.basis_weights)):
+            if i in mask_values:
+                basis_value = mask_values[i]
+            else:
+                basis_value = bf(conditions, indx=indx)
+            reward += basis_value*weight
+        return reward
 
     def calc_reward_function(self, conditions):
+        """Compute the reward function. Only computed once per conditions version, unless
+        a new observation has been added.
+
+        Parameters
+        ----------
+        conditions : lsst.sims.featureScheduler.features.Conditions object
+
+        Returns
+        -------
+        reward : float (or array)
+        """
+        if self.reward_version != conditions.version:
+            self.reward_cache = self._calc_reward_function(conditions)
+            self.reward_version = conditions.version
+        self.reward = self.reward_cache
         self.reward_checked = True
+        return self.reward
+
+    def _calc_reward_function(self, conditions):
         if self._check_feasibility(conditions):
-            self.reward = 0
-            indx = np.arange(hp.nside2npix(self.nside))
-            for bf, weight in zip(self.basis_functions, self.basis_weights):
-                basis_value = bf(conditions, indx=indx)
-                self.reward += basis_value*weight
+            self.reward = self._sum_basis_functions(conditions)
 
             if np.any(np.isinf(self.reward)):
                 self.reward = np.inf
@@ -337,13 +458,36 @@ class BaseMarkovDF_survey(BaseSurvey):
 
         return self.reward
 
+    def calc_future_reward(self, conditions):
+        """Compute the reward function at all the times in conditions.future_mjd.
+
+        Basis functions that can't look ahead contribute their current value at every time.
+
+        Returns
+        -------
+        reward : np.array
+            Array of shape (n_times, npix). -np.inf everywhere if the survey is not feasible now.
+        """
+        n_times = np.size(conditions.future_mjd)
+        if not self._check_feasibility(conditions):
+            result = np.empty((n_times, self.all_indx.size), dtype=float)
+            result.fill(-np.inf)
+            return result
+        reward = np.zeros((n_times, self.all_indx.size), dtype=float)
+        for bf, weight in zip(self.basis_functions, self.basis_weights):
+            basis_value = bf.calc_future_value(conditions)
+            if basis_value is None:
+                basis_value = bf(conditions)
+            reward += basis_value*weight
+        return reward
+
     def generate_observations_rough(self, conditions):
 
         self.reward = self.calc_reward_function(conditions)
 
         # Check if we need to spin the tesselation
         if self.dither & (conditions.night != self.night):
-            self._spin_fields()
+            self._spin_fields(night=conditions.night)
             self.night = conditions.night.copy()
 
         # XXX Use self.reward to decide what to observe.
@@ -1,6 +1,5 @@
 import numpy as np
 from lsst.sims.featureScheduler.surveys import BaseSurvey
-import copy
 import lsst.sims.featureScheduler.basis_functions as basis_functions
 from lsst.sims.featureScheduler.utils import empty_observation
 from lsst.sims.featureScheduler import features
@@ -8,7 +7,7 @@ import logging
 import random
 
 
-__all__ = ['Deep_drilling_survey', 'generate_dd_surveys', 'dd_bfs']
+__all__ = ['Deep_drilling_survey', 'Deep_drilling_group_survey', 'generate_dd_surveys', 'dd_bfs']
 
 log = logging.getLogger(__name__)
 
@@ -84,6 +83,9 @@ class Deep_drilling_survey(BaseSurvey):
         self.approx_time = np.sum(self.observations['exptime']+readtime*self.observations['nexp'])/3600./24. \
                            + filter_change_time*n_filter_change/3600./24.  # to days
 
+        # Sequences already filtered and ordered for a set of mounted filters and current filter
+        self.templates = {}
+
         if self.reward_value is None:
             self.extra_features['Ntot'] = features.N_obs_survey()
             self.extra_features['N_survey'] = features.N_obs_survey(note=self.survey_name)
@@ -114,27 +116,114 @@ class Deep_drilling_survey(BaseSurvey):
                 result = self.extra_features['Ntot'].feature / (self.extra_features['N_survey'].feature+1)
         return result
 
+    def _sequence_template(self, mounted_filters, current_filter):
+        """The observation sequence with unmounted filters removed and the current filter first.
+
+        Templates are made once for each (mounted filters, current filter) combination.
+        """
+        key = (tuple(mounted_filters), current_filter)
+        if key not in self.templates:
+            # remove filters that are not mounted
+            mask = np.isin(self.observations['filter'], mounted_filters)
+            template = self.observations[mask]
+            # Put current loaded filter first
+            ind1 = np.where(template['filter'] == current_filter)[0]
+            ind2 = np.where(template['filter'] != current_filter)[0]
+            template = template[np.concatenate((ind1, ind2))]
+            template.flags.writeable = False
+            self.templates[key] = template
+        return self.templates[key]
+
     def generate_observations_rough(self, conditions):
-        result = []
+        result = empty_observation(n=0)
         if self._check_feasibility(conditions):
-            result = copy.deepcopy(self.observations)
+            result = self._sequence_template(conditions.mounted_filters, conditions.current_filter).copy()
 
             # Set the flush_by
             result['flush_by_mjd'] = conditions.mjd + self.approx_time + self.flush_pad
 
-            # remove filters that are not mounted
-            mask = np.isin(result['filter'], conditions.mounted_filters)
-            result = result[mask]
-            # Put current loaded filter first
-            ind1 = np.where(result['filter'] == conditions.current_filter)[0]
-            ind2 = np.where(result['filter'] != conditions.current_filter)[0]
-            result = result[ind1.tolist() + (ind2.tolist())]
+        return result
 
-            # convert to list of array. Arglebargle, don't understand why I need a reshape there
-            final_result = [row.reshape(1,) for row in result]
-            result = final_result
 
-        return result
+class Deep_drilling_group_survey(BaseSurvey):
+    """Run several deep drilling surveys as a single survey.
+
+    The hour angle limits of all the fields are checked at once, and only fields that
+    pass have their full feasibility and reward evaluated. The field with the highest
+    reward (the first one if there is a tie) generates the observations.
+
+    Parameters
+    ----------
+    dd_surveys : list of Deep_drilling_survey objects
+        The surveys to group
+    survey_name : str (DD)
+        The name to give this survey
+    """
+    def __init__(self, dd_surveys, survey_name='DD', nside=None):
+        super(Deep_drilling_group_survey, self).__init__(basis_functions=[], nside=nside,
+                                                         survey_name=survey_name)
+        self.dd_surveys = dd_surveys
+        self.best_survey = None
+
+        # Pull out the hour angle limits, so they can be checked for all the fields together
+        self.ra_hours = np.zeros(len(dd_surveys), dtype=float)
+        self.has_ha_limit = np.zeros(len(dd_surveys), dtype=bool)
+        ha_limits = []
+        for i, survey in enumerate(dd_surveys):
+            for bf in survey.basis_functions:
+                if isinstance(bf, basis_functions.Hour_Angle_limit_basis_function):
+                    self.ra_hours[i] = bf.ra_hours
+                    self.has_ha_limit[i] = True
+                    ha_limits.append(np.atleast_2d(bf.HA_limits))
+                    break
+            else:
+                ha_limits.append(np.zeros((0, 2)))
+        n_limits = np.max([limits.shape[0] for limits in ha_limits] + [1])
+        # Pad with empty windows
+        self.ha_low = np.zeros((len(dd_surveys), n_limits), dtype=float)
+        self.ha_high = np.zeros((len(dd_surveys), n_limits), dtype=float)
+        for i, limits in enumerate(ha_limits):
+            self.ha_low[i, 0:limits.shape[0]] = limits[:, 0]
+            self.ha_high[i, 0:limits.shape[0]] = limits[:, 1]
+
+    def add_observation(self, observation, **kwargs):
+        for survey in self.dd_surveys:
+            survey.add_observation(observation, **kwargs)
+        self.reward_checked = False
+        self.reward_version = None
+
+    def _check_ha(self, conditions):
+        """Which fields are inside their hour angle limits.
+        """
+        target_HA = ((conditions.lmst - self.ra_hours) % 24)[:, np.newaxis]
+        in_window = np.any((self.ha_low <= target_HA) & (target_HA < self.ha_high), axis=1)
+        return in_window | ~self.has_ha_limit
+
+    def calc_reward_function(self, conditions):
+        if self.reward_version == conditions.version:
+            self.reward_checked = True
+            return self.reward
+        rewards = np.empty(len(self.dd_surveys), dtype=float)
+        rewards.fill(-np.inf)
+        for i in np.where(self._check_ha(conditions))[0]:
+            rewards[i] = np.nanmax(self.dd_surveys[i].calc_reward_function(conditions))
+        rewards[np.isnan(rewards)] = -np.inf
+        best = np.max(rewards)
+        if best > -np.inf:
+            self.best_survey = np.min(np.where(rewards == best)[0])
+        else:
+            self.best_survey = None
+        self.reward = best
+        self.reward_version = conditions.version
+        self.reward_checked = True
+        return self.reward
+
+    def generate_observations(self, conditions):
+        # Make sure the best field was picked for these conditions
+        self.calc_reward_function(conditions)
+        if self.best_survey is None:
+            return empty_observation(n=0)
+        return self.dd_surveys[self.best_survey].generate_observations(conditions)
 
 
 def dd_bfs(RA, dec, survey_name, ha_limits, frac_total=0.0185/2., aggressive_frac=0.011/2.,
@@ -163,11 +252,16 @@ def dd_bfs(RA, dec, survey_name, ha_limits, frac_total=0.0185/2., aggressive_fra
 
 def generate_dd_surveys(nside=None, nexp=2, detailers=None, euclid_detailers=None, reward_value=100,
                         frac_total=0.0185/2., aggressive_frac=0.011/2., exptime=30, u_exptime=30,
-                        nvis_master=[8, 20, 10, 20, 26, 20], delays=[0., 0.5, 1.5]):
+                        nvis_master=[8, 20, 10, 20, 26, 20], delays=[0., 0.5, 1.5], group=False):
     """Utility to return a list of standard deep drilling field surveys.
 
     XXX-Someone double check that I got the coordinates right!
 
+    Parameters
+    ----------
+    group : bool (False)
+        If True, return a single Deep_drilling_group_survey that runs all the fields.
+
     """
 
     if euclid_detailers is None:
@@ -254,4 +348,7 @@ def generate_dd_surveys(nside=None, nexp=2, detailers=None, euclid_detailers=Non
                                         survey_name=survey_name, reward_value=reward_value, nside=nside,
                                         nexp=nexp, detailers=euclid_detailers))
 
+    if group:
+        surveys = [Deep_drilling_group_survey(surveys, nside=nside)]
+
     return surveys
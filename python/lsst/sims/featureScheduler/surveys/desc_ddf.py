@@ -88,7 +88,7 @@ class DESC_ddf(BaseSurvey):
 
         # The usual basis function checks
         for bf in self.basis_functions:
-            result = bf.check_feasibility(conditions)
+            result = bf.is_feasible(conditions)
             if not result:
                 return result
         return result
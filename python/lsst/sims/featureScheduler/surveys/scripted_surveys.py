@@ -44,20 +44,23 @@ class Scripted_survey(BaseSurvey):
             self.reward_checked = False
 
             # was it taken in the right time window, and hasn't already been marked as observed.
-            time_matches = np.where((observation['mjd'] > self.mjd_start) &
-                                    (observation['mjd'] < self.obs_wanted['flush_by_mjd']) &
-                                    (~self.obs_wanted['observed']) &
-                                    (observation['note'] == self.obs_wanted['note']))[0]
-            for match in time_matches:
-                distances = _angularSeparation(self.obs_wanted[match]['RA'],
-                                               self.obs_wanted[match]['dec'],
-                                               observation['RA'], observation['dec'])
-                if (distances < self.obs_wanted[match]['dist_tol']) & \
-                   (self.obs_wanted[match]['filter'] == observation['filter']):
+            obs_mjd = np.max(observation['mjd'])
+            note_code = self.note_codes.get(np.atleast_1d(observation['note'])[0])
+            if note_code is None:
+                return
+            in_window = self._update_window(obs_mjd)
+            time_matches = in_window[self.row_note_codes[in_window] == note_code]
+            if np.size(time_matches) > 0:
+                distances = _angularSeparation(self.obs_wanted['RA'][time_matches],
+                                               self.obs_wanted['dec'][time_matches],
+                                               np.max(observation['RA']), np.max(observation['dec']))
+                good = np.where((distances < self.obs_wanted['dist_tol'][time_matches]) &
+                                (self.obs_wanted['filter'][time_matches] ==
+                                 np.atleast_1d(observation['filter'])[0]))[0]
+                if np.size(good) > 0:
                     # Log it as observed.
-                    self.obs_wanted['observed'][match] = True
+                    self.obs_wanted['observed'][time_matches[good[0]]] = True
                     self.scheduled_obs = self.obs_wanted['mjd'][~self.obs_wanted['observed']]
-                    break
 
     def calc_reward_function(self, conditions):
         """If there is an observation ready to go, execute it, otherwise, -inf
@@ -98,14 +101,42 @@ class Scripted_survey(BaseSurvey):
                             ((HA > observation['HA_max']) | (HA < observation['HA_min'])))[0]
         return in_range
 
+    def _update_window(self, mjd):
+        """Find the scheduled observations that have started, but not been flushed or observed.
+
+        The scheduled observations are indexed by start time, and a cursor is moved along as
+        time advances, so only observations entering or leaving the window get touched. If time
+        goes backwards the window is rebuilt.
+
+        Parameters
+        ----------
+        mjd : float
+            The MJD to find the window for
+
+        Returns
+        -------
+        indx : np.array
+            Indices into obs_wanted of the observations in the window, in increasing order.
+        """
+        if mjd < self.window_mjd:
+            self.start_cursor = 0
+            self.active = np.array([], dtype=int)
+        new_cursor = np.searchsorted(self.sorted_start, mjd, side='left')
+        if new_cursor > self.start_cursor:
+            self.active = np.union1d(self.active, self.start_order[self.start_cursor:new_cursor])
+            self.start_cursor = new_cursor
+        still_active = (self.obs_wanted['flush_by_mjd'][self.active] > mjd) & \
+                       (~self.obs_wanted['observed'][self.active])
+        self.active = self.active[still_active]
+        self.window_mjd = mjd
+        return self.active
+
     def _check_list(self, conditions):
         """Check to see if the current mjd is good
         """
 
         # Scheduled observations that are in the right time window and have not been executed
-        in_time_window = np.where((self.mjd_start < conditions.mjd) &
-                                  (self.obs_wanted['flush_by_mjd'] > conditions.mjd) &
-                                  (~self.obs_wanted['observed']))[0]
+        in_time_window = self._update_window(conditions.mjd)
 
         if np.size(in_time_window) > 0:
             pass_checks = self._check_alts_HA(self.obs_wanted[in_time_window], conditions)
@@ -138,6 +169,15 @@ class Scripted_survey(BaseSurvey):
 
         self.obs_wanted.sort(order='mjd')
         self.mjd_start = self.obs_wanted['mjd'] - self.obs_wanted['mjd_tol']
+        # Index on start time, so the time window can be found by moving a cursor
+        self.start_order = np.argsort(self.mjd_start, kind='stable')
+        self.sorted_start = self.mjd_start[self.start_order]
+        self.start_cursor = 0
+        self.active = np.array([], dtype=int)
+        self.window_mjd = -np.inf
+        # Group the scheduled observations by note
+        unotes, self.row_note_codes = np.unique(self.obs_wanted['note'], return_inverse=True)
+        self.note_codes = dict(zip(unotes, range(unotes.size)))
         # Here is the atribute that core scheduler checks to broadcast scheduled observations
         # in the conditions object.
         self.scheduled_obs = self.obs_wanted['mjd']
@@ -168,10 +208,11 @@ class Pairs_survey_scripted(Scripted_survey):
             nside = set_default_nside()
 
         super(Pairs_survey_scripted, self).__init__(basis_functions=basis_functions,
-                                                    ignore_obs=ignore_obs, min_alt=min_alt,
-                                                    max_alt=max_alt, nside=nside)
+                                                    ignore_obs=ignore_obs, nside=nside)
 
         self.lat = np.radians(lat)
+        self.min_alt = np.radians(min_alt)
+        self.max_alt = np.radians(max_alt)
         self.note = note
         self.ttol = ttol/60./24.
         self.dt = dt/60./24.  # To days
@@ -183,19 +224,73 @@ class Pairs_survey_scripted(Scripted_survey):
 
         self.reward_val = reward_val
         self.filt_to_pair = filt_to_pair
-        # list to hold observations
-        self.observing_queue = []
+        # Queue of observations waiting for a pair, kept sorted by the MJD we want the
+        # pair observed. Live entries are queue[queue_head:queue_head+queue_size].
+        self.queue = empty_observation()
+        self.queue = np.resize(self.queue, 64)
+        self.queue_head = 0
+        self.queue_size = 0
         # make ignore_obs a list
         if type(self.ignore_obs) is str:
             self.ignore_obs = [self.ignore_obs]
 
+    @property
+    def observing_queue(self):
+        """The observations waiting for a pair, in MJD order.
+        """
+        return self.queue[self.queue_head:self.queue_head+self.queue_size]
+
+    def _queue_insert(self, observation):
+        """Insert an observation, keeping the queue sorted by MJD.
+        """
+        end = self.queue_head + self.queue_size
+        if end == self.queue.size:
+            # Out of room at the end. Shift the live entries to the front, growing if needed.
+            live = self.queue[self.queue_head:end].copy()
+            if self.queue_size*2 > self.queue.size:
+                self.queue = np.resize(self.queue, self.queue.size*2)
+            self.queue[0:self.queue_size] = live
+            self.queue_head = 0
+            end = self.queue_size
+        # Pairs are usually added in time order, so this is almost always the end
+        pos = self.queue_head + np.searchsorted(self.queue['mjd'][self.queue_head:end],
+                                                observation['mjd'], side='right')
+        self.queue[pos+1:end+1] = self.queue[pos:end]
+        self.queue[pos] = observation
+        self.queue_size += 1
+
+    def _queue_remove(self, indx):
+        """Remove entries from the queue.
+
+        Parameters
+        ----------
+        indx : np.array
+            Indices relative to the queue head
+        """
+        if np.size(indx) == 0:
+            return
+        keep = np.ones(self.queue_size, dtype=bool)
+        keep[indx] = False
+        n_keep = np.sum(keep)
+        if keep[0:self.queue_size-n_keep].sum() == 0:
+            # Only removing things from the front, just move the head
+            self.queue_head += self.queue_size - n_keep
+        else:
+            live = self.observing_queue[keep]
+            self.queue[self.queue_head:self.queue_head+n_keep] = live
+        self.queue_size = n_keep
+        if self.queue_size == 0:
+            self.queue_head = 0
+
     def add_observation(self, observation, indx=None, **kwargs):
         """Add an observed observation
         """
         # self.ignore_obs not in str(observation['note'])
         to_ignore = np.any([ignore in str(observation['note']) for ignore in self.ignore_obs])
-        log.debug('[Pairs.add_observation]: %s: %s: %s', to_ignore, str(observation['note']), self.ignore_obs)
-        log.debug('[Pairs.add_observation.queue]: %s', self.observing_queue)
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug('[Pairs.add_observation]: %s: %s: %s', to_ignore, str(observation['note']), self.ignore_obs)
+            log.debug('[Pairs.add_observation.queue]: %s', self.observing_queue)
         if not to_ignore:
             # Update my extra features:
             for feature in self.extra_features:
@@ -206,148 +301,149 @@ class Pairs_survey_scripted(Scripted_survey):
             # Check if this observation needs a pair
             # XXX--only supporting single pairs now. Just start up another scripted survey
             # to grab triples, etc? Or add two observations to queue at a time?
-            # keys_to_copy = ['RA', 'dec', 'filter', 'exptime', 'nexp']
             if ((observation['filter'][0] in self.filt_to_pair) and
                     (np.max(self.extra_features['Pair_map'].feature[indx]) < 1)):
                 obs_to_queue = empty_observation()
-                for key in observation.dtype.names:
-                    obs_to_queue[key] = observation[key]
+                if observation.dtype == obs_to_queue.dtype:
+                    obs_to_queue[0] = observation[0]
+                else:
+                    for key in observation.dtype.names:
+                        obs_to_queue[key] = observation[key]
                 # Fill in the ideal time we would like this observed
-                log.debug('Observation MJD: %.4f (dt=%.4f)', obs_to_queue['mjd'], self.dt)
+                log.debug('Observation MJD: %.4f (dt=%.4f)', obs_to_queue['mjd'][0], self.dt)
                 obs_to_queue['mjd'] += self.dt
-                self.observing_queue.append(obs_to_queue)
-        log.debug('[Pairs.add_observation.queue.size]: %i', len(self.observing_queue))
-        for obs in self.observing_queue:
-            log.debug('[Pairs.add_observation.queue]: %s', obs)
+                self._queue_insert(obs_to_queue[0])
+        if debug:
+            log.debug('[Pairs.add_observation.queue.size]: %i', self.queue_size)
+            for obs in self.observing_queue:
+                log.debug('[Pairs.add_observation.queue]: %s', obs)
 
     def _purge_queue(self, conditions):
-        """Remove any pair where it's too late to observe it
+        """Remove any pair where it's too late to observe it, or that is in the time window
+        but masked or outside the altitude limits.
         """
-        # Assuming self.observing_queue is sorted by MJD.
-        if len(self.observing_queue) > 0:
-            stale = True
-            in_window = np.abs(self.observing_queue[0]['mjd']-conditions.mjd) < self.ttol
-            log.debug('Purging queue')
-            while stale:
-                # If the next observation in queue is past the window, drop it
-                if (self.observing_queue[0]['mjd'] < conditions.mjd) & (~in_window):
-                    log.debug('Past the window: obs_mjd=%.4f (current_mjd=%.4f)',
-                              self.observing_queue[0]['mjd'],
-                              conditions.mjd)
-                    del self.observing_queue[0]
-                # If we are in the window, but masked, drop it
-                elif (in_window) & (~self._check_mask(self.observing_queue[0], conditions)):
-                    log.debug('Masked')
-                    del self.observing_queue[0]
-                # If in time window, but in alt exclusion zone
-                elif (in_window) & (~self._check_alts(self.observing_queue[0], conditions)):
-                    log.debug('in alt exclusion zone')
-                    del self.observing_queue[0]
-                else:
-                    stale = False
-                # If we have deleted everything, break out of where
-                if len(self.observing_queue) == 0:
-                    stale = False
+        if self.queue_size == 0:
+            return
+        queue = self.observing_queue
+        # Queue is sorted by MJD, so only need to look up to the end of the time window
+        n_check = np.searchsorted(queue['mjd'], conditions.mjd + self.ttol, side='left')
+        if n_check == 0:
+            return
+        queue = queue[0:n_check]
+        in_window = np.abs(queue['mjd']-conditions.mjd) < self.ttol
+        too_late = (queue['mjd'] < conditions.mjd) & (~in_window)
+        stale = too_late.copy()
+        if np.any(in_window):
+            window_indx = np.where(in_window)[0]
+            good = self._check_mask(queue[window_indx], conditions) & \
+                self._check_alts(queue[window_indx], conditions)
+            stale[window_indx[~good]] = True
+        to_drop = np.where(stale)[0]
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('Purging queue, dropping %i past the window and %i masked or out of alt range',
+                      np.sum(too_late), to_drop.size - np.sum(too_late))
+        self._queue_remove(to_drop)
 
     def _check_alts(self, observation, conditions):
-        result = False
-        # Just do a fast ra,dec to alt,az conversion. Can use LMST from a feature.
+        """Check which observations are within the altitude limits.
 
+        Returns
+        -------
+        result : np.array of bool
+        """
+        # Just do a fast ra,dec to alt,az conversion. Can use LMST from a feature.
         alt, az = _approx_RaDec2AltAz(observation['RA'], observation['dec'],
                                       self.lat, None,
                                       conditions.mjd,
                                       lmst=conditions.lmst)
-        in_range = np.where((alt < self.max_alt) & (alt > self.min_alt))[0]
-        if np.size(in_range) > 0:
-            result = True
+        result = (alt < self.max_alt) & (alt > self.min_alt)
         return result
 
     def _check_mask(self, observation, conditions):
-        """Check that the proposed observation is not currently masked for some reason on the sky map.
+        """Check that the proposed observations are not currently masked for some reason on the sky map.
         True if the observation is good to observe
         False if the proposed observation is masked
-        """
-
-        hpid = np.max(_raDec2Hpid(self.nside, observation['RA'], observation['dec']))
-        skyval = conditions.M5Depth[observation['filter'][0]][hpid]
 
-        if skyval > 0:
-            return True
-        else:
-            return False
-
-    def calc_reward_function(self, conditions):
-        self._purge_queue(conditions)
-        result = -np.inf
-        self.reward = result
-        log.debug('Pair - calc_reward_func')
-        for indx in range(len(self.observing_queue)):
+        Returns
+        -------
+        result : np.array of bool
+        """
+        hpid = _raDec2Hpid(self.nside, observation['RA'], observation['dec'])
+        result = np.zeros(np.size(hpid), dtype=bool)
+        for filtername in np.unique(observation['filter']):
+            in_filt = np.where(observation['filter'] == filtername)[0]
+            skyval = conditions.M5Depth[filtername][hpid[in_filt]]
+            result[in_filt] = skyval > 0
+        return result
 
-            check = self._check_observation(self.observing_queue[indx], conditions)
-            log.debug('%s: %s', check, self.observing_queue[indx])
-            if check[0]:
-                result = self.reward_val
-                self.reward = self.reward_val
-                break
-            elif not check[1]:
-                break
+    def _check_queue(self, conditions):
+        """Find the first observation in the queue we should try to pair now.
 
-        self.reward_checked = True
-        return result
+        Mirrors walking the queue in MJD order: stop at the first valid observation, or at
+        the first one outside the time window.
 
-    def _check_observation(self, observation, conditions):
-
-        delta_t = observation['mjd'] - conditions.mjd
-        log.debug('Check_observation: obs_mjd=%.4f (current_mjd=%.4f, delta=%.4f, tol=%.4f)',
-                  observation['mjd'],
-                  conditions.mjd,
-                  delta_t,
-                  self.ttol)
-        obs_hp = _raDec2Hpid(self.nside, observation['RA'], observation['dec'])
-        slewtime = conditions.slewtime[obs_hp[0]]
-        in_slew_window = slewtime <= self.max_slew_to_pair or delta_t < 0.
+        Returns
+        -------
+        indx : int or None
+            Index (relative to the queue head) of the observation to take, None if there isn't one.
+        """
+        if self.queue_size == 0:
+            return None
+        queue = self.observing_queue
+        delta_t = queue['mjd'] - conditions.mjd
         in_time_window = np.abs(delta_t) < self.ttol
+        # Only need to check up to the first one outside the time window
+        outside = np.where(~in_time_window)[0]
+        if outside.size > 0:
+            queue = queue[0:outside[0]]
+            delta_t = delta_t[0:outside[0]]
+        if queue.size == 0:
+            return None
 
         if conditions.current_filter is None:
             infilt = True
         else:
             infilt = conditions.current_filter in self.filt_to_pair
+        if not infilt:
+            return None
+
+        obs_hp = _raDec2Hpid(self.nside, queue['RA'], queue['dec'])
+        slewtime = conditions.slewtime[obs_hp]
+        in_slew_window = (slewtime <= self.max_slew_to_pair) | (delta_t < 0.)
+        is_observable = self._check_mask(queue, conditions)
+        valid = np.where(in_slew_window & is_observable)[0]
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('Pair - checked %i observations in the time window, %i valid', queue.size, valid.size)
+        if valid.size == 0:
+            return None
+        return valid[0]
 
-        is_observable = self._check_mask(observation, conditions)
-        valid = in_time_window & infilt & in_slew_window & is_observable
-        log.debug('Pair - observation: %s ' % observation)
-        log.debug('Pair - check[%s]: in_time_window[%s] infilt[%s] in_slew_window[%s] is_observable[%s]' %
-                  (valid, in_time_window, infilt, in_slew_window, is_observable))
+    def calc_reward_function(self, conditions):
+        self._purge_queue(conditions)
+        log.debug('Pair - calc_reward_func')
+        if self._check_queue(conditions) is None:
+            result = -np.inf
+        else:
+            result = self.reward_val
+        self.reward = result
 
-        return (valid,
-                in_time_window,
-                infilt,
-                in_slew_window,
-                is_observable)
+        self.reward_checked = True
+        return result
 
     def generate_observations(self, conditions):
         # Toss anything in the queue that is too old to pair up:
         self._purge_queue(conditions)
         # Check for something I want a pair of
         result = []
-        # if len(self.observing_queue) > 0:
         log.debug('Pair - call')
-        for indx in range(len(self.observing_queue)):
-
-            check = self._check_observation(self.observing_queue[indx], conditions)
-
-            if check[0]:
-                result = self.observing_queue.pop(indx)
-                result['note'] = 'pair(%s)' % self.note
-                # Make sure we don't change filter if we don't have to.
-                if conditions.current_filter is not None:
-                    result['filter'] = conditions.current_filter
-                # Make sure it is observable!
-                # if self._check_mask(result):
-                result = [result]
-                break
-            elif not check[1]:
-                # If this is not in time window and queue is chronological, none will be...
-                break
+        indx = self._check_queue(conditions)
+        if indx is not None:
+            result = self.observing_queue[indx:indx+1].copy()
+            self._queue_remove([indx])
+            result['note'] = 'pair(%s)' % self.note
+            # Make sure we don't change filter if we don't have to.
+            if conditions.current_filter is not None:
+                result['filter'] = conditions.current_filter
+            result = [result]
 
         return result
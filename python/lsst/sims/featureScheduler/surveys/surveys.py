@@ -3,7 +3,7 @@ from lsst.sims.featureScheduler.utils import (empty_observation, set_default_nsi
 import healpy as hp
 import matplotlib.pylab as plt
 from lsst.sims.featureScheduler.surveys import BaseMarkovDF_survey
-from lsst.sims.featureScheduler.utils import (int_binned_stat, int_rounded,
+from lsst.sims.featureScheduler.utils import (hp_disc_neighbors, nan_top_k, int_round, int_between,
                                               gnomonic_project_toxy, tsp_convex)
 import copy
 from lsst.sims.utils import _angularSeparation, _hpid2RaDec, _approx_RaDec2AltAz, hp_grow_argsort
@@ -45,35 +45,22 @@ class Greedy_survey(BaseMarkovDF_survey):
 
         # Check if we need to spin the tesselation
         if self.dither & (conditions.night != self.night):
-            self._spin_fields()
+            self._spin_fields(night=conditions.night)
             self.night = conditions.night.copy()
 
         # Let's find the best N from the fields
-        order = np.argsort(self.reward)[::-1]
-        # Crop off any NaNs
-        order = order[~np.isnan(self.reward[order])]
-
-        iter = 0
-        while True:
-            best_hp = order[iter*self.block_size:(iter+1)*self.block_size]
-            best_fields = np.unique(self.hp2fields[best_hp])
-            observations = []
-            for field in best_fields:
-                obs = empty_observation()
-                obs['RA'] = self.fields['RA'][field]
-                obs['dec'] = self.fields['dec'][field]
-                obs['rotSkyPos'] = 0.
-                obs['filter'] = self.filtername
-                obs['nexp'] = self.nexp
-                obs['exptime'] = self.exptime
-                obs['field_id'] = -1
-                obs['note'] = self.survey_name
-
-                observations.append(obs)
-                break
-            iter += 1
-            if len(observations) > 0 or (iter+2)*self.block_size > len(order):
-                break
+        best_hp = nan_top_k(self.reward, self.block_size)
+        best_fields = np.unique(self.hp2fields[best_hp])
+        # Only the first field is used
+        observations = empty_observation(n=min(best_fields.size, 1))
+        observations['RA'] = self.fields['RA'][best_fields[0:1]]
+        observations['dec'] = self.fields['dec'][best_fields[0:1]]
+        observations['rotSkyPos'] = 0.
+        observations['filter'] = self.filtername
+        observations['nexp'] = self.nexp
+        observations['exptime'] = self.exptime
+        observations['field_id'] = -1
+        observations['note'] = self.survey_name
         return observations
 
 
@@ -176,6 +163,10 @@ class Blob_survey(Greedy_survey):
             self.filter2_set = set(filtername2)
 
         self.ra, self.dec = _hpid2RaDec(self.nside, self.hpids)
+        # Never change, so mark them read-only and copies of the survey can share them
+        self.hpids.flags.writeable = False
+        self.ra.flags.writeable = False
+        self.dec.flags.writeable = False
 
         self.survey_note = survey_note
         self.counter = 1  # start at 1, because 0 is default in empty observation
@@ -184,6 +175,13 @@ class Blob_survey(Greedy_survey):
         self.search_radius = np.radians(search_radius)
         self.az_range = np.radians(az_range)
         self.alt_max = np.radians(alt_max)
+        # Fixed-point versions of the limits for deterministic comparisons
+        self.search_radius_rounded = int_round(self.search_radius)
+        # Pixels within search_radius of every pixel, shared with other Blobs of the same radius.
+        # None if the table would be too large, then neighbors are found for each peak.
+        self.disc_indptr, self.disc_indices = hp_disc_neighbors(self.nside, self.search_radius)
+        self.alt_max_rounded = int_round(self.alt_max)
+        self.az_limits_rounded = (int_round(self.az_range/2.), int_round(2.*np.pi-self.az_range/2.))
         self.min_pair_time = min_pair_time
         self.ideal_pair_time = ideal_pair_time
 
@@ -198,16 +196,14 @@ class Blob_survey(Greedy_survey):
         Check if the survey is feasable in the current conditions.
         """
         for bf in self.basis_functions:
-            result = bf.check_feasibility(conditions)
+            result = bf.is_feasible(conditions)
             if not result:
                 return result
 
         # If we need to check that the reward function has enough area available
         if self.min_area is not None:
-            reward = 0
-            for bf, weight in zip(self.basis_functions, self.basis_weights):
-                basis_value = bf(conditions)
-                reward += basis_value*weight
+            # Basis function values are cached, so calc_reward_function won't recompute them
+            reward = self._sum_basis_functions(conditions)
             valid_pix = np.where(np.isnan(reward) == False)[0]
             if np.size(valid_pix)*self.pixarea < self.min_area:
                 result = False
@@ -263,29 +259,22 @@ class Blob_survey(Greedy_survey):
         if self.nvisit_block <= 0:
             self.nvisit_block = 1
 
-    def calc_reward_function(self, conditions):
+    def _calc_reward_function(self, conditions):
         """
         """
         # Set the number of observations we are going to try and take
         self._set_block_size(conditions)
         #  Computing reward like usual with basis functions and weights
         if self._check_feasibility(conditions):
-            self.reward = 0
-            indx = np.arange(hp.nside2npix(self.nside))
-            for bf, weight in zip(self.basis_functions, self.basis_weights):
-                basis_value = bf(conditions, indx=indx)
-                self.reward += basis_value*weight
-                # might be faster to pull this out into the feasabiliity check?
+            self.reward = self._sum_basis_functions(conditions)
             if self.smoothing_kernel is not None:
                 self.smooth_reward()
 
             # Apply max altitude cut
-            too_high = np.where(int_rounded(conditions.alt) > int_rounded(self.alt_max))
+            too_high = np.where(int_round(conditions.alt) > self.alt_max_rounded)
             self.reward[too_high] = np.nan
 
             # Select healpixels within some radius of the max
-            # This is probably faster with a kd-tree.
-
             max_hp = np.where(self.reward == np.nanmax(self.reward))[0]
             if np.size(max_hp) > 0:
                 peak_reward = np.min(max_hp)
@@ -294,17 +283,21 @@ class Blob_survey(Greedy_survey):
                 return -np.inf
 
             # Apply radius selection
-            dists = _angularSeparation(self.ra[peak_reward], self.dec[peak_reward], self.ra, self.dec)
-            out_hp = np.where(int_rounded(dists) > int_rounded(self.search_radius))
-            self.reward[out_hp] = np.nan
+            if self.disc_indptr is not None:
+                neighbors = self.disc_indices[self.disc_indptr[peak_reward]:self.disc_indptr[peak_reward+1]]
+            else:
+                dists = _angularSeparation(self.ra[peak_reward], self.dec[peak_reward], self.ra, self.dec)
+                neighbors = np.where(int_round(dists) <= self.search_radius_rounded)[0]
 
-            # Apply az cut
-            az_centered = conditions.az - conditions.az[peak_reward]
+            # Apply az cut, only needed for pixels in the radius
+            az_centered = conditions.az[neighbors] - conditions.az[peak_reward]
             az_centered[np.where(az_centered < 0)] += 2.*np.pi
+            neighbors = neighbors[~int_between(az_centered, *self.az_limits_rounded)]
 
-            az_out = np.where((int_rounded(az_centered) > int_rounded(self.az_range/2.)) &
-                              (int_rounded(az_centered) < int_rounded(2.*np.pi-self.az_range/2.)))
-            self.reward[az_out] = np.nan
+            reward = np.empty(self.reward.size, dtype=float)
+            reward.fill(np.nan)
+            reward[neighbors] = self.reward[neighbors]
+            self.reward = reward
         else:
             self.reward = -np.inf
 
@@ -316,7 +309,6 @@ class Blob_survey(Greedy_survey):
         #if ('twi' in self.survey_note) & (np.any(np.isfinite(self.reward))):
         #    import pdb ; pdb.set_trace()
 
-        self.reward_checked = True
         return self.reward
 
     def simple_order_sort(self):
@@ -325,22 +317,23 @@ class Blob_survey(Greedy_survey):
 
         # Assuming reward has already been calcualted
 
-        potential_hp = np.where(~np.isnan(self.reward) == True)
+        potential_hp = np.where(~np.isnan(self.reward) == True)[0]
+        if potential_hp.size == 0:
+            self.best_fields = np.array([], dtype=int)
+            return
 
         # Note, using nanmax, so masked pixels might be included in the pointing.
         # I guess I should document that it's not "NaN pixels can't be observed", but
         # "non-NaN pixles CAN be observed", which probably is not intuitive.
-        ufields, reward_by_field = int_binned_stat(self.hp2fields[potential_hp],
-                                                   self.reward[potential_hp],
-                                                   statistic=np.nanmax)
-        # chop off any nans
-        not_nans = np.where(~np.isnan(reward_by_field) == True)
-        ufields = ufields[not_nans]
-        reward_by_field = reward_by_field[not_nans]
-
-        order = np.argsort(reward_by_field)
-        ufields = ufields[order][::-1][0:self.nvisit_block]
-        self.best_fields = ufields
+        # Max reward of each field, from a single sort on field id
+        fields = self.hp2fields[potential_hp]
+        order = np.argsort(fields, kind='stable')
+        fields = fields[order]
+        left = np.concatenate(([0], np.where(np.diff(fields) != 0)[0] + 1))
+        ufields = fields[left]
+        reward_by_field = np.maximum.reduceat(self.reward[potential_hp][order], left)
+
+        self.best_fields = ufields[nan_top_k(reward_by_field, self.nvisit_block)]
 
     def generate_observations_rough(self, conditions):
         """
@@ -351,7 +344,7 @@ class Blob_survey(Greedy_survey):
 
         # Check if we need to spin the tesselation
         if self.dither & (conditions.night != self.night):
-            self._spin_fields()
+            self._spin_fields(night=conditions.night)
             self.night = conditions.night.copy()
 
         if self.grow_blob:
@@ -374,7 +367,7 @@ class Blob_survey(Greedy_survey):
 
         if len(self.best_fields) == 0:
             # everything was nans, or self.nvisit_block was zero
-            return []
+            return empty_observation(n=0)
 
         # Let's find the alt, az coords of the points (right now, hopefully doesn't change much in time block)
         pointing_alt, pointing_az = _approx_RaDec2AltAz(self.fields['RA'][self.best_fields],
@@ -411,33 +404,26 @@ class Blob_survey(Greedy_survey):
         # Leaving optimize=False for speed. The optimization step doesn't usually improve much.
         better_order = tsp_convex(towns, optimize=False)
         # XXX-TODO: Could try to roll better_order to start at the nearest/fastest slew from current position.
-        observations = []
-        counter2 = 0
         approx_end_time = np.size(better_order)*(self.slew_approx + self.exptime +
                                                  self.read_approx*(self.nexp - 1))
         flush_time = conditions.mjd + approx_end_time/3600./24. + self.flush_time
-        for i, indx in enumerate(better_order):
-            field = self.best_fields[indx]
-            obs = empty_observation()
-            obs['RA'] = self.fields['RA'][field]
-            obs['dec'] = self.fields['dec'][field]
-            obs['rotSkyPos'] = 0.
-            obs['filter'] = self.filtername1
-            if self.nexp_dict is None:
-                obs['nexp'] = self.nexp
-            else:
-                obs['nexp'] = self.nexp_dict[self.filtername1]
-            obs['exptime'] = self.exptime
-            obs['field_id'] = -1
-            obs['note'] = '%s' % (self.survey_note)
-            obs['block_id'] = self.counter
-            obs['flush_by_mjd'] = flush_time
-            # Add the mjd for debugging
-            # obs['mjd'] = conditions.mjd
-            # XXX temp debugging line
-            obs['survey_id'] = i
-            observations.append(obs)
-            counter2 += 1
+        fields = self.best_fields[better_order]
+        observations = empty_observation(n=fields.size)
+        observations['RA'] = self.fields['RA'][fields]
+        observations['dec'] = self.fields['dec'][fields]
+        observations['rotSkyPos'] = 0.
+        observations['filter'] = self.filtername1
+        if self.nexp_dict is None:
+            observations['nexp'] = self.nexp
+        else:
+            observations['nexp'] = self.nexp_dict[self.filtername1]
+        observations['exptime'] = self.exptime
+        observations['field_id'] = -1
+        observations['note'] = '%s' % (self.survey_note)
+        observations['block_id'] = self.counter
+        observations['flush_by_mjd'] = flush_time
+        # XXX temp debugging line
+        observations['survey_id'] = np.arange(fields.size)
 
         result = observations
         return result
@@ -1,11 +1,47 @@
 import numpy as np
 from lsst.sims.featureScheduler.surveys import Blob_survey, BaseSurvey
+from lsst.sims.featureScheduler.utils import hp_in_lsst_fov, hp_in_comcam_fov
+from lsst.sims.featureScheduler.basis_functions.mask_basis_funcs import Zenith_shadow_table
+from scipy.spatial import cKDTree
+from scipy import sparse
 import healpy as hp
 import copy
 
 
 __all__ = ['ToO_master', 'ToO_survey']
 
+# Objects that never change after they are built, so spawned surveys can share them
+_shared_types = (cKDTree, sparse.spmatrix, hp_in_lsst_fov, hp_in_comcam_fov, Zenith_shadow_table)
+
+
+def _shared_memo(obj):
+    """Build a deepcopy memo that maps the immutable parts of obj to themselves.
+
+    Passing (a copy of) the result to copy.deepcopy makes the copy share read-only
+    arrays, KD-trees, sparse matrices, and other static helpers with the original,
+    so only the mutable state gets duplicated.
+    """
+    memo = {}
+    seen = set()
+    stack = [obj]
+    while len(stack) > 0:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            if not item.flags.writeable:
+                memo[id(item)] = item
+        elif isinstance(item, _shared_types):
+            memo[id(item)] = item
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set)):
+            stack.extend(item)
+        elif hasattr(item, '__dict__') and not isinstance(item, type):
+            stack.extend(vars(item).values())
+    return memo
+
 
 class ToO_master(BaseSurvey):
     """
@@ -20,6 +56,11 @@ class ToO_master(BaseSurvey):
 
     def __init__(self, example_ToO_survey):
         self.example_ToO_survey = example_ToO_survey
+        self.shared_memo = _shared_memo(example_ToO_survey)
+        # The footprints get replaced by set_target_map, no need to copy them
+        for basis_func in example_ToO_survey.basis_functions:
+            if hasattr(basis_func, 'footprint'):
+                self.shared_memo[id(basis_func.footprint)] = basis_func.footprint
         self.surveys = []
         self.highest_reward = -np.inf
 
@@ -36,7 +77,8 @@ class ToO_master(BaseSurvey):
         ----------
         too : lsst.sims.featureScheduler.utils.TargetoO object
         """
-        new_survey = copy.deepcopy(self.example_ToO_survey)
+        # Only copy the mutable state, share everything else with the example survey
+        new_survey = copy.deepcopy(self.example_ToO_survey, memo=dict(self.shared_memo))
         new_survey.set_id(too.id)
         new_survey.set_target_map(too.footprint)
 
@@ -123,6 +165,8 @@ class ToO_survey(Blob_survey):
         for basis_func in self.basis_functions:
             if hasattr(basis_func, 'footprint'):
                 basis_func.footprint = newmap
+                basis_func.recalc = True
+        self.reward_version = None
 
     def generate_observations_rough(self, conditions):
         # Always spin the tesselation before generating a new block.
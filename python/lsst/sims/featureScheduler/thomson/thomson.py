@@ -5,7 +5,10 @@ from lsst.sims.utils import _angularSeparation
 
 __all__ = ['thetaphi2xyz', 'even_points', 'elec_potential', 'ang_potential', 'fib_sphere_grid',
            'iterate_potential_random', 'iterate_potential_smart', 'even_points_xyz', 'elec_potential_xyz',
-           'xyz2thetaphi']
+           'xyz2thetaphi', 'elec_potential_grad', 'elec_potential_xyz_grad']
+
+# Number of pair distances to hold in memory at once
+_max_pairs_in_memory = 2**22
 
 
 def thetaphi2xyz(theta, phi):
@@ -21,6 +24,54 @@ def xyz2thetaphi(x, y, z):
     return theta, phi
 
 
+def _unit_potential(xyz, grad=False, chunk_size=None):
+    """
+    Potential energy (and optionally its gradient) for points on the unit sphere.
+
+    Rows of points are done a chunk at a time against all the other points, so memory
+    stays at chunk_size*npts rather than npts**2.
+
+    Parameters
+    ----------
+    xyz : array
+        (npts, 3) array of unit vectors
+    grad : bool (False)
+        Also return the gradient of the potential with respect to each point
+    chunk_size : int (None)
+        Number of points to do at a time. Default of None keeps about 4 million pair
+        distances in memory.
+
+    Returns
+    -------
+    U : float
+        Potential energy
+    dU_dxyz : array
+        (npts, 3) gradient, only returned if grad is True
+    """
+    npts = xyz.shape[0]
+    if chunk_size is None:
+        chunk_size = max(1, _max_pairs_in_memory // max(npts, 1))
+    U = 0.
+    if grad:
+        dU_dxyz = np.zeros_like(xyz)
+    for start in range(0, npts, chunk_size):
+        end = min(start + chunk_size, npts)
+        # For unit vectors, |a-b|^2 = 2 - 2 a.b
+        dsq = 2. - 2.*np.dot(xyz[start:end], xyz.T)
+        rows = np.arange(end - start)
+        dsq[rows, rows + start] = np.inf
+        inv_d = 1./np.sqrt(dsq)
+        U += np.sum(inv_d)
+        if grad:
+            inv_d3 = inv_d**3
+            dU_dxyz[start:end] = np.dot(inv_d3, xyz) - xyz[start:end]*np.sum(inv_d3, axis=1)[:, np.newaxis]
+    # Every pair was counted twice
+    U = U/2.
+    if grad:
+        return U, dU_dxyz
+    return U
+
+
 def elec_potential(x0):
     """
     Compute the potential energy for electrons on a sphere
@@ -38,20 +89,41 @@ def elec_potential(x0):
     theta = x0[0:int(x0.size/2)]
     phi = x0[int(x0.size/2):]
 
-    x, y, z = thetaphi2xyz(theta, phi)
-    # Distance squared
-    dsq = 0.
+    xyz = np.array(thetaphi2xyz(theta, phi)).T
+    return _unit_potential(xyz)
 
-    indices = np.triu_indices(x.size, k=1)
 
-    for coord in [x, y, z]:
-        coord_i = np.tile(coord, (coord.size, 1))
-        coord_j = coord_i.T
-        d = (coord_i[indices]-coord_j[indices])**2
-        dsq += d
+def elec_potential_grad(x0, chunk_size=None):
+    """
+    Compute the potential energy for electrons on a sphere and its gradient
 
-    U = np.sum(1./np.sqrt(dsq))
-    return U
+    Parameters
+    ----------
+    x0 : array
+       First half of x0 or theta values, secnd half phi
+    chunk_size : int (None)
+        Number of points to compute at a time (see _unit_potential)
+
+    Returns
+    -------
+    U : float
+        Potential energy
+    grad : array
+        Derivative of U with respect to x0
+    """
+    theta = x0[0:int(x0.size/2)]
+    phi = x0[int(x0.size/2):]
+
+    xyz = np.array(thetaphi2xyz(theta, phi)).T
+    U, dU_dxyz = _unit_potential(xyz, grad=True, chunk_size=chunk_size)
+
+    sin_theta = np.sin(theta)
+    cos_theta = np.cos(theta)
+    sin_phi = np.sin(phi)
+    cos_phi = np.cos(phi)
+    dU_dtheta = sin_phi*(cos_theta*dU_dxyz[:, 1] - sin_theta*dU_dxyz[:, 0])
+    dU_dphi = cos_phi*(cos_theta*dU_dxyz[:, 0] + sin_theta*dU_dxyz[:, 1]) - sin_phi*dU_dxyz[:, 2]
+    return U, np.concatenate((dU_dtheta, dU_dphi))
 
 
 def potential_single(coord0, x, y, z):
@@ -78,18 +150,7 @@ def xyz2U(x, y, z):
     """
     compute the potential
     """
-    dsq = 0.
-
-    indices = np.triu_indices(x.size, k=1)
-
-    for coord in [x, y, z]:
-        coord_i = np.tile(coord, (coord.size, 1))
-        coord_j = coord_i.T
-        dsq += (coord_i[indices]-coord_j[indices])**2
-
-    d = np.sqrt(dsq)
-    U = np.sum(1./d)
-    return U
+    return _unit_potential(np.array((x, y, z)).T)
 
 
 def iterate_potential_smart(x0, stepfrac=0.1):
@@ -230,8 +291,16 @@ def even_points(npts, use_fib_init=True, method='CG', potential_func=elec_potent
         phi = np.arccos(2.*np.random.rand(npts)-1.)
 
     x = np.concatenate((theta, phi))
+    # Leave maxiter out if it isn't set, so each method uses its own default
+    options = {}
+    if maxiter is not None:
+        options['maxiter'] = maxiter
     # XXX--need to check if this is the best minimizer
-    min_fit = minimize(potential_func, x, method='CG', options={'maxiter': maxiter})
+    if potential_func in _potential_gradients:
+        min_fit = minimize(_potential_gradients[potential_func], x, method=method, jac=True,
+                           options=options)
+    else:
+        min_fit = minimize(potential_func, x, method=method, options=options)
 
     x = min_fit.x
     theta = x[0:int(x.size/2)]
@@ -242,25 +311,40 @@ def even_points(npts, use_fib_init=True, method='CG', potential_func=elec_potent
 
 def elec_potential_xyz(x0):
     x0 = x0.reshape(3, int(x0.size/3))
-    x = x0[0, :]
-    y = x0[1, :]
-    z = x0[2, :]
-    dsq = 0.
+    r = np.sqrt(np.sum(x0**2, axis=0))
+    return _unit_potential((x0/r).T)
 
-    r = np.sqrt(x**2 + y**2 + z**2)
-    x = x/r
-    y = y/r
-    z = z/r
-    indices = np.triu_indices(x.size, k=1)
 
-    for coord in [x, y, z]:
-        coord_i = np.tile(coord, (coord.size, 1))
-        coord_j = coord_i.T
-        d = (coord_i[indices]-coord_j[indices])**2
-        dsq += d
+def elec_potential_xyz_grad(x0, chunk_size=None):
+    """
+    Potential and gradient for points given as x, y, z (projected onto the sphere)
 
-    U = np.sum(1./np.sqrt(dsq))
-    return U
+    Parameters
+    ----------
+    x0 : array
+        x values, then y values, then z values
+    chunk_size : int (None)
+        Number of points to compute at a time (see _unit_potential)
+
+    Returns
+    -------
+    U : float
+        Potential energy
+    grad : array
+        Derivative of U with respect to x0
+    """
+    x0 = x0.reshape(3, int(x0.size/3))
+    r = np.sqrt(np.sum(x0**2, axis=0))
+    xyz = (x0/r).T
+    U, dU_dxyz = _unit_potential(xyz, grad=True, chunk_size=chunk_size)
+    # Only the component perpendicular to each point changes its position on the sphere
+    radial = np.sum(dU_dxyz*xyz, axis=1)[:, np.newaxis]
+    grad = (dU_dxyz - radial*xyz)/r[:, np.newaxis]
+    return U, grad.T.ravel()
+
+
+# Potentials that have a function returning (potential, gradient), so minimize can use jac=True
+_potential_gradients = {elec_potential: elec_potential_grad, elec_potential_xyz: elec_potential_xyz_grad}
 
 
 def elec_p_xyx_loop(x0):
@@ -320,8 +404,16 @@ def even_points_xyz(npts, use_fib_init=True, method='CG', potential_func=elec_p_
 
     if verbose:
         print('initial potential=', elec_potential_xyz(x))
+    options = {}
+    if maxiter is not None:
+        options['maxiter'] = maxiter
     # XXX--need to check if this is the best minimizer
-    min_fit = minimize(potential_func, x, method='CG', options={'maxiter': maxiter}, callback=callback)
+    if potential_func in _potential_gradients:
+        min_fit = minimize(_potential_gradients[potential_func], x, method=method, jac=True,
+                           options=options, callback=callback)
+    else:
+        min_fit = minimize(potential_func, x, method=method, options=options,
+                           callback=callback)
 
     if verbose:
         print('final potential=', elec_potential_xyz(min_fit.x))
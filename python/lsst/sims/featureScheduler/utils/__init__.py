@@ -3,3 +3,5 @@ from .footprints import *
 from .tsp import *
 from .dithering import *
 from .comcamTessellate import *
+from .smoothing import *
+from .columnar import *
@@ -0,0 +1,234 @@
+import os
+import struct
+import numpy as np
+from numpy.lib import format as npy_format
+from .utils import empty_observation, schema_converter
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+__all__ = ['columnar_writer', 'load_columnar', 'columnar2obs', 'columnar2opsim', 'is_columnar']
+
+# Files in a columnar output directory that are not observation columns
+_DTYPE_FILE = '_dtype.npy'
+_INFO_FILE = '_info.npy'
+_PARQUET_FILE = 'observations.parquet'
+# Room for the largest row count in a fixed size .npy header
+_MAX_ROWS_DIGITS = 20
+
+
+def _npy_header(dtype, n_rows):
+    """A version 1.0 .npy header for a 1-d array, always the same length for a given dtype.
+
+    Fixing the length means the row count can be rewritten in place as the file grows.
+    """
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%i,), }" % (
+        npy_format.dtype_to_descr(np.dtype(dtype)), n_rows)
+    # magic string (6), version (2) and header length (2) come first
+    longest = len(header) - len(str(n_rows)) + _MAX_ROWS_DIGITS + 1
+    total = 10 + longest
+    header_len = longest + (64 - total % 64) % 64
+    header = header.ljust(header_len - 1) + '\n'
+    return npy_format.MAGIC_PREFIX + bytes([1, 0]) + struct.pack('<H', header_len) + header.encode('latin1')
+
+
+def is_columnar(path):
+    """Check if path is a columnar output directory written by columnar_writer
+    """
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, _DTYPE_FILE))
+
+
+class columnar_writer(object):
+    """Write observations to disk column by column while a simulation runs.
+
+    With fmt='npy' each observation column ends up in its own <column>.npy file, so
+    analysis code can np.load(..., mmap_mode='r') only the columns it needs. The row
+    count in each header is updated on every flush, so the files are readable (up to
+    the last flush) even if the run dies before close. With fmt='parquet' (needs
+    pyarrow) a single observations.parquet file is written, one row group per flush.
+    The parquet file can only be read after close. Column names match the observation
+    array (see empty_observation), use columnar2opsim to make a standard SummaryAllProps
+    database.
+
+    Parameters
+    ----------
+    dirname : str
+        Directory to write to. Created if needed, existing column files are overwritten.
+    fmt : str ('npy')
+        'npy' or 'parquet'
+    buffer_size : int (10000)
+        Number of observations to hold in memory between writes
+    """
+    def __init__(self, dirname, fmt='npy', buffer_size=10000):
+        if fmt not in ['npy', 'parquet']:
+            raise ValueError('fmt must be npy or parquet, not %s' % fmt)
+        if fmt == 'parquet' and pyarrow is None:
+            raise ImportError('pyarrow is needed to write parquet files')
+        self.dirname = dirname
+        self.fmt = fmt
+        self.buffer = empty_observation(n=buffer_size)
+        self.n_buffered = 0
+        self.n_written = 0
+        self.closed = False
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        np.save(os.path.join(dirname, _DTYPE_FILE), empty_observation(n=0))
+
+        if fmt == 'npy':
+            self.column_files = {}
+            for key in self.buffer.dtype.names:
+                self.column_files[key] = open(os.path.join(dirname, key + '.npy'), 'w+b')
+                self.column_files[key].write(_npy_header(self.buffer.dtype[key], 0))
+                self.column_files[key].flush()
+        else:
+            self.schema = pyarrow.Table.from_pydict({key: self.buffer[key][0:0]
+                                                     for key in self.buffer.dtype.names}).schema
+            self.parquet_writer = pq.ParquetWriter(os.path.join(dirname, _PARQUET_FILE), self.schema)
+
+    def add_observations(self, observations):
+        """Add a block of completed observations
+
+        Parameters
+        ----------
+        observations : np.array
+            Observation array with one or more rows
+        """
+        observations = np.atleast_1d(observations)
+        indx = 0
+        while indx < observations.size:
+            n = min(observations.size - indx, self.buffer.size - self.n_buffered)
+            self.buffer[self.n_buffered:self.n_buffered+n] = observations[indx:indx+n]
+            self.n_buffered += n
+            indx += n
+            if self.n_buffered == self.buffer.size:
+                self.flush()
+
+    def flush(self):
+        """Write out any buffered observations
+        """
+        if self.n_buffered == 0:
+            return
+        block = self.buffer[0:self.n_buffered]
+        n_written = self.n_written + self.n_buffered
+        if self.fmt == 'npy':
+            for key in block.dtype.names:
+                column_file = self.column_files[key]
+                column_file.seek(0, os.SEEK_END)
+                column_file.write(np.ascontiguousarray(block[key]).tobytes())
+                # Only count the new rows once their data is written
+                column_file.seek(0)
+                column_file.write(_npy_header(block.dtype[key], n_written))
+                column_file.flush()
+        else:
+            table = pyarrow.Table.from_pydict({key: block[key] for key in block.dtype.names},
+                                              schema=self.schema)
+            self.parquet_writer.write_table(table)
+        self.n_written = n_written
+        self.n_buffered = 0
+
+    def close(self, info=None):
+        """Flush and finish the files
+
+        Parameters
+        ----------
+        info : np.array (None)
+            Run information (see run_info_table) to save with the observations
+        """
+        if self.closed:
+            return
+        self.flush()
+        if self.fmt == 'npy':
+            for key in self.buffer.dtype.names:
+                self.column_files[key].close()
+        else:
+            self.parquet_writer.close()
+        if info is not None:
+            np.save(os.path.join(self.dirname, _INFO_FILE), info)
+        self.closed = True
+
+
+def load_columnar(dirname, columns=None, mmap_mode='r'):
+    """Load columns written by columnar_writer without copying them.
+
+    Parameters
+    ----------
+    dirname : str
+        Directory written by columnar_writer
+    columns : list of str (None)
+        Observation columns to load. Default of None loads all of them.
+    mmap_mode : str ('r')
+        Passed to np.load for .npy output. Parquet columns are read in to memory.
+
+    Returns
+    -------
+    result : dict
+        Keys are the column names, values are 1-d arrays
+    """
+    names = np.load(os.path.join(dirname, _DTYPE_FILE)).dtype.names
+    if columns is None:
+        columns = names
+    missing = [key for key in columns if key not in names]
+    if len(missing) > 0:
+        raise ValueError('columns %s not in %s' % (missing, dirname))
+
+    parquet_file = os.path.join(dirname, _PARQUET_FILE)
+    if os.path.isfile(parquet_file):
+        if pyarrow is None:
+            raise ImportError('pyarrow is needed to read parquet files')
+        table = pq.read_table(parquet_file, columns=list(columns))
+        return {key: table.column(key).to_numpy() for key in columns}
+    return {key: np.load(os.path.join(dirname, key + '.npy'), mmap_mode=mmap_mode) for key in columns}
+
+
+def columnar2obs(dirname, columns=None, rows=None):
+    """Assemble an observation array from a columnar output directory.
+
+    Parameters
+    ----------
+    dirname : str
+        Directory written by columnar_writer
+    columns : list of str (None)
+        Columns to fill. Default of None fills the full observation dtype.
+    rows : np.array (None)
+        Index or boolean mask of the rows to return. Default of None returns every row.
+    """
+    data = load_columnar(dirname, columns=columns)
+    blank = np.load(os.path.join(dirname, _DTYPE_FILE))
+    if columns is None:
+        dtype = blank.dtype
+    else:
+        dtype = [(key, blank.dtype[key]) for key in columns]
+    n_rows = data[list(data.keys())[0]].size
+    if rows is not None:
+        n_rows = np.arange(n_rows)[rows].size
+    result = np.zeros(n_rows, dtype=dtype)
+    for key in data:
+        if rows is None:
+            result[key] = data[key]
+        else:
+            result[key] = data[key][rows]
+    return result
+
+
+def columnar2opsim(dirname, filename, delete_past=False):
+    """Convert a columnar output directory to a sqlite database with the opsim schema
+
+    Parameters
+    ----------
+    dirname : str
+        Directory written by columnar_writer
+    filename : str
+        The sqlite file to write
+    delete_past : bool (False)
+        Remove filename before writing
+    """
+    observations = columnar2obs(dirname)
+    info = None
+    info_file = os.path.join(dirname, _INFO_FILE)
+    if os.path.isfile(info_file):
+        info = np.load(info_file)
+    converter = schema_converter()
+    converter.obs2opsim(observations, filename=filename, info=info, delete_past=delete_past)
@@ -1,4 +1,5 @@
 import numpy as np
+from .utils import cached_array, TESSELLATION_CACHE_VERSION
 
 
 def comcamTessellate(side_length=0.7, overlap=0.11):
@@ -16,9 +17,16 @@ def comcamTessellate(side_length=0.7, overlap=0.11):
     Returns
     -------
     fields : numpy array
-       With 'RA' and 'dec' keys that have the field positions in radians
+       With 'RA' and 'dec' keys that have the field positions in radians. The array is
+       cached (see cached_array), shared, and read-only.
     """
+    name = 'comcam_v%i_side%.6f_overlap%.6f' % (TESSELLATION_CACHE_VERSION, side_length, overlap)
+    return cached_array(name, lambda: _comcamTessellate(side_length=side_length, overlap=overlap))
 
+
+def _comcamTessellate(side_length=0.7, overlap=0.11):
+    """Generate the square footprint tessellation, see comcamTessellate
+    """
     # Convert to radians for all internal work
     side_length = np.radians(side_length)
     overlap = np.radians(overlap)
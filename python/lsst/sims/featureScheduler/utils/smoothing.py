@@ -0,0 +1,100 @@
+import os
+import numpy as np
+import healpy as hp
+from scipy import sparse
+from scipy.spatial import cKDTree
+from .utils import scheduler_cache_dir, int_round
+
+__all__ = ['smoothing_matrix', 'sparse_smooth']
+
+# Bump if the way the matrix is built changes, so old cache files get ignored
+SMOOTHING_CACHE_VERSION = 1
+
+# Matrices already loaded, shared by every survey using the same nside and kernel
+_smoothing_matrices = {}
+
+
+def _build_smoothing_matrix(nside, fwhm, truncate):
+    """Gaussian weights between all pairs of healpixels closer than truncate sigma.
+    """
+    sigma = fwhm/np.sqrt(8.*np.log(2.))
+    radius = truncate*sigma
+    npix = hp.nside2npix(nside)
+    xyz = np.vstack(hp.pix2vec(nside, np.arange(npix))).T
+    tree = cKDTree(xyz)
+    # Search on chord length rather than angle
+    pairs = tree.sparse_distance_matrix(tree, 2.*np.sin(radius/2.), output_type='ndarray')
+    ang_dist = 2.*np.arcsin(np.clip(pairs['v']/2., 0., 1.))
+    weights = np.exp(-0.5*(ang_dist/sigma)**2)
+    matrix = sparse.csr_matrix((weights, (pairs['i'], pairs['j'])), shape=(npix, npix))
+    return matrix
+
+
+def smoothing_matrix(nside, fwhm, truncate=3.):
+    """Return a sparse matrix that applies a Gaussian smoothing to a healpix map.
+
+    Matrices are cached in memory and on disk (see scheduler_cache_dir), so building
+    one is only expensive the first time a (nside, fwhm) pair is used.
+
+    Parameters
+    ----------
+    nside : int
+        The healpix nside
+    fwhm : float
+        Full width half max of the Gaussian kernel (radians)
+    truncate : float (3.)
+        Pixels further than truncate sigma are given zero weight.
+
+    Returns
+    -------
+    matrix : scipy.sparse.csr_matrix
+    """
+    key = (nside, int_round(fwhm), truncate)
+    if key in _smoothing_matrices:
+        return _smoothing_matrices[key]
+
+    cache_dir = scheduler_cache_dir()
+    filename = None
+    if cache_dir is not None:
+        filename = os.path.join(cache_dir, 'smoothing_v%i_nside%i_fwhm%i_trunc%.2f.npz' %
+                                (SMOOTHING_CACHE_VERSION, nside, key[1], truncate))
+    if filename is not None and os.path.isfile(filename):
+        matrix = sparse.load_npz(filename).tocsr()
+    else:
+        matrix = _build_smoothing_matrix(nside, fwhm, truncate)
+        if filename is not None:
+            # Write to a temporary file and move it, so parallel runs never see a partial file
+            temp_name = '%s.%i.tmp.npz' % (filename[:-4], os.getpid())
+            try:
+                sparse.save_npz(temp_name, matrix)
+                os.replace(temp_name, filename)
+            except OSError:
+                pass
+    _smoothing_matrices[key] = matrix
+    return matrix
+
+
+def sparse_smooth(in_map, matrix):
+    """Smooth a healpix map, ignoring masked pixels.
+
+    Each unmasked pixel becomes the weighted mean of the unmasked pixels around it,
+    so the mask does not bleed into the smoothed values.
+
+    Parameters
+    ----------
+    in_map : np.array
+        Healpix map, with masked pixels set to np.nan
+    matrix : scipy.sparse matrix
+        Output of smoothing_matrix
+
+    Returns
+    -------
+    result : np.array
+        The smoothed map. Pixels masked in in_map are still np.nan.
+    """
+    good = ~np.isnan(in_map)
+    weights = matrix.dot(good.astype(float))
+    result = matrix.dot(np.where(good, in_map, 0.))
+    result[good] /= weights[good]
+    result[~good] = np.nan
+    return result
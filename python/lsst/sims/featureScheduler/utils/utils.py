@@ -1,12 +1,15 @@
 import os
 import sqlite3 as db
 import datetime
+from collections import OrderedDict
 import socket
 import numpy as np
 import healpy as hp
 import pandas as pd
 import matplotlib.path as mplPath
-from lsst.sims.utils import _hpid2RaDec, xyz_angular_radius, _buildTree, _xyz_from_ra_dec
+from scipy.spatial import cKDTree
+from lsst.sims.utils import (_hpid2RaDec, xyz_angular_radius, _buildTree, _xyz_from_ra_dec,
+                             _angularSeparation)
 from lsst.sims.featureScheduler import version
 from lsst.sims.survey.fields import FieldsDatabase
 
@@ -85,6 +88,48 @@ class int_rounded(object):
         return result
 
 
+def int_round(inval, scale=1e5):
+    """Scale, round and cast values the same way int_rounded does, without the wrapper object.
+
+    Comparing two int_round outputs gives the same answer as comparing int_rounded objects.
+    That includes NaN, which casts to the most negative int (as in int_rounded), so NaN
+    compares as less than everything. Use it to precompute thresholds and static maps once,
+    rather than re-wrapping them every call.
+
+    Parameters
+    ----------
+    inval : float or np.array
+        Value(s) to round
+    scale : float (1e5)
+        How much to scale inval before rounding.
+    """
+    # NaN and inf can't be cast, numpy warns and gives the most negative int
+    with np.errstate(invalid='ignore'):
+        return np.round(np.multiply(inval, scale)).astype(int)
+
+
+def int_between(inval, low, high, scale=1e5):
+    """Vectorized check of low < inval < high, using fixed-point comparisons.
+
+    Parameters
+    ----------
+    inval : np.array
+        Values to check
+    low : float
+        Lower limit, already passed through int_round
+    high : float
+        Upper limit, already passed through int_round
+    scale : float (1e5)
+        Scale used for the limits.
+
+    Returns
+    -------
+    Boolean array
+    """
+    rounded = int_round(inval, scale=scale)
+    return (rounded > low) & (rounded < high)
+
+
 def set_default_nside(nside=None):
     """
     Utility function to set a default nside value across the scheduler.
@@ -105,6 +150,83 @@ def set_default_nside(nside=None):
     return set_default_nside.nside
 
 
+def scheduler_cache_dir():
+    """
+    Directory to use for caching expensive precomputed arrays.
+
+    Defaults to ~/.cache/sims_featureScheduler, set the SIMS_FEATURESCHEDULER_CACHE
+    environment variable to use somewhere else.
+
+    Returns
+    -------
+    path : str
+        The cache directory, or None if it can't be created.
+    """
+    path = os.environ.get('SIMS_FEATURESCHEDULER_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'sims_featureScheduler'))
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            return None
+    return path
+
+
+# Bump if the way tessellations are generated changes, so old cache files get ignored
+TESSELLATION_CACHE_VERSION = 1
+
+
+def cached_array(name, build_func):
+    """
+    Load an array from the on-disk cache, or build and save it.
+
+    Results are also kept in memory, so everything asking for the same name shares
+    one read-only array.
+
+    Parameters
+    ----------
+    name : str
+        Name of the cache file, without the extension. Should include any version
+        or parameter values the array depends on.
+    build_func : callable
+        Called with no arguments to make the array if it is not cached.
+
+    Returns
+    -------
+    result : np.array
+        Read-only array
+    """
+    if name in cached_array.cache:
+        return cached_array.cache[name]
+
+    result = None
+    cache_dir = scheduler_cache_dir()
+    filename = None
+    if cache_dir is not None:
+        filename = os.path.join(cache_dir, name + '.npy')
+        if os.path.isfile(filename):
+            try:
+                result = np.load(filename)
+            except (OSError, ValueError):
+                result = None
+    if result is None:
+        result = build_func()
+        if filename is not None:
+            # Write to a temporary file and move it, so parallel runs never see a partial file
+            temp_name = '%s.%i.tmp.npy' % (os.path.join(cache_dir, name), os.getpid())
+            try:
+                np.save(temp_name, result)
+                os.replace(temp_name, filename)
+            except OSError:
+                pass
+    result.flags.writeable = False
+    cached_array.cache[name] = result
+    return result
+
+
+cached_array.cache = {}
+
+
 def restore_scheduler(observationId, scheduler, observatory, filename, filter_sched=None):
     """Put the scheduler and observatory in the state they were in. Handy for checking reward fucnction
 
@@ -117,16 +239,23 @@ def restore_scheduler(observationId, scheduler, observatory, filename, filter_sc
     observatory : lsst.sims.featureSchedler.observatory.Model_observatory
         The observaotry object
     filename : str
-        The output sqlite dayabase to use
+        The output sqlite dayabase to use, or a directory written by columnar_writer
     filter_sched : lsst.sims.featureScheduler.scheduler object
         The filter scheduler. Note that we don't look up the official end of the previous night,
         so there is potential for the loaded filters to not match.
     """
-    sc = schema_converter()
+    # Imported here since columnar imports from this module
+    from .columnar import is_columnar, load_columnar, columnar2obs
     # load up the observations
-    observations = sc.opsim2obs(filename)
-    good_obs = np.where(observations['ID'] <= observationId)[0]
-    observations = observations[good_obs]
+    if is_columnar(filename):
+        # Only the ID column is read in full, the rest are pulled from the memory map
+        ids = load_columnar(filename, columns=['ID'])['ID']
+        observations = columnar2obs(filename, rows=np.where(ids <= observationId)[0])
+    else:
+        sc = schema_converter()
+        observations = sc.opsim2obs(filename)
+        good_obs = np.where(observations['ID'] <= observationId)[0]
+        observations = observations[good_obs]
 
     # replay the observations back into the scheduler
     for obs in observations:
@@ -157,27 +286,132 @@ def restore_scheduler(observationId, scheduler, observatory, filename, filter_sc
     return scheduler, observatory
 
 
+def _binned_max(ordered_values, left, counts):
+    return np.maximum.reduceat(ordered_values, left)
+
+
+def _binned_nanmax(ordered_values, left, counts):
+    # fmax ignores nans unless the whole bin is nan
+    return np.fmax.reduceat(ordered_values, left)
+
+
+def _binned_min(ordered_values, left, counts):
+    return np.minimum.reduceat(ordered_values, left)
+
+
+def _binned_nanmin(ordered_values, left, counts):
+    return np.fmin.reduceat(ordered_values, left)
+
+
+def _binned_sum(ordered_values, left, counts):
+    return np.add.reduceat(ordered_values, left)
+
+
+def _binned_mean(ordered_values, left, counts):
+    return np.add.reduceat(ordered_values, left)/counts
+
+
+def _binned_count(ordered_values, left, counts):
+    return counts
+
+
+# Statistics that can be done with a single ufunc reduction over the sorted values.
+# Keys can be the numpy function or the name scipy.binned_statistic would use.
+_binned_fast_paths = {np.max: _binned_max, np.amax: _binned_max, 'max': _binned_max,
+                      np.nanmax: _binned_nanmax,
+                      np.min: _binned_min, np.amin: _binned_min, 'min': _binned_min,
+                      np.nanmin: _binned_nanmin,
+                      np.sum: _binned_sum, 'sum': _binned_sum,
+                      np.mean: _binned_mean, 'mean': _binned_mean,
+                      len: _binned_count, np.size: _binned_count, 'count': _binned_count}
+
+
 def int_binned_stat(ids, values, statistic=np.mean):
     """
     Like scipy.binned_statistic, but for unique int ids
-    """
 
-    uids = np.unique(ids)
-    order = np.argsort(ids)
+    Parameters
+    ----------
+    ids : np.array of int
+        The id for each value
+    values : np.array
+        The values to compute the statistic on
+    statistic : callable or str (np.mean)
+        Any function that reduces an array to a single value. max, nanmax, min, nanmin,
+        sum, mean and count (np functions, len, or the scipy style names) are done with
+        ufunc.reduceat instead of calling the function once per id.
+
+    Returns
+    -------
+    uids : np.array
+        The sorted unique ids
+    stat_results : np.array
+        The statistic for each of uids
+    """
+    ids = np.asarray(ids)
+    values = np.asarray(values)
+    if ids.size == 0:
+        return ids[0:0], values[0:0]
 
+    order = np.argsort(ids, kind='mergesort')
     ordered_ids = ids[order]
     ordered_values = values[order]
 
-    left = np.searchsorted(ordered_ids, uids, side='left')
-    right = np.searchsorted(ordered_ids, uids, side='right')
+    left = np.concatenate(([0], np.flatnonzero(np.diff(ordered_ids)) + 1))
+    uids = ordered_ids[left]
+    counts = np.diff(np.append(left, ordered_ids.size))
+
+    try:
+        fast_path = _binned_fast_paths.get(statistic)
+    except TypeError:
+        # statistic is not hashable
+        fast_path = None
+    if fast_path is not None:
+        return uids, fast_path(ordered_values, left, counts)
+
+    if isinstance(statistic, str):
+        raise ValueError('Unknown statistic %s' % statistic)
 
     stat_results = []
-    for le, ri in zip(left, right):
+    for le, ri in zip(left, left + counts):
         stat_results.append(statistic(ordered_values[le:ri]))
 
     return uids, np.array(stat_results)
 
 
+def nan_top_k(values, k):
+    """
+    Find the indices of the k largest values, ignoring NaNs
+
+    Uses a partition rather than a full sort, so the cost scales with the size of
+    values plus k log k. Ties are broken in favor of the lower index.
+
+    Parameters
+    ----------
+    values : np.array
+        The values to select from. NaNs are never selected.
+    k : int
+        The number of indices to return
+
+    Returns
+    -------
+    indices : np.array
+        Indices of the (up to) k largest values, ordered from largest to smallest.
+    """
+    good = np.where(~np.isnan(values))[0]
+    if (k <= 0) | (good.size == 0):
+        return np.array([], dtype=int)
+    good_values = values[good]
+    if good.size > k:
+        kth_value = -np.partition(-good_values, k-1)[k-1]
+        above = good[good_values > kth_value]
+        # good is sorted, so this takes the lowest indices of any ties
+        tied = good[good_values == kth_value][0:k-above.size]
+        good = np.concatenate((above, tied))
+    order = np.lexsort((good, -values[good]))
+    return good[order]
+
+
 def gnomonic_project_toxy(RA1, Dec1, RAcen, Deccen):
     """Calculate x/y projection of RA1/Dec1 in system with center at RAcen, Deccen.
     Input radians. Grabbed from sims_selfcal"""
@@ -296,56 +530,189 @@ class schema_converter(object):
         # Put LMST into degrees too
         self.angles_hours2deg = ['observationStartLST']
 
-    def obs2opsim(self, obs_array, filename=None, info=None, delete_past=False):
-        """convert an array of observations into a pandas dataframe with Opsim schema
+    def _opsim_columns(self, obs_array):
+        """Opsim column names and converted values for an observation array
         """
+        names = []
+        columns = []
+        for key in obs_array.dtype.names:
+            name = self.inv_map.get(key, key)
+            values = obs_array[key]
+            if name in self.angles_rad2deg:
+                values = np.degrees(values)
+            elif name in self.angles_hours2deg:
+                values = values * 360./24.
+            names.append(name)
+            columns.append(values)
+        return names, columns
+
+    def obs2opsim(self, obs_array, filename=None, info=None, delete_past=False, chunk_size=100000):
+        """convert an array of observations into a sqlite database with Opsim schema
+
+        Rows are written straight from the numpy columns with executemany, in a single
+        transaction, so large arrays do not need to go through pandas.
+
+        Parameters
+        ----------
+        obs_array : np.array
+            Observation array (see empty_observation)
+        filename : str (None)
+            The sqlite file to write to
+        info : np.array (None)
+            If not None, written to an 'info' table
+        delete_past : bool (False)
+            Remove filename before writing
+        chunk_size : int (100000)
+            Number of rows converted to python objects at a time
+        """
+        if filename is None:
+            return
         if delete_past:
             try:
                 os.remove(filename)
             except OSError:
                 pass
 
-        df = pd.DataFrame(obs_array)
-        df = df.rename(index=str, columns=self.inv_map)
-        for colname in self.angles_rad2deg:
-            df[colname] = np.degrees(df[colname])
-        for colname in self.angles_hours2deg:
-            df[colname] = df[colname] * 360./24.
+        names, columns = self._opsim_columns(obs_array)
+        col_defs = ', '.join(['"%s" %s' % (name, _sqlite_type(values.dtype))
+                              for name, values in zip(names, columns)])
+        insert = 'INSERT INTO "SummaryAllProps" VALUES (%s)' % ', '.join(['?'] * len(names))
 
-        if filename is not None:
-            con = db.connect(filename)
-            df.to_sql('SummaryAllProps', con, index=False)
-            if info is not None:
-                df = pd.DataFrame(info)
-                df.to_sql('info', con)
-
-    def opsim2obs(self, filename):
-        """convert an opsim schema dataframe into an observation array.
-        """
+        con = db.connect(filename)
+        # Nothing to recover if a write dies halfway, so skip the journal and fsyncs
+        con.execute('PRAGMA journal_mode = OFF')
+        con.execute('PRAGMA synchronous = OFF')
+        con.execute('CREATE TABLE "SummaryAllProps" (%s)' % col_defs)
+        for start in range(0, obs_array.size, chunk_size):
+            rows = zip(*[values[start:start+chunk_size].tolist() for values in columns])
+            con.executemany(insert, rows)
+        con.commit()
+        if info is not None:
+            df = pd.DataFrame(info)
+            df.to_sql('info', con)
+        con.close()
+
+    def opsim2obs_chunks(self, filename, chunk_size=100000, columns=None, where=None, int_fill=-1):
+        """Read an opsim schema database as observation arrays, a chunk at a time.
 
+        Parameters
+        ----------
+        filename : str
+            The sqlite file to read
+        chunk_size : int (100000)
+            Maximum number of rows in each yielded array
+        columns : list of str (None)
+            Observation array names (e.g., 'mjd', 'RA') to read. If None, every column in the
+            table that maps to the observation array is read and the full observation dtype
+            is returned.
+        where : str (None)
+            Optional SQL constraint, e.g., 'night < 365'
+        int_fill : int (-1)
+            Value to use for NULLs in integer columns. NULLs in float columns come back as
+            nan, and in string columns as ''.
+
+        Yields
+        ------
+        chunk : np.array
+            Structured array with the requested columns
+        """
+        blank = empty_observation(n=0)
         con = db.connect(filename)
-        df = pd.read_sql('select * from SummaryAllProps;', con)
-        for key in self.angles_rad2deg:
-            df[key] = np.radians(df[key])
-        for key in self.angles_hours2deg:
-            df[key] = df[key] * 24./360.
+        table_cols = [row[1] for row in con.execute('PRAGMA table_info("SummaryAllProps")')]
+        available = {}
+        for col in table_cols:
+            key = self.convert_dict.get(col, col)
+            if key in blank.dtype.names:
+                available[key] = col
+        if columns is None:
+            keys = [key for key in blank.dtype.names if key in available]
+            out_dtype = blank.dtype
+        else:
+            missing = [key for key in columns if key not in available]
+            if len(missing) > 0:
+                con.close()
+                raise ValueError('columns %s not in %s' % (missing, filename))
+            keys = list(columns)
+            out_dtype = np.dtype([(key, blank.dtype[key]) for key in keys])
+        read_dtype = np.dtype([(key, blank.dtype[key]) for key in keys])
+
+        selects = []
+        for key in keys:
+            # Integer and string columns have no NULL, so fill them in the query
+            kind = read_dtype[key].kind
+            if kind in 'iu':
+                selects.append('COALESCE("%s", %i)' % (available[key], int_fill))
+            elif kind == 'U':
+                selects.append('COALESCE("%s", \'\')' % available[key])
+            else:
+                selects.append('"%s"' % available[key])
+        query = 'SELECT %s FROM "SummaryAllProps"' % ', '.join(selects)
+        if where is not None:
+            query += ' WHERE %s' % where
+        cursor = con.execute(query)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if len(rows) == 0:
+                    break
+                # NULLs come back as nan in float columns
+                chunk = np.array(rows, dtype=read_dtype)
+                for key in keys:
+                    name = available[key]
+                    if name in self.angles_rad2deg:
+                        chunk[key] = np.radians(chunk[key])
+                    elif name in self.angles_hours2deg:
+                        chunk[key] = chunk[key] * 24./360.
+                if out_dtype == read_dtype:
+                    yield chunk
+                else:
+                    result = np.zeros(chunk.size, dtype=out_dtype)
+                    for key in keys:
+                        result[key] = chunk[key]
+                    yield result
+        finally:
+            con.close()
+
+    def opsim2obs(self, filename, columns=None, int_fill=-1):
+        """convert an opsim schema database into an observation array.
 
-        df = df.rename(index=str, columns=self.convert_dict)
+        Parameters
+        ----------
+        filename : str
+            The sqlite file to read
+        columns : list of str (None)
+            Observation array names to read. Default of None reads everything.
+        int_fill : int (-1)
+            Value to use for NULLs in integer columns
+        """
+        chunks = list(self.opsim2obs_chunks(filename, columns=columns, int_fill=int_fill))
+        if len(chunks) == 0:
+            if columns is None:
+                return empty_observation(n=0)
+            blank = empty_observation(n=0)
+            return np.zeros(0, dtype=[(key, blank.dtype[key]) for key in columns])
+        return np.concatenate(chunks)
 
-        blank = empty_observation()
-        final_result = np.empty(df.shape[0], dtype=blank.dtype)
-        # XXX-ugh, there has to be a better way.
-        for i, key in enumerate(df.columns):
-            if key in self.inv_map.keys():
-                final_result[key] = df[key].values
 
-        return final_result
+def _sqlite_type(dtype):
+    """SQLite column type for a numpy dtype
+    """
+    if np.issubdtype(dtype, np.integer) or np.issubdtype(dtype, np.bool_):
+        return 'INTEGER'
+    if np.issubdtype(dtype, np.floating):
+        return 'REAL'
+    return 'TEXT'
 
 
-def empty_observation():
+def empty_observation(n=1):
     """
     Return a numpy array that could be a handy observation record
 
+    Parameters
+    ----------
+    n : int (1)
+        The number of rows. A block of observations is a single structured array.
+
     XXX:  Should this really be "empty visit"? Should we have "visits" made
     up of multple "observations" to support multi-exposure time visits?
 
@@ -407,10 +774,37 @@ def empty_observation():
              int, int, int,
              float, float, float, float, float, float, float, float,
              float, float, float, float]
-    result = np.zeros(1, dtype=list(zip(names, types)))
+    result = np.zeros(n, dtype=list(zip(names, types)))
     return result
 
 
+def observation_block(observations):
+    """
+    Convert a list of single row observation arrays into one structured array
+
+    Surveys and detailers pass observations around as a single structured array
+    (a block). This lets older code that returns lists of rows (or None) be used
+    as well.
+
+    Parameters
+    ----------
+    observations : np.array, list of np.array, or None
+
+    Returns
+    -------
+    block : np.array
+        Structured array with one row per observation
+    """
+    if observations is None:
+        return empty_observation(n=0)
+    if isinstance(observations, np.ndarray):
+        return observations.reshape(-1)
+    observations = [np.atleast_1d(obs) for obs in observations if obs is not None]
+    if len(observations) == 0:
+        return empty_observation(n=0)
+    return np.concatenate(observations)
+
+
 def scheduled_observation():
     """Make an array for pre-scheduling observations
 
@@ -432,10 +826,20 @@ def scheduled_observation():
 def read_fields():
     """
     Read in the Field coordinates
+
+    The fields are cached (see cached_array), so the database is only queried once.
+
     Returns
     -------
     numpy.array
-        With RA and dec in radians.
+        With RA and dec in radians. The array is shared and read-only.
+    """
+    return cached_array('fields_v%i' % TESSELLATION_CACHE_VERSION, _read_fields_db)
+
+
+def _read_fields_db():
+    """
+    Query the Field coordinates from the fields database
     """
     query = 'select fieldId, fieldRA, fieldDEC from Field;'
     fd = FieldsDatabase()
@@ -456,6 +860,9 @@ def hp_kd_tree(nside=None, leafsize=100, scale=1e5):
     """
     Generate a KD-tree of healpixel locations
 
+    Trees are cached, so everything asking for the same (nside, leafsize, scale)
+    shares a single tree. The trees are never modified once built.
+
     Parameters
     ----------
     nside : int
@@ -470,9 +877,88 @@ def hp_kd_tree(nside=None, leafsize=100, scale=1e5):
     if nside is None:
         nside = set_default_nside()
 
-    hpid = np.arange(hp.nside2npix(nside))
-    ra, dec = _hpid2RaDec(nside, hpid)
-    return _buildTree(ra, dec, leafsize, scale=scale)
+    key = (nside, leafsize, scale)
+    if key not in hp_kd_tree.trees:
+        hpid = np.arange(hp.nside2npix(nside))
+        ra, dec = _hpid2RaDec(nside, hpid)
+        hp_kd_tree.trees[key] = _buildTree(ra, dec, leafsize, scale=scale)
+    return hp_kd_tree.trees[key]
+
+
+hp_kd_tree.trees = {}
+
+
+def hp_disc_neighbors(nside, radius, chunk_size=1024, max_entries=2**24):
+    """
+    Find the healpixels within radius of every healpixel.
+
+    The result is in compressed sparse row form: the neighbors of pixel i are
+    indices[indptr[i]:indptr[i+1]], in increasing order. Distances are compared
+    with int_round, so the selection matches
+    int_round(_angularSeparation(...)) <= int_round(radius). Results are cached,
+    so everything asking for the same (nside, radius) shares the arrays.
+
+    The table has about npix**2 * (1-cos(radius))/2 entries and is kept for the life
+    of the process. If that is more than max_entries (4 bytes each) nothing is built
+    and None is returned, so callers should fall back to finding the neighbors of
+    single pixels as needed. With the default limit (64 MB), a 30 degree radius fits
+    at nside 32 but not at nside 64.
+
+    Parameters
+    ----------
+    nside : int
+        A valid healpix nside
+    radius : float
+        The disc radius (radians)
+    chunk_size : int (1024)
+        Number of pixels to query at once while building
+    max_entries : int (2**24)
+        Largest table to build
+
+    Returns
+    -------
+    indptr : np.array
+        Offsets into indices, length npix+1. None if the table would be too large.
+    indices : np.array
+        The neighbor healpix ids. None if the table would be too large.
+    """
+    radius_rounded = int_round(radius)
+    key = (nside, radius_rounded)
+    if key in hp_disc_neighbors.cache:
+        return hp_disc_neighbors.cache[key]
+
+    npix = hp.nside2npix(nside)
+    if npix * npix * (1. - np.cos(min(radius, np.pi))) / 2. > max_entries:
+        return None, None
+    ra, dec = _hpid2RaDec(nside, np.arange(npix))
+    xyz = np.array(_xyz_from_ra_dec(ra, dec)).T
+    tree = cKDTree(xyz)
+    # Search a slightly larger chord, then make the exact cut on the angular distance
+    chord = 2.*np.sin(min(radius + 1e-4, np.pi)/2.)
+
+    counts = np.zeros(npix, dtype=np.int64)
+    indices = []
+    for start in range(0, npix, chunk_size):
+        stop = min(start + chunk_size, npix)
+        candidates = tree.query_ball_point(xyz[start:stop], chord, return_sorted=True)
+        lengths = np.array([len(cand) for cand in candidates])
+        rows = np.repeat(np.arange(start, stop), lengths)
+        cols = np.concatenate(candidates).astype(int)
+        dists = _angularSeparation(ra[rows], dec[rows], ra[cols], dec[cols])
+        good = int_round(dists) <= radius_rounded
+        counts[start:stop] = np.bincount(rows[good] - start, minlength=stop-start)
+        indices.append(cols[good].astype(np.int32))
+
+    indptr = np.zeros(npix + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.concatenate(indices)
+    indptr.flags.writeable = False
+    indices.flags.writeable = False
+    hp_disc_neighbors.cache[key] = (indptr, indices)
+    return indptr, indices
+
+
+hp_disc_neighbors.cache = {}
 
 
 class hp_in_lsst_fov(object):
@@ -517,6 +1003,33 @@ class hp_in_lsst_fov(object):
         indices = self.tree.query_ball_point((x, y, z), self.radius)
         return np.array(indices)
 
+    def query_many(self, ra, dec):
+        """Find the healpixels within many pointings with a single tree query.
+
+        Parameters
+        ----------
+        ra : np.array
+            RA in radians
+        dec : np.array
+            Dec in radians
+
+        Returns
+        -------
+        pointing_indx : numpy array
+            Index into ra, dec of each match
+        hp_indx : numpy array
+            The healpixels that are within the FoV of that pointing
+        """
+        x, y, z = _xyz_from_ra_dec(ra, dec)
+        xyz = np.round(np.vstack((x, y, z)).T * self.scale).astype(int)
+        indices = self.tree.query_ball_point(xyz, self.radius)
+        lengths = np.array([len(indx) for indx in indices], dtype=int)
+        pointing_indx = np.repeat(np.arange(lengths.size), lengths)
+        if pointing_indx.size == 0:
+            return pointing_indx, np.array([], dtype=int)
+        hp_indx = np.concatenate(indices).astype(int)
+        return pointing_indx, hp_indx
+
 
 class hp_in_comcam_fov(object):
     """
@@ -699,6 +1212,65 @@ def season_calc(night, offset=0, modulo=None, max_season=None, season_length=365
     return result
 
 
+def season_map(night, offset=0, modulo=None, max_season=None, season_length=365.25, floor=True):
+    """
+    Cached season_calc for a single night.
+
+    The season only changes at night boundaries, so the result for the most recent night
+    is kept for each (offset, modulo, max_season, season_length, floor) combination and
+    shared by every caller. Array offsets are keyed on identity, so they should not be
+    modified in place after being passed here. Only the most recently used
+    season_map.max_entries combinations are kept.
+
+    Parameters
+    ----------
+    night : int
+        The night we want to convert to a season
+    offset : float or array (0)
+        Offset to be applied to night (days)
+    modulo : int (None)
+        See season_calc
+    max_season : int (None)
+        See season_calc
+    season_length : float (365.25)
+        See season_calc
+    floor : bool (True)
+        See season_calc
+
+    Returns
+    -------
+    result : np.array
+        Read-only season array, same shape as season_calc returns
+    """
+    if np.size(night) != 1:
+        return season_calc(night, offset=offset, modulo=modulo, max_season=max_season,
+                           season_length=season_length, floor=floor)
+    night = np.ravel(night)[0]
+    if np.ndim(offset) == 0:
+        offset_key = ('value', float(offset))
+    else:
+        offset_key = ('id', id(offset))
+    key = (offset_key, modulo, max_season, season_length, floor)
+    cache = season_map.cache
+    cached = cache.get(key)
+    if cached is not None:
+        cache.move_to_end(key)
+        if cached[1] == night:
+            return cached[2]
+    result = season_calc(night, offset=offset, modulo=modulo, max_season=max_season,
+                         season_length=season_length, floor=floor)
+    result.setflags(write=False)
+    # Hold on to the offset so its id can't be reused while it is a key
+    cache[key] = (offset, night, result)
+    while len(cache) > season_map.max_entries:
+        cache.popitem(last=False)
+    return result
+
+
+season_map.cache = OrderedDict()
+season_map.max_entries = 64
+
+
 def create_season_offset(nside, sun_RA_rad):
     """
     Make an offset map so seasons roll properly
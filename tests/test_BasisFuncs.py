@@ -1,7 +1,10 @@
 import numpy as np
+import healpy as hp
 import unittest
 import lsst.utils.tests
 import lsst.sims.featureScheduler.basis_functions as basis_functions
+import lsst.sims.featureScheduler.surveys as surveys
+from lsst.sims.featureScheduler.basis_functions.mask_basis_funcs import Zenith_shadow_table
 from lsst.sims.featureScheduler.utils import empty_observation
 from lsst.sims.featureScheduler.features import Conditions
 
@@ -35,6 +38,55 @@ class TestBasis(unittest.TestCase):
         conditions.mjd += delta
         self.assertEqual(np.max(bf(conditions)), 0.)
 
+    def testZenith_shadow_table(self):
+        nside = 32
+        exact = basis_functions.Zenith_shadow_mask_basis_function(nside=nside, lmst_step=None)
+        tabled = basis_functions.Zenith_shadow_mask_basis_function(nside=nside, lmst_step=0.5)
+        conditions = Conditions(nside=nside)
+        # Pick LMST values right on the table grid, so the masks should match exactly
+        for lmst in [0., 3.5, 12., 20.25]:
+            conditions.mjd = 59000. + lmst
+            conditions.lmst = lmst
+            np.testing.assert_array_equal(np.isnan(exact(conditions)), np.isnan(tabled(conditions)))
+        # Off the grid only pixels at the edge of the shadow can move
+        npix = hp.nside2npix(nside)
+        for lmst in np.random.uniform(0., 24., size=20):
+            conditions.mjd = 59000. + lmst
+            conditions.lmst = lmst
+            n_diff = np.sum(np.isnan(exact(conditions)) != np.isnan(tabled(conditions)))
+            assert(n_diff < 0.002*npix)
+        # Rows and tables are capped
+        table = tabled.shadow_table
+        assert(len(table.rows) <= table.max_rows)
+        assert(len(Zenith_shadow_table.tables) <= Zenith_shadow_table.max_tables)
+
+    def testFutureConditions(self):
+        nside = 32
+        mjd = 59853.7
+        future_mjds = mjd + np.arange(4)/24.
+        conditions = Conditions(nside=nside)
+        conditions.mjd = mjd
+        conditions.future_mjd = future_mjds
+        # The first lookahead time is now
+        np.testing.assert_allclose(conditions.future_alt[0], conditions.alt)
+        np.testing.assert_allclose(conditions.future_az[0], conditions.az)
+        np.testing.assert_allclose(conditions.future_HA[0], conditions.HA)
+
+        bf = basis_functions.Zenith_shadow_mask_basis_function(nside=nside, lmst_step=None)
+        future_values = bf.calc_future_value(conditions)
+        survey = surveys.Greedy_survey([bf, basis_functions.Constant_basis_function()], [1., 1.],
+                                       nside=nside)
+        future_reward = survey.calc_future_reward(conditions)
+        self.assertEqual(future_reward.shape, (future_mjds.size, hp.nside2npix(nside)))
+
+        # Each time should match computing the conditions at that mjd directly
+        for i, future_mjd in enumerate(future_mjds):
+            single = Conditions(nside=nside)
+            single.mjd = future_mjd
+            np.testing.assert_allclose(conditions.future_alt[i], single.alt)
+            np.testing.assert_array_equal(future_values[i], bf(single))
+            np.testing.assert_array_equal(future_reward[i], bf(single) + 1)
+
 
 class TestMemory(lsst.utils.tests.MemoryTestCase):
     pass
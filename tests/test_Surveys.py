@@ -0,0 +1,71 @@
+import numpy as np
+import unittest
+import lsst.utils.tests
+import lsst.sims.featureScheduler.basis_functions as basis_functions
+from lsst.sims.featureScheduler.surveys import Deep_drilling_survey, Deep_drilling_group_survey
+from lsst.sims.featureScheduler.features import Conditions
+from lsst.sims.featureScheduler.utils import empty_observation
+
+
+class TestSurveys(unittest.TestCase):
+
+    def testDeep_drilling_group(self):
+        """
+        Test the group survey picks the same sequence as the individual surveys
+        """
+        fields = [(0., [[0., 2.], [22., 24.]], 100.),
+                  (90., [[0., 3.]], 110.),
+                  (180., [[21., 24.]], 105.)]
+        dd_surveys = []
+        for i, (RA, ha_limits, reward_value) in enumerate(fields):
+            bfs = [basis_functions.Hour_Angle_limit_basis_function(RA=RA, ha_limits=ha_limits)]
+            dd_surveys.append(Deep_drilling_survey(bfs, RA, -30., sequence='gri', nvis=[2, 3, 4],
+                                                   survey_name='DD:%i' % i, reward_value=reward_value))
+        group = Deep_drilling_group_survey(dd_surveys)
+
+        conditions = Conditions()
+        conditions.mounted_filters = ['g', 'r', 'i', 'y']
+        conditions.current_filter = 'r'
+        n_picked = 0
+        for lmst in np.arange(0., 24., 0.5):
+            conditions.mjd = 59853. + lmst/24.
+            conditions.lmst = lmst
+            rewards = np.array([survey.calc_reward_function(conditions) for survey in dd_surveys])
+            self.assertEqual(group.calc_reward_function(conditions), np.max(rewards))
+            observations = group.generate_observations(conditions)
+            if np.max(rewards) == -np.inf:
+                self.assertEqual(len(observations), 0)
+                continue
+            n_picked += 1
+            expected = dd_surveys[np.argmax(rewards)].generate_observations(conditions)
+            np.testing.assert_array_equal(observations['note'], expected['note'])
+            np.testing.assert_array_equal(observations['filter'], expected['filter'])
+            # The current filter goes first
+            self.assertEqual(observations['filter'][0], 'r')
+        assert(n_picked > 0)
+
+        # Without calling calc_reward_function first, the pick should not be stale
+        for lmst in np.arange(0., 24., 0.5):
+            conditions.mjd = 59853. + lmst/24.
+            conditions.lmst = lmst
+            observations = group.generate_observations(conditions)
+            rewards = np.array([survey.calc_reward_function(conditions) for survey in dd_surveys])
+            if np.max(rewards) == -np.inf:
+                self.assertEqual(observations.size, 0)
+                self.assertEqual(observations.dtype, empty_observation().dtype)
+            else:
+                expected = dd_surveys[np.argmax(rewards)].generate_observations(conditions)
+                np.testing.assert_array_equal(observations['note'], expected['note'])
+
+
+class TestMemory(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
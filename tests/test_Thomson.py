@@ -0,0 +1,87 @@
+import numpy as np
+import unittest
+import lsst.utils.tests
+from lsst.sims.featureScheduler.thomson import (elec_potential, elec_potential_grad, elec_potential_xyz,
+                                                elec_potential_xyz_grad, fib_sphere_grid, thetaphi2xyz,
+                                                even_points)
+from lsst.sims.featureScheduler.thomson.thomson import _unit_potential, elec_p_xyx_loop
+
+
+def numerical_grad(func, x0, step=1e-6):
+    """Central difference gradient of a scalar function
+    """
+    result = np.zeros(x0.size)
+    for i in range(x0.size):
+        dx = np.zeros(x0.size)
+        dx[i] = step
+        result[i] = (func(x0 + dx) - func(x0 - dx))/(2.*step)
+    return result
+
+
+class TestThomson(unittest.TestCase):
+
+    def testUnitPotential(self):
+        """
+        Test the chunked potential matches the pair by pair sum
+        """
+        npts = 50
+        np.random.seed(42)
+        x0 = np.random.randn(3*npts)
+        expected = elec_p_xyx_loop(x0)
+        x0 = x0.reshape(3, npts)
+        xyz = (x0/np.sqrt(np.sum(x0**2, axis=0))).T
+        for chunk_size in [None, 1, 7, npts]:
+            # Sums are done in a different order, so only close to the last few bits
+            np.testing.assert_allclose(_unit_potential(xyz, chunk_size=chunk_size), expected, rtol=1e-12)
+            U, grad = _unit_potential(xyz, grad=True, chunk_size=chunk_size)
+            np.testing.assert_allclose(U, expected, rtol=1e-12)
+        np.testing.assert_allclose(elec_potential_xyz(x0.ravel()), expected, rtol=1e-12)
+
+    def testGradients(self):
+        """
+        Test the analytic gradients match finite differences
+        """
+        npts = 20
+        theta, phi = fib_sphere_grid(npts)
+        # Move off the spiral so no gradient terms vanish by symmetry
+        np.random.seed(42)
+        theta += np.random.uniform(-0.1, 0.1, size=npts)
+        phi += np.random.uniform(-0.1, 0.1, size=npts)
+        x0 = np.concatenate((theta, phi))
+        U, grad = elec_potential_grad(x0, chunk_size=3)
+        np.testing.assert_allclose(U, elec_potential(x0), rtol=1e-12)
+        np.testing.assert_allclose(grad, numerical_grad(elec_potential, x0), rtol=1e-5, atol=1e-6)
+
+        # Points off the unit sphere, they get projected on to it
+        x0 = np.concatenate(thetaphi2xyz(theta, phi))*np.random.uniform(0.5, 2., size=npts*3)
+        U, grad = elec_potential_xyz_grad(x0, chunk_size=3)
+        np.testing.assert_allclose(U, elec_potential_xyz(x0), rtol=1e-12)
+        np.testing.assert_allclose(grad, numerical_grad(elec_potential_xyz, x0), rtol=1e-5, atol=1e-6)
+
+    def testEvenPoints(self):
+        """
+        Test the minimizer lowers the potential, with and without maxiter
+        """
+        npts = 12
+        theta, phi = fib_sphere_grid(npts)
+        start = elec_potential(np.concatenate((theta, phi)))
+        theta, phi = even_points(npts)
+        final = elec_potential(np.concatenate((theta, phi)))
+        assert(final < start)
+        # Known minimum for 12 points (icosahedron)
+        np.testing.assert_allclose(final, 49.165253058, rtol=1e-6)
+        theta, phi = even_points(npts, maxiter=2)
+        assert(elec_potential(np.concatenate((theta, phi))) >= final)
+
+
+class TestMemory(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -1,12 +1,28 @@
+import os
+import shutil
+import sqlite3
+import tempfile
 import numpy as np
 import unittest
-from lsst.sims.featureScheduler.utils import season_calc, create_season_offset
+from lsst.sims.featureScheduler.utils import (season_calc, season_map, create_season_offset,
+                                              int_rounded, int_round, int_between, nan_top_k,
+                                              empty_observation, observation_block, int_binned_stat,
+                                              smoothing_matrix, sparse_smooth, hp_disc_neighbors,
+                                              schema_converter, columnar_writer, load_columnar,
+                                              columnar2obs, columnar2opsim)
+from lsst.sims.utils import _hpid2RaDec, _angularSeparation
 import lsst.utils.tests
 import healpy as hp
 
 
 class TestFeatures(unittest.TestCase):
 
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
     def testSeason(self):
         """
         Test that the season utils work as intended
@@ -33,6 +49,206 @@ class TestFeatures(unittest.TestCase):
         mod3 = season_calc(night, modulo=3, offset=-365.25*10)
         assert(mod3 == -1)
 
+    def testSeasonMap(self):
+        """
+        Test the cached season map matches season_calc and is shared within a night
+        """
+        offset = create_season_offset(16, 0.)
+        for night in [0, 100, 100, 400, 1000]:
+            result = season_map(night, offset=offset, modulo=2, max_season=3)
+            np.testing.assert_array_equal(result, season_calc(night, offset=offset, modulo=2,
+                                                              max_season=3))
+            assert result is season_map(night, offset=offset, modulo=2, max_season=3)
+            assert not result.flags.writeable
+        # Only the most recently used combinations are kept
+        for modulo in range(season_map.max_entries + 10):
+            season_map(100, offset=offset, modulo=modulo+3)
+        assert len(season_map.cache) <= season_map.max_entries
+        result = season_map(100, offset=offset, modulo=5)
+        assert result is season_map(100, offset=offset, modulo=5)
+
+    def testIntRound(self):
+        """
+        Test the fixed-point helpers match int_rounded
+        """
+        values = np.random.uniform(-10, 10, size=1000)
+        values[0:10] = 0.1 + 0.2
+        # NaN should compare the same way too (less than everything)
+        values[10:15] = np.nan
+        threshold = 0.3
+        np.testing.assert_array_equal(int_round(values), int_rounded(values).value)
+        np.testing.assert_array_equal(int_round(values) > int_round(threshold),
+                                      int_rounded(values) > int_rounded(threshold))
+        np.testing.assert_array_equal(int_round(values) < int_round(threshold),
+                                      int_rounded(values) < int_rounded(threshold))
+        assert(np.all(int_round(values[10:15]) < int_round(-10.)))
+        low, high = int_round(-1.), int_round(threshold)
+        np.testing.assert_array_equal(int_between(values, low, high),
+                                      (int_rounded(values) > int_rounded(-1.)) &
+                                      (int_rounded(values) < int_rounded(threshold)))
+
+    def testNanTopK(self):
+        """
+        Test the top-k selection matches a full sort
+        """
+        values = np.random.uniform(size=500)
+        values[::7] = np.nan
+        good = np.where(~np.isnan(values))[0]
+        expected = good[np.argsort(values[good])[::-1]]
+        for k in [0, 1, 10, 1000]:
+            np.testing.assert_array_equal(nan_top_k(values, k), expected[0:k])
+
+    def testIntBinnedStat(self):
+        """
+        Test the reduceat fast paths match calling the statistic on each id
+        """
+        ids = np.random.randint(0, 50, size=1000)
+        values = np.random.uniform(size=1000)
+        values[::11] = np.nan
+        uids = np.unique(ids)
+        for statistic in [np.max, np.nanmax, np.min, np.nanmin, np.sum, np.mean, len, np.median]:
+            expected = np.array([statistic(values[np.where(ids == uid)]) for uid in uids])
+            result_ids, result = int_binned_stat(ids, values, statistic=statistic)
+            np.testing.assert_array_equal(result_ids, uids)
+            np.testing.assert_allclose(result, expected)
+
+    def testDiscNeighbors(self):
+        """
+        Test the disc neighbor table matches a brute force search, and is not built when too large
+        """
+        nside = 8
+        radius = np.radians(20.)
+        indptr, indices = hp_disc_neighbors(nside, radius)
+        ra, dec = _hpid2RaDec(nside, np.arange(hp.nside2npix(nside)))
+        for hpid in [0, 100, 767]:
+            dists = _angularSeparation(ra[hpid], dec[hpid], ra, dec)
+            expected = np.where(int_round(dists) <= int_round(radius))[0]
+            np.testing.assert_array_equal(indices[indptr[hpid]:indptr[hpid+1]], expected)
+        self.assertEqual(hp_disc_neighbors(64, np.radians(30.)), (None, None))
+
+    def testSmoothingMatrix(self):
+        """
+        Test the sparse smoothing is normalized and agrees with healpy smoothing
+        """
+        nside = 32
+        fwhm = np.radians(10.)
+        matrix = smoothing_matrix(nside, fwhm)
+        npix = hp.nside2npix(nside)
+        # Normalized rows leave a constant map unchanged
+        np.testing.assert_allclose(sparse_smooth(np.ones(npix), matrix), 1.)
+        x, y, z = hp.pix2vec(nside, np.arange(npix))
+        in_map = 1. + 0.5*z + 0.3*x*y
+        np.testing.assert_allclose(sparse_smooth(in_map, matrix), hp.smoothing(in_map, fwhm=fwhm),
+                                   atol=5e-3)
+
+    def testSchemaConverter(self):
+        """
+        Test observations survive a round trip through the opsim sqlite schema
+        """
+        n_obs = 250
+        observations = empty_observation(n=n_obs)
+        observations['ID'] = np.arange(n_obs)
+        observations['night'] = np.arange(n_obs) // 100
+        observations['mjd'] = 59853.5 + np.arange(n_obs)/1000.
+        observations['RA'] = np.random.uniform(0., 2.*np.pi, size=n_obs)
+        observations['dec'] = np.random.uniform(-np.pi/2., 0., size=n_obs)
+        observations['lmst'] = np.random.uniform(0., 24., size=n_obs)
+        observations['filter'] = 'r'
+        observations['note'] = 'blob, gr, a'
+        # NaN is written as NULL and should come back as NaN
+        observations['airmass'] = np.random.uniform(1., 2., size=n_obs)
+        observations['airmass'][::7] = np.nan
+
+        filename = os.path.join(self.tmpdir, 'test.db')
+        converter = schema_converter()
+        converter.obs2opsim(observations, filename=filename, delete_past=True)
+
+        result = converter.opsim2obs(filename)
+        self.assertEqual(result.dtype, observations.dtype)
+        for key in ['ID', 'night', 'filter', 'note']:
+            np.testing.assert_array_equal(result[key], observations[key])
+        for key in ['mjd', 'RA', 'dec', 'lmst', 'airmass']:
+            np.testing.assert_allclose(result[key], observations[key])
+
+        # Only the requested columns
+        result = converter.opsim2obs(filename, columns=['mjd', 'filter'])
+        self.assertEqual(result.dtype.names, ('mjd', 'filter'))
+        np.testing.assert_allclose(result['mjd'], observations['mjd'])
+
+        # Chunks with a constraint
+        chunks = list(converter.opsim2obs_chunks(filename, chunk_size=40, columns=['ID', 'RA'],
+                                                 where='night < 2'))
+        self.assertEqual([chunk.size for chunk in chunks], [40]*5)
+        result = np.concatenate(chunks)
+        np.testing.assert_array_equal(result['ID'], observations['ID'][0:200])
+        np.testing.assert_allclose(result['RA'], observations['RA'][0:200])
+
+        # NULLs in integer and string columns get filled in
+        con = sqlite3.connect(filename)
+        con.execute('UPDATE SummaryAllProps SET night = NULL, note = NULL WHERE observationId < 3')
+        con.commit()
+        con.close()
+        result = converter.opsim2obs(filename)
+        np.testing.assert_array_equal(result['night'][0:3], -1)
+        np.testing.assert_array_equal(result['note'][0:3], '')
+        np.testing.assert_array_equal(result['night'][3:], observations['night'][3:])
+        result = converter.opsim2obs(filename, columns=['night'], int_fill=-99)
+        np.testing.assert_array_equal(result['night'][0:3], -99)
+
+    def testColumnar(self):
+        """
+        Test the columnar writer round trip, and that the files can be read mid-run
+        """
+        n_obs = 25
+        observations = empty_observation(n=n_obs)
+        observations['ID'] = np.arange(n_obs)
+        observations['mjd'] = 59853.5 + np.arange(n_obs)/1000.
+        observations['RA'] = np.random.uniform(0., 2.*np.pi, size=n_obs)
+        observations['filter'] = 'g'
+        observations['note'] = 'blob, gr, a'
+
+        dirname = os.path.join(self.tmpdir, 'columns')
+        writer = columnar_writer(dirname, buffer_size=10)
+        self.assertEqual(load_columnar(dirname, columns=['mjd'])['mjd'].size, 0)
+        # Two full buffers get written, the last 5 observations are still in memory
+        writer.add_observations(observations)
+        np.testing.assert_array_equal(np.load(os.path.join(dirname, 'ID.npy')), np.arange(20))
+        result = columnar2obs(dirname, columns=['mjd', 'note'])
+        np.testing.assert_array_equal(result['mjd'], observations['mjd'][0:20])
+        np.testing.assert_array_equal(result['note'], observations['note'][0:20])
+        writer.close()
+
+        data = load_columnar(dirname, columns=['RA'])
+        self.assertIsInstance(data['RA'], np.memmap)
+        np.testing.assert_array_equal(data['RA'], observations['RA'])
+        result = columnar2obs(dirname)
+        self.assertEqual(result.dtype, observations.dtype)
+        np.testing.assert_array_equal(result, observations)
+        result = columnar2obs(dirname, columns=['ID', 'filter'], rows=observations['ID'] > 20)
+        np.testing.assert_array_equal(result['ID'], [21, 22, 23, 24])
+        np.testing.assert_array_equal(result['filter'], 'g')
+
+        filename = os.path.join(self.tmpdir, 'columns.db')
+        columnar2opsim(dirname, filename)
+        result = schema_converter().opsim2obs(filename)
+        for key in ['ID', 'filter', 'note']:
+            np.testing.assert_array_equal(result[key], observations[key])
+        for key in ['mjd', 'RA']:
+            np.testing.assert_allclose(result[key], observations[key])
+
+    def testObservationBlock(self):
+        """
+        Test lists of observations convert to a single block
+        """
+        obs_list = [empty_observation() for i in range(3)]
+        for i, obs in enumerate(obs_list):
+            obs['RA'] = i
+        block = observation_block(obs_list)
+        np.testing.assert_array_equal(block['RA'], [0, 1, 2])
+        self.assertEqual(observation_block(None).size, 0)
+        self.assertEqual(observation_block([]).dtype, empty_observation().dtype)
+        self.assertEqual(observation_block(empty_observation(n=4)).size, 4)
+
 
 class TestMemory(lsst.utils.tests.MemoryTestCase):
     pass